@@ -0,0 +1,111 @@
+import threading
+
+def estimate_tokens(text, chars_per_token=4):
+    return max(1, len(text) // chars_per_token) if text else 0
+
+def format_scan_summary(context_data):
+    """Compact one-block description of the current scan for the system prompt."""
+    lesion_types = context_data.get('lesion_types') or {}
+    lesion_info = ", ".join(f"{count} {name}" for name, count in lesion_types.items())
+
+    lines = [
+        "CURRENT SCAN:",
+        f"- Severity: {context_data.get('severity', 'Unknown')} Diabetic Retinopathy "
+        f"({context_data.get('confidence', 0):.1%} confidence)",
+        f"- Lesions: {context_data.get('lesion_count', 0)}" + (f" ({lesion_info})" if lesion_info else ""),
+        f"- Vessel Density: {context_data.get('vessel_density', 0):.2f}% "
+        f"({context_data.get('vessel_method', 'Unknown')})",
+    ]
+    morphometry = context_data.get('vessel_morphometry')
+    if morphometry:
+        lines.append(f"- Vessels: {morphometry['branch_points']} branch points, "
+                     f"tortuosity {morphometry['tortuosity_mean']:.3f}, "
+                     f"mean caliber {morphometry['caliber_mean_px']:.1f} px")
+    if context_data.get('optic_disc_diameter', 0) > 0:
+        lines.append(f"- Optic Disc Diameter: {context_data['optic_disc_diameter']} pixels")
+    return "\n".join(lines)
+
+class ConversationManager:
+    """Keeps chat turns for the current scan within a token budget.
+
+    The scan summary is sent once in the system block. When the history
+    outgrows the budget the oldest turns are dropped and replaced by a short
+    digest of the questions that were asked.
+    """
+
+    def __init__(self, system_prompt, token_budget=3000, reserve_tokens=200,
+                 chars_per_token=4, digest_chars=80):
+        self.system_prompt = system_prompt
+        self.token_budget = token_budget
+        self.reserve_tokens = reserve_tokens
+        self.chars_per_token = chars_per_token
+        self.digest_chars = digest_chars
+        self.lock = threading.Lock()
+
+        self.scan_summary = ""
+        self.turns = []
+        self.dropped_questions = []
+
+    def _tokens(self, text):
+        return estimate_tokens(text, self.chars_per_token)
+
+    def set_scan(self, context_data):
+        """Start a new conversation if the scan summary changed; returns the summary as the scan key."""
+        summary = format_scan_summary(context_data)
+        with self.lock:
+            if summary != self.scan_summary:
+                self.scan_summary = summary
+                self.turns = []
+                self.dropped_questions = []
+        return summary
+
+    def reset(self):
+        with self.lock:
+            self.scan_summary = ""
+            self.turns = []
+            self.dropped_questions = []
+
+    def _system_block(self):
+        parts = [self.system_prompt]
+        if self.scan_summary:
+            parts.append(self.scan_summary)
+        if self.dropped_questions:
+            parts.append("EARLIER IN THIS CONVERSATION the user asked about: " +
+                         "; ".join(self.dropped_questions))
+        return "\n\n".join(parts)
+
+    def build_messages(self, question):
+        """Return the message list for a new question, trimming old turns to fit the budget."""
+        with self.lock:
+            question_tokens = self._tokens(question)
+
+            while True:
+                system_block = self._system_block()
+                used = self._tokens(system_block) + question_tokens + self.reserve_tokens
+                used += sum(self._tokens(turn["content"]) for turn in self.turns)
+                if used <= self.token_budget or not self.turns:
+                    break
+                self._drop_oldest_turn()
+
+            messages = [{"role": "system", "content": system_block}]
+            messages.extend(dict(turn) for turn in self.turns)
+            messages.append({"role": "user", "content": question})
+            return messages
+
+    def _drop_oldest_turn(self):
+        turn = self.turns.pop(0)
+        if turn["role"] == "user":
+            digest = " ".join(turn["content"].split())
+            if len(digest) > self.digest_chars:
+                digest = digest[:self.digest_chars - 3].rstrip() + "..."
+            self.dropped_questions.append(digest)
+            self.dropped_questions = self.dropped_questions[-5:]
+
+    def add_turn(self, question, answer, scan=None):
+        """Record a turn; with scan (from set_scan) it is dropped if another scan has taken over."""
+        with self.lock:
+            if scan is not None and scan != self.scan_summary:
+                return
+            if question:
+                self.turns.append({"role": "user", "content": question})
+            self.turns.append({"role": "assistant", "content": answer})
@@ -1,49 +1,114 @@
 import requests
 import json
 import threading
-from config import OPENROUTER_API_KEY, OPENROUTER_API_URL, SYSTEM_PROMPT, GEMINI_AVAILABLE
+from config import (
+    OPENROUTER_API_KEY, OPENROUTER_API_URL, OPENROUTER_MODEL, SYSTEM_PROMPT, GEMINI_AVAILABLE,
+    API_TIMEOUT_SECONDS, RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES, CHAT_INSTRUCTIONS,
+    CHAT_CONTEXT_TOKEN_BUDGET, CHAT_RESPONSE_RESERVE_TOKENS
+)
+from api.response_cache import ResponseCache
+from api.conversation import ConversationManager
+
+def parse_sse_line(line):
+    """Parse one server-sent event line into a content delta.
+
+    Returns the text fragment, "" for lines without content (comments,
+    keep-alives, role-only deltas) and None once the stream is finished.
+    """
+    if not line or line.startswith(":"):
+        return ""
+    if not line.startswith("data:"):
+        return ""
+    payload = line[5:].strip()
+    if payload == "[DONE]":
+        return None
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        return ""
+    choices = event.get("choices") or []
+    if not choices:
+        return ""
+    delta = choices[0].get("delta") or {}
+    return delta.get("content") or ""
 
 class OpenRouterAPI:
-    def __init__(self):
-        self.api_key = OPENROUTER_API_KEY
-        self.api_url = OPENROUTER_API_URL
+    def __init__(self, api_key=None, api_url=None, cache_path=None):
+        self.api_key = api_key or OPENROUTER_API_KEY
+        self.api_url = api_url or OPENROUTER_API_URL
+        self.model = OPENROUTER_MODEL
         self.system_prompt = SYSTEM_PROMPT
         self.available = GEMINI_AVAILABLE
+        
+        self.conversation = ConversationManager(
+            f"{SYSTEM_PROMPT} {CHAT_INSTRUCTIONS}",
+            token_budget=CHAT_CONTEXT_TOKEN_BUDGET,
+            reserve_tokens=CHAT_RESPONSE_RESERVE_TOKENS
+        )
+        
+        self.cache = None
+        if RESPONSE_CACHE_ENABLED:
+            self.cache = ResponseCache(
+                cache_path or RESPONSE_CACHE_PATH,
+                ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+                max_entries=RESPONSE_CACHE_MAX_ENTRIES
+            )
     
     def is_available(self):
         """Check if API is available."""
         return self.available and self.api_key and self.api_key != "your-api-key-here"
     
-    def chat_completion(self, messages, temperature=0.7, max_tokens=1000):
+    def _build_request(self, messages, temperature, max_tokens):
+        if not any(msg.get("role") == "system" for msg in messages):
+            messages = [{"role": "system", "content": self.system_prompt}] + messages
+        
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+        
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        
+        return headers, data
+    
+    def _cache_key(self, data, use_cache):
+        if not use_cache or self.cache is None:
+            return None
+        return self.cache.make_key(data["messages"], data["model"], data["temperature"], data["max_tokens"])
+    
+    def chat_completion(self, messages, temperature=0.7, max_tokens=1000, use_cache=True):
         """Send request to OpenRouter API."""
         try:
             if not self.is_available():
                 return None
             
-            if not any(msg.get("role") == "system" for msg in messages):
-                messages = [{"role": "system", "content": self.system_prompt}] + messages
+            headers, data = self._build_request(messages, temperature, max_tokens)
             
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            }
-            
-            data = {
-                "model": "arcee-ai/trinity-mini:free",
-                "messages": messages,
-                "temperature": temperature,
-                "max_tokens": max_tokens,
-            }
+            cache_key = self._cache_key(data, use_cache)
+            if cache_key:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return cached
             
             response = requests.post(
                 url=self.api_url,
                 headers=headers,
-                data=json.dumps(data)
+                data=json.dumps(data),
+                timeout=API_TIMEOUT_SECONDS
             )
             
             if response.status_code == 200:
                 result = response.json()
-                return result["choices"][0]["message"]["content"]
+                content = result["choices"][0]["message"]["content"]
+                if cache_key:
+                    self.cache.put(cache_key, content)
+                return content
             else:
                 print(f"API Error: {response.status_code}")
                 return None
@@ -52,8 +117,83 @@ class OpenRouterAPI:
             print(f"API Exception: {e}")
             return None
     
-    def analyze_retina_scan(self, analysis_data):
+    def stream_chat_completion(self, messages, on_delta, temperature=0.7, max_tokens=1000, use_cache=True,
+                               cancelled=None):
+        """Stream a completion over SSE, passing each text fragment to on_delta.
+        
+        Returns the full response text, or None if the request failed before
+        any content arrived. Cached responses are delivered as a single fragment.
+        When cancelled() turns true the stream is closed early and the partial
+        text is neither cached nor passed on.
+        """
+        parts = []
+        try:
+            if not self.is_available():
+                return None
+            
+            headers, data = self._build_request(messages, temperature, max_tokens)
+            
+            cache_key = self._cache_key(data, use_cache)
+            if cache_key:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    on_delta(cached)
+                    return cached
+            
+            data["stream"] = True
+            
+            response = requests.post(
+                url=self.api_url,
+                headers=headers,
+                data=json.dumps(data),
+                stream=True,
+                timeout=API_TIMEOUT_SECONDS
+            )
+            
+            if response.status_code != 200:
+                print(f"API Error: {response.status_code}")
+                response.close()
+                return None
+            
+            # SSE is always UTF-8; without a charset requests would fall back to ISO-8859-1.
+            response.encoding = "utf-8"
+            completed = False
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if cancelled is not None and cancelled():
+                        return None
+                    delta = parse_sse_line(line)
+                    if delta is None:
+                        completed = True
+                        break
+                    if delta:
+                        parts.append(delta)
+                        on_delta(delta)
+            finally:
+                response.close()
+            
+            content = "".join(parts) if parts else None
+            if cache_key and completed and content:
+                self.cache.put(cache_key, content)
+            return content
+        
+        except Exception as e:
+            print(f"API Exception: {e}")
+            return "".join(parts) if parts else None
+    
+    def _complete(self, messages, on_delta=None, temperature=0.7, max_tokens=1000, use_cache=True, cancelled=None):
+        if on_delta is not None:
+            return self.stream_chat_completion(messages, on_delta, temperature, max_tokens, use_cache, cancelled)
+        return self.chat_completion(messages, temperature, max_tokens, use_cache)
+    
+    def analyze_retina_scan(self, analysis_data, on_delta=None, use_cache=True, cancelled=None):
+        """Clinical assessment of a scan; it opens the conversation unless cancelled() turned true meanwhile."""
         disc_info = f"\n- Optic Disc Diameter: {analysis_data.get('optic_disc_diameter', 0)} pixels" if analysis_data.get('optic_disc_diameter', 0) > 0 else ""
+        morphometry = analysis_data.get('vessel_morphometry')
+        if morphometry:
+            disc_info += (f"\n- Vessel Branch Points: {morphometry['branch_points']}"
+                          f"\n- Vessel Tortuosity (arc/chord): {morphometry['tortuosity_mean']:.3f}"
+                          f"\n- Mean Vessel Caliber: {morphometry['caliber_mean_px']:.1f} pixels")
         
         prompt = f"""Analyze this retinal scan diagnosis:
 
@@ -73,48 +213,60 @@ Please provide a brief clinical assessment (2-3 paragraphs) covering:
 Keep your response professional, concise, and clinically accurate."""
         
         messages = [{"role": "user", "content": prompt}]
-        return self.chat_completion(messages)
+        result = self._complete(messages, on_delta, use_cache=use_cache, cancelled=cancelled)
+        # A stale assessment must not reset the conversation of the scan now on screen.
+        if result and not (cancelled is not None and cancelled()):
+            self.conversation.set_scan(analysis_data)
+            self.conversation.add_turn(None, result)
+        return result
     
-    def answer_question(self, question, context_data):
-        lesion_info = ""
-        if context_data.get('lesion_types'):
-            lesion_info = ", ".join([f"{count} {name}" for name, count in context_data['lesion_types'].items()])
+    def answer_question(self, question, context_data, on_delta=None, use_cache=True, cancelled=None):
+        """Answer a follow-up question using the conversation so far."""
+        scan = self.conversation.set_scan(context_data)
+        messages = self.conversation.build_messages(question)
         
-        disc_info = f"\n- Optic Disc Diameter: {context_data.get('optic_disc_diameter', 0)} pixels" if context_data.get('optic_disc_diameter', 0) > 0 else ""
+        result = self._complete(messages, on_delta, temperature=0.7, max_tokens=1500, use_cache=use_cache,
+                                cancelled=cancelled)
+        if result and not (cancelled is not None and cancelled()):
+            self.conversation.add_turn(question, result, scan=scan)
+        return result
+    
+    def run_task(self, task, on_delta=None, use_cache=True, cancelled=None, **kwargs):
+        """Run an "analyze" or "question" task synchronously; returns (error, result).
         
-        context = f"""Answer the following question about this retinal scan:
-
-CURRENT SCAN ANALYSIS:
-- Severity: {context_data.get('severity', 'Unknown')} Diabetic Retinopathy
-- Confidence: {context_data.get('confidence', 0):.1%}
-- Total Lesions: {context_data.get('lesion_count', 0)}
-- Lesion Types: {lesion_info if lesion_info else 'None detected'}
-- Vessel Density: {context_data.get('vessel_density', 0):.2f}%
-- Vessel Method: {context_data.get('vessel_method', 'Unknown')}{disc_info}
-
-USER QUESTION: {question}
-
-Please provide a clear, professional, and clinically accurate response."""
+        When on_delta is given the response is streamed and each fragment is
+        passed to it before the full text is returned.
+        Pass use_cache=False to bypass the response cache for this call, and
+        cancelled, a no-argument callable, to stop a task that is no longer
+        wanted from streaming further or touching the conversation.
+        """
+        if not self.is_available():
+            return "AI Not Available", "OpenRouter API is not configured or failed to initialize."
+        
+        result = None
+        if task == "analyze":
+            result = self.analyze_retina_scan(kwargs.get('analysis_data', {}), on_delta=on_delta,
+                                              use_cache=use_cache, cancelled=cancelled)
+        elif task == "question":
+            result = self.answer_question(kwargs.get('question', ''), kwargs.get('context_data', {}),
+                                          on_delta=on_delta, use_cache=use_cache, cancelled=cancelled)
         
-        messages = [{"role": "user", "content": context}]
-        return self.chat_completion(messages, temperature=0.7, max_tokens=1500)
+        if result:
+            return None, result
+        return "API Error", "Failed to get response from AI service."
     
-    def process_in_thread(self, callback, *args, **kwargs):
+    def process_in_thread(self, task, callback, on_delta=None, use_cache=True, **kwargs):
+        """Run a task in a daemon thread and call callback(error, result) from that thread.
+        
+        UI code should submit run_task through ui.dispatcher.UIDispatcher instead,
+        which delivers results on the Tk main loop.
+        """
         if not self.is_available():
             callback("AI Not Available", "OpenRouter API is not configured or failed to initialize.")
             return
         
         def run():
-            result = None
-            if len(args) > 0 and args[0] == "analyze":
-                result = self.analyze_retina_scan(kwargs.get('analysis_data', {}))
-            elif len(args) > 0 and args[0] == "question":
-                result = self.answer_question(kwargs.get('question', ''), kwargs.get('context_data', {}))
-            
-            if result:
-                callback(None, result)
-            else:
-                callback("API Error", "Failed to get response from AI service.")
+            callback(*self.run_task(task, on_delta=on_delta, use_cache=use_cache, **kwargs))
         
         thread = threading.Thread(target=run, daemon=True)
         thread.start()
\ No newline at end of file
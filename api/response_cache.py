@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+class ResponseCache:
+    """SQLite-backed cache of LLM responses with TTL and LRU eviction."""
+
+    def __init__(self, path, ttl_seconds=7 * 24 * 3600, max_entries=500):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = None
+
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses(accessed)")
+            self.conn.commit()
+        except Exception as e:
+            print(f"Response cache disabled: {e}")
+            self.conn = None
+
+    @staticmethod
+    def normalize_text(text):
+        return re.sub(r"\s+", " ", text).strip()
+
+    def make_key(self, messages, model, temperature, max_tokens):
+        normalized = [
+            [msg.get("role", ""), self.normalize_text(str(msg.get("content", "")))]
+            for msg in messages
+        ]
+        payload = json.dumps([model, round(float(temperature), 3), max_tokens, normalized])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        if self.conn is None:
+            return None
+
+        now = time.time()
+        with self.lock:
+            try:
+                row = self.conn.execute(
+                    "SELECT response, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+
+                response, created = row
+                if self.ttl_seconds and now - created > self.ttl_seconds:
+                    self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self.conn.commit()
+                    return None
+
+                self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                self.conn.commit()
+                return response
+            except sqlite3.Error as e:
+                print(f"Response cache read error: {e}")
+                return None
+
+    def put(self, key, response):
+        if self.conn is None or not response:
+            return
+
+        now = time.time()
+        with self.lock:
+            try:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created, accessed) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, response, now, now)
+                )
+                self._evict(now)
+                self.conn.commit()
+            except sqlite3.Error as e:
+                print(f"Response cache write error: {e}")
+
+    def _evict(self, now):
+        if self.ttl_seconds:
+            self.conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+
+        if self.max_entries:
+            self.conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        if self.conn is None:
+            return
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
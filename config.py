@@ -4,6 +4,37 @@ OPENROUTER_API_KEY = "ur api key here"
 OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
 GEMINI_AVAILABLE = True
 SYSTEM_PROMPT = "You are RetinaExpert, an ophthalmology AI assistant specializing in diabetic retinopathy and retinal analysis."
+OPENROUTER_MODEL = "arcee-ai/trinity-mini:free"
+API_TIMEOUT_SECONDS = 60
+
+CHAT_INSTRUCTIONS = "Answer questions about the current scan clearly, professionally and with clinical accuracy."
+CHAT_CONTEXT_TOKEN_BUDGET = 3000
+CHAT_RESPONSE_RESERVE_TOKENS = 200
+
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_PATH = os.path.join("cache", "llm_responses.sqlite3")
+RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 3600
+RESPONSE_CACHE_MAX_ENTRIES = 500
+
+# Worklist: scans analyzed ahead of the current one, and memory kept for analyzed scans.
+WORKLIST_PREFETCH = 2
+SESSION_CACHE_BUDGET_MB = 1024
+
+# Every analysis is recorded in a local SQLite database for later querying.
+RESULTS_DB_ENABLED = True
+RESULTS_DB_PATH = os.path.join("results", "analyses.sqlite3")
+
+# Visit comparison: registration features are cached per image hash, in memory and on disk.
+REGISTRATION_MAX_FEATURES = 1500
+REGISTRATION_MIN_INLIERS = 12
+REGISTRATION_CACHE_DIR = os.path.join("cache", "registration")
+REGISTRATION_CACHE_SIZE = 32
+LESION_MATCH_TOLERANCE_DD = 0.25
+
+# Startup performance: models run a dummy inference in the background once loaded, and thread
+# counts and the severity batch size come from the profile written by `python -m dataset.autotune`.
+MODEL_WARMUP_ENABLED = True
+PERFORMANCE_PROFILE_PATH = "performance_profile.json"
 
 MODELS_DIR = "models"
 SEVERITY_MODEL_PATH = os.path.join(MODELS_DIR, "severity.pt")
@@ -11,6 +42,27 @@ LESION_MODEL_PATH = os.path.join(MODELS_DIR, "lesions.pt")
 MACULA_MODEL_PATH = os.path.join(MODELS_DIR, "macula.pt")
 VESSEL_MODEL_PATH = os.path.join(MODELS_DIR, "vessel_unet.pth")
 
+FUNDUS_CROP_ENABLED = True
+FUNDUS_PROBE_SIZE = 256
+FUNDUS_THRESHOLD = 15
+FUNDUS_MARGIN = 0.01
+
+# Longest side, in pixels, each stage works at; inputs are downscaled once and never upscaled.
+WORKING_RESOLUTIONS = {
+    'severity': 1024,
+    'lesion': 1600,
+    'macula': 1024,
+    'vessel': 1024,
+    'display': 2048,
+    'registration': 768,
+}
+
+# Borderline severity calls (top-two probability margin below the threshold) are re-scored
+# with flipped and rotated views in one batched forward pass.
+SEVERITY_TTA_ENABLED = True
+SEVERITY_TTA_MARGIN = 0.15
+SEVERITY_TTA_ROTATIONS = (-10, 10)
+
 SEVERITY_CLASSES = ["No_DR", "Mild", "Moderate", "Severe", "Proliferative"]
 SEVERITY_COLORS = {
     "No_DR": (0, 255, 0),
@@ -44,4 +96,10 @@ DEFAULT_VESSEL_SETTINGS = {
     'denoise_strength': 5,
     'invert_image': False,
     'equalize_hist': True,
-}
\ No newline at end of file
+    'traditional_engine': 'classic',
+    'fast_mode': False,
+}
+
+VESSEL_HESSIAN_SIGMAS = (1.0, 2.0, 3.0, 4.0)
+VESSEL_FAST_RESOLUTION = 512
+VESSEL_PROXY_RESOLUTION = 384
\ No newline at end of file
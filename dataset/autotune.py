@@ -0,0 +1,212 @@
+"""Tune per-stage thread counts and the severity batch size, and save them as this machine's profile.
+
+Run from the repository root so the app modules resolve:
+
+    python -m dataset.autotune --images path/to/scans
+    python -m dataset.autotune --threads 1 2 4 8 --batch-sizes 1 2 4 8 --out performance_profile.json
+
+The app, ModelLoader, VesselProcessor and the batch runners read the
+profile at startup. Without --images, random images stand in for scans;
+model timings barely depend on content, so this is only slightly less
+representative.
+"""
+import os
+import time
+import platform
+import argparse
+from datetime import datetime, timezone
+import cv2
+import numpy as np
+import torch
+
+from config import WORKING_RESOLUTIONS, PERFORMANCE_PROFILE_PATH
+from models.model_loader import ModelLoader
+from processing.fundus_roi import detect_fundus_roi
+from processing.vessel_processor import VesselProcessor
+from processing.working_image import WorkingImageCache
+from utils.performance_profile import load_profile, save_profile
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".webp")
+YOLO_STAGES = ('severity', 'lesion', 'macula')
+# A smaller setting wins when it is within this fraction of the fastest, leaving cores free
+# for stages that run alongside it (decoding, UI work, vessel previews).
+TOLERANCE = 0.05
+
+def load_samples(images_dir, count):
+    if images_dir:
+        names = sorted(n for n in os.listdir(images_dir) if n.lower().endswith(IMAGE_EXTENSIONS))
+        samples = [img for img in (cv2.imread(os.path.join(images_dir, n)) for n in names[:count])
+                   if img is not None]
+        if samples:
+            return samples
+        print(f"No readable scans in {images_dir}; using random images")
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (2048, 2048, 3), dtype=np.uint8) for _ in range(count)]
+
+def median_ms(fn, repeats):
+    fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(timings))
+
+def candidate_threads(requested):
+    cores = os.cpu_count() or 1
+    if requested:
+        return sorted({t for t in requested if 1 <= t <= cores})
+    counts, t = [], 1
+    while t < cores:
+        counts.append(t)
+        t *= 2
+    return counts + [cores]
+
+def pick(timings):
+    """Smallest setting within TOLERANCE of the fastest; timings maps setting -> ms."""
+    best = min(timings.values())
+    return min(k for k, ms in timings.items() if ms <= best * (1 + TOLERANCE))
+
+def build_stages(model_loader, vessel_processor, samples):
+    """Per-stage callables that process every sample once."""
+    workings = [WorkingImageCache(img, detect_fundus_roi(img)) for img in samples]
+    stages = {}
+    for stage in YOLO_STAGES:
+        model = getattr(model_loader, f"{stage}_model")
+        if model is not None:
+            inputs = [w.get(WORKING_RESOLUTIONS[stage])[0] for w in workings]
+            stages[stage] = lambda m=model, xs=inputs: [m(x, verbose=False) for x in xs]
+    if vessel_processor.vessel_model is not None:
+        stages['vessel'] = lambda: [vessel_processor.segment_with_unet(img, working=w)
+                                    for img, w in zip(samples, workings)]
+    return stages, workings
+
+def tune_torch_threads(stages, threads, repeats):
+    """Best torch thread count per stage, and the best single count for everything else.
+
+    Returns (default, per_stage, timings) where timings maps stage -> threads -> ms.
+    The default minimises the summed stage time and is used outside the model stages.
+    """
+    timings = {stage: {} for stage in stages}
+    for t in threads:
+        torch.set_num_threads(t)
+        for stage, fn in stages.items():
+            timings[stage][t] = median_ms(fn, repeats)
+        print(f"  torch threads {t:>3}: " + ", ".join(f"{stage} {timings[stage][t]:.1f} ms" for stage in stages))
+    per_stage = {stage: pick(stage_timings) for stage, stage_timings in timings.items()}
+    totals = {t: sum(timings[stage][t] for stage in stages) for t in threads}
+    return pick(totals), per_stage, timings
+
+def tune_opencv_threads(samples, workings, threads, repeats):
+    """OpenCV-heavy work: field-of-view detection, UNet enhancement and traditional segmentation."""
+    vessel_processor = VesselProcessor()
+    vessel_processor.settings['use_unet'] = False
+
+    def opencv_stages():
+        for img, working in zip(samples, workings):
+            detect_fundus_roi(img)
+            vessel_processor.segment_traditional(img, working=working)
+            vessel_processor.enhance_for_unet(working.get(WORKING_RESOLUTIONS['vessel'])[0])
+
+    timings = {}
+    for t in threads:
+        cv2.setNumThreads(t)
+        timings[t] = median_ms(opencv_stages, repeats)
+        print(f"  opencv threads {t:>3}: {timings[t]:.1f} ms per sample set")
+    return pick(timings), timings
+
+def tune_batch_sizes(model_loader, workings, sizes, repeats):
+    """Per-image latency of severity TTA batches; larger batches stop at the first failure (e.g. OOM).
+
+    Only severity runs batched (its TTA views); lesion, macula and vessel
+    models see one image per scan, so their batch sizes are not tuned.
+    """
+    best, measured = {}, {}
+    model = model_loader.severity_model
+    if model is None:
+        return best, measured
+    inputs = [w.get(WORKING_RESOLUTIONS['severity'])[0] for w in workings]
+    per_image = {}
+    for size in sizes:
+        batch = [inputs[i % len(inputs)] for i in range(size)]
+        try:
+            per_image[size] = median_ms(lambda: model(batch, verbose=False), repeats) / size
+        except Exception as e:
+            print(f"  severity batch {size} failed: {e}")
+            break
+        print(f"  severity batch {size:>3}: {per_image[size]:.1f} ms per image")
+    if per_image:
+        best['severity'] = pick(per_image)
+        measured['severity'] = per_image
+    return best, measured
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune thread counts and batch sizes for this machine.")
+    parser.add_argument("--images", help="folder of sample scans (default: random images)")
+    parser.add_argument("--samples", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, nargs="+",
+                        help="thread counts to try (default: powers of two up to the core count)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--out", default=PERFORMANCE_PROFILE_PATH)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    threads = candidate_threads(args.threads)
+    samples = load_samples(args.images, args.samples)
+
+    # The sweeps set the thread count themselves; a previous profile must not override it per stage.
+    load_profile()['stage_threads'].clear()
+    model_loader = ModelLoader()
+    model_loader.wait_until_warm()
+    vessel_processor = VesselProcessor(model_loader.get_vessel_model())
+    stages, workings = build_stages(model_loader, vessel_processor, samples)
+
+    print(f"Tuning on {len(samples)} samples, {cores} cores, stages: {', '.join(stages) or 'none'}")
+    print("Torch intra-op threads:")
+    torch_threads, stage_threads, torch_timings = (tune_torch_threads(stages, threads, args.repeats)
+                                                   if stages else (None, {}, {}))
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+
+    print("OpenCV threads:")
+    opencv_threads, opencv_timings = tune_opencv_threads(samples, workings, threads, args.repeats)
+    cv2.setNumThreads(opencv_threads)
+
+    print("Severity TTA batch sizes:")
+    if stage_threads.get('severity'):
+        torch.set_num_threads(stage_threads['severity'])
+    batch_sizes, batch_timings = tune_batch_sizes(model_loader, workings, sorted(set(args.batch_sizes)), args.repeats)
+
+    # torch fixes the inter-op pool size at its first parallel region, so it cannot be swept in
+    # one process. Neither it nor the decode pool is benchmarked: both are derived from the
+    # cores the largest intra-op pool leaves free.
+    spare = max(1, cores - max([torch_threads or cores] + list(stage_threads.values())))
+    profile = {
+        'torch_threads': torch_threads,
+        'stage_threads': stage_threads,
+        'torch_interop_threads': min(4, spare),
+        'opencv_threads': opencv_threads,
+        'decode_workers': min(4, spare),
+        'batch_sizes': batch_sizes,
+        'machine': {
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'platform': platform.platform(),
+            'cpu_count': cores,
+            'torch': torch.__version__,
+            'opencv': cv2.__version__,
+            'cuda': torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+        },
+        'measurements': {
+            'torch_threads_ms': torch_timings,
+            'opencv_threads_ms': opencv_timings,
+            'batch_ms_per_image': batch_timings,
+        },
+    }
+    save_profile(profile, args.out)
+    print(f"torch threads {torch_threads} (per stage {stage_threads}), opencv threads {opencv_threads}, "
+          f"batch sizes {batch_sizes}")
+    print(f"Wrote {args.out}")
+
+if __name__ == "__main__":
+    main()
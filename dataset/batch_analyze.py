@@ -0,0 +1,107 @@
+"""Analyze a folder of scans without the UI and stream one structured record per scan.
+
+Run from the repository root so the app modules resolve:
+
+    python -m dataset.batch_analyze --images path/to/scans --out results.csv
+    python -m dataset.batch_analyze --images path/to/scans --out results.parquet --no-vessels
+    python -m dataset.batch_analyze --images path/to/scans --out results.csv --db results/analyses.sqlite3
+
+Records are written as each scan finishes, so memory stays flat however
+many scans the folder holds.
+"""
+import os
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+from models.model_loader import ModelLoader
+from processing.image_processor import ImageProcessor
+from processing.vessel_processor import VesselProcessor
+from processing.result_export import RECORD_WRITERS, build_analysis_record, open_record_writer, record_columns
+from processing.results_db import ResultsDatabase, image_hash
+from utils.performance_profile import load_profile
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".webp")
+
+def iter_scan_paths(images_dir):
+    """Scan paths in name order (only the names are held, never the images)."""
+    names = sorted(entry.name for entry in os.scandir(images_dir)
+                   if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS))
+    for name in names:
+        yield os.path.join(images_dir, name)
+
+def iter_decoded(paths, workers, read_ahead):
+    """Yield (path, img) while up to read_ahead images are decoded in the background."""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for path in paths:
+            pending.append((path, executor.submit(cv2.imread, path)))
+            if len(pending) >= read_ahead:
+                first_path, future = pending.popleft()
+                yield first_path, future.result()
+        while pending:
+            first_path, future = pending.popleft()
+            yield first_path, future.result()
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-analyze retina scans into CSV, JSON-lines or Parquet.")
+    parser.add_argument("--images", required=True, help="folder of scans")
+    parser.add_argument("--out", default="results.csv")
+    parser.add_argument("--format", choices=list(RECORD_WRITERS), help="defaults to the --out extension")
+    parser.add_argument("--workers", type=int, default=load_profile()['decode_workers'],
+                        help="decode threads (default from the performance profile)")
+    parser.add_argument("--read-ahead", type=int, default=4)
+    parser.add_argument("--no-vessels", action="store_true", help="skip vessel segmentation")
+    parser.add_argument("--db", help="also record every analysis in this results database")
+    args = parser.parse_args()
+
+    model_loader = ModelLoader()
+    image_processor = ImageProcessor(model_loader)
+    vessel_processor = VesselProcessor(model_loader.get_vessel_model())
+    vessel_processor.reset_settings(model_loader.is_vessel_model_available())
+
+    lesion_model = model_loader.get_lesion_model()
+    lesion_classes = [lesion_model.names[k] for k in sorted(lesion_model.names)] if lesion_model else []
+
+    results_db = ResultsDatabase(args.db) if args.db else None
+    model_versions = model_loader.model_versions()
+    settings = {} if args.no_vessels else vessel_processor.settings
+    
+    failed = 0
+    start = time.perf_counter()
+    with open_record_writer(args.out, record_columns(lesion_classes), args.format) as writer:
+        for path, img in iter_decoded(iter_scan_paths(args.images), args.workers, args.read_ahead):
+            if img is None:
+                print(f"Unreadable image skipped: {path}")
+                failed += 1
+                continue
+
+            image_processor.set_image(img)
+            image_processor.analyze_image()
+            image_processor.update_state('vessel_density', 0.0)
+            image_processor.update_state('vessel_morphometry', None)
+            if not args.no_vessels:
+                vessel_start = time.perf_counter()
+                _, vessel_density, morphometry = vessel_processor.segment_vessels(
+                    img, working=image_processor.get_working_images()
+                )
+                image_processor.current_state['timings']['vessel'] = round(
+                    (time.perf_counter() - vessel_start) * 1000.0, 1)
+                image_processor.update_state('vessel_density', vessel_density)
+                image_processor.update_state('vessel_morphometry', morphometry)
+
+            record = build_analysis_record(image_processor, os.path.basename(path), lesion_classes)
+            writer.write(record)
+            if results_db is not None:
+                results_db.add(record, image_hash(img), model_versions, settings)
+            if writer.count % 100 == 0:
+                print(f"{writer.count} scans, {writer.count / (time.perf_counter() - start):.2f} scans/sec")
+
+    if results_db is not None:
+        results_db.close()
+    print(f"Wrote {writer.count} records to {args.out} ({failed} unreadable)")
+
+if __name__ == "__main__":
+    main()
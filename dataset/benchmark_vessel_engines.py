@@ -0,0 +1,83 @@
+"""Benchmark the traditional vessel segmentation engines on a folder of fundus images.
+
+Run from the repository root so the app modules resolve:
+
+    python -m dataset.benchmark_vessel_engines --images path/to/images --out vessel_bench.json
+"""
+import os
+import json
+import time
+import argparse
+import cv2
+import numpy as np
+
+from processing.fundus_roi import detect_fundus_roi
+from processing.vessel_processor import VesselProcessor
+from processing.working_image import WorkingImageCache
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+ENGINES = {
+    "classic": {"traditional_engine": "classic", "fast_mode": False},
+    "hessian": {"traditional_engine": "hessian", "fast_mode": False},
+    "hessian_fast": {"traditional_engine": "hessian", "fast_mode": True},
+}
+
+def run_engine(processor, img, roi, repeats):
+    """Return (best_ms, density); every repeat starts from a cold working-image cache."""
+    timings = []
+    density = 0.0
+    for _ in range(repeats):
+        working = WorkingImageCache(img, roi)
+        start = time.perf_counter()
+        _, density, _ = processor.segment_traditional(img, roi, working)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return min(timings), density
+
+def summarize(timings, densities):
+    timings = np.asarray(timings, dtype=float)
+    return {
+        "images": int(len(timings)),
+        "ms_mean": round(float(timings.mean()), 2) if len(timings) else 0.0,
+        "ms_p50": round(float(np.percentile(timings, 50)), 2) if len(timings) else 0.0,
+        "ms_p95": round(float(np.percentile(timings, 95)), 2) if len(timings) else 0.0,
+        "density_mean": round(float(np.mean(densities)), 2) if densities else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare classic and Hessian vessel segmentation speed.")
+    parser.add_argument("--images", required=True, help="folder of fundus images")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--out", default="vessel_bench.json")
+    args = parser.parse_args()
+
+    names = sorted(f for f in os.listdir(args.images) if f.lower().endswith(IMAGE_EXTENSIONS))[:args.limit]
+    processor = VesselProcessor()
+    timings = {engine: [] for engine in args.engines}
+    densities = {engine: [] for engine in args.engines}
+
+    for name in names:
+        img = cv2.imread(os.path.join(args.images, name))
+        if img is None:
+            print(f"Unreadable image skipped: {name}")
+            continue
+        roi = detect_fundus_roi(img)
+
+        for engine in args.engines:
+            processor.settings.update(ENGINES[engine])
+            ms, density = run_engine(processor, img, roi, args.repeats)
+            timings[engine].append(ms)
+            densities[engine].append(density)
+
+    report = {engine: summarize(timings[engine], densities[engine]) for engine in args.engines}
+    for engine, stats in report.items():
+        print(f"{engine:>14}: {stats['ms_p50']:8.1f} ms p50  {stats['ms_p95']:8.1f} ms p95  "
+              f"density {stats['density_mean']:.2f}%")
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
+
+if __name__ == "__main__":
+    main()
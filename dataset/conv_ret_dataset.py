@@ -1,10 +1,15 @@
 import os
+import json
 import shutil
-from PIL import Image
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 
 DATASET_PATH = r"path\to\original\dataset"
+SPLITS = ["train", "valid"]
 IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
 PADDING_RATIO = 0.05
+MANIFEST_NAME = "manifest.json"
+LINK_MODES = ("hardlink", "symlink", "copy")
 
 CLASS_MAP = {
     "Mild": 0,
@@ -14,14 +19,105 @@ CLASS_MAP = {
     "Severe": 4
 }
 
-def process_split(split_name):
-    split_path = os.path.join(DATASET_PATH, split_name)
-    images_out = os.path.join(split_path, "images")
-    labels_out = os.path.join(split_path, "labels")
+def label_line(class_id):
+    x_center = 0.5
+    y_center = 0.5
+    box_width = 1.0 - (2 * PADDING_RATIO)
+    box_height = 1.0 - (2 * PADDING_RATIO)
+    return f"{class_id} {x_center} {y_center} {box_width} {box_height}\n"
 
-    os.makedirs(images_out, exist_ok=True)
-    os.makedirs(labels_out, exist_ok=True)
+def load_manifest(split_path):
+    manifest_path = os.path.join(split_path, MANIFEST_NAME)
+    if not os.path.isfile(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r") as f:
+            entries = json.load(f).get("pairs", [])
+        return {entry["image"]: entry for entry in entries}
+    except (ValueError, KeyError, OSError):
+        return {}
+
+def save_manifest(split_path, entries, link_mode):
+    manifest_path = os.path.join(split_path, MANIFEST_NAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({
+            "link_mode": link_mode,
+            "class_map": CLASS_MAP,
+            "pairs": sorted(entries, key=lambda e: e["image"])
+        }, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+def place_file(src, dst, link_mode):
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+    if link_mode == "hardlink":
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:
+            pass
+    elif link_mode == "symlink":
+        try:
+            os.symlink(os.path.abspath(src), dst)
+            return "symlink"
+        except OSError:
+            pass
+
+    shutil.copy2(src, dst)
+    return "copy"
+
+def is_up_to_date(src_stat, dst, previous, link_mode):
+    """Whether dst was placed from this version of the source with the requested link mode.
+
+    Entries record the requested mode as well as how the file was actually
+    placed, so a hardlink that fell back to a copy is not redone every run.
+    """
+    if previous is None or not os.path.lexists(dst):
+        return False
+    return (previous.get("size") == src_stat.st_size and
+            previous.get("mtime") == src_stat.st_mtime and
+            previous.get("link_mode", previous.get("placed_by")) == link_mode)
+
+def convert_file(task, images_out, labels_out, link_mode, previous):
+    src_img_path, file, class_id = task
+    src_stat = os.stat(src_img_path)
+
+    dst_img_path = os.path.join(images_out, file)
+    label_file = os.path.splitext(file)[0] + ".txt"
+    label_path = os.path.join(labels_out, label_file)
 
+    entry = {
+        "image": file,
+        "label": label_file,
+        "class_id": class_id,
+        "source": src_img_path,
+        "size": src_stat.st_size,
+        "mtime": src_stat.st_mtime,
+        "link_mode": link_mode,
+    }
+
+    if (is_up_to_date(src_stat, dst_img_path, previous, link_mode) and
+            previous.get("class_id") == class_id and os.path.isfile(label_path)):
+        entry["placed_by"] = previous["placed_by"]
+        return entry, False
+
+    entry["placed_by"] = place_file(src_img_path, dst_img_path, link_mode)
+
+    line = label_line(class_id)
+    existing = None
+    if os.path.isfile(label_path):
+        with open(label_path, "r") as f:
+            existing = f.read()
+    if existing != line:
+        with open(label_path, "w") as f:
+            f.write(line)
+
+    return entry, True
+
+def collect_tasks(split_path):
+    tasks = []
     for class_name in sorted(os.listdir(split_path)):
         class_path = os.path.join(split_path, class_name)
 
@@ -37,23 +133,51 @@ def process_split(split_name):
         for file in os.listdir(class_path):
             if not file.lower().endswith(IMAGE_EXTENSIONS):
                 continue
+            tasks.append((os.path.join(class_path, file), file, class_id))
+    return tasks
 
-            src_img_path = os.path.join(class_path, file)
-            dst_img_path = os.path.join(images_out, file)
-            shutil.copy(src_img_path, dst_img_path)
+def process_split(dataset_path, split_name, link_mode="hardlink", workers=8):
+    split_path = os.path.join(dataset_path, split_name)
+    images_out = os.path.join(split_path, "images")
+    labels_out = os.path.join(split_path, "labels")
 
-            x_center = 0.5
-            y_center = 0.5
-            box_width = 1.0 - (2 * PADDING_RATIO)
-            box_height = 1.0 - (2 * PADDING_RATIO)
+    os.makedirs(images_out, exist_ok=True)
+    os.makedirs(labels_out, exist_ok=True)
 
-            label_file = os.path.splitext(file)[0] + ".txt"
-            label_path = os.path.join(labels_out, label_file)
+    manifest = load_manifest(split_path)
+    tasks = collect_tasks(split_path)
+
+    entries = []
+    updated = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(convert_file, task, images_out, labels_out, link_mode, manifest.get(task[1]))
+            for task in tasks
+        ]
+        for future in futures:
+            try:
+                entry, changed = future.result()
+            except OSError as e:
+                print(f"{split_name}: {e}")
+                continue
+            entries.append(entry)
+            updated += int(changed)
 
-            with open(label_path, "w") as f:
-                f.write(f"{class_id} {x_center} {y_center} {box_width} {box_height}\n")
+    save_manifest(split_path, entries, link_mode)
+    print(f"{split_name}: {len(entries)} pairs ({updated} updated, {len(entries) - updated} unchanged)")
+    return entries
 
-process_split("train")
-process_split("valid")
+def main():
+    parser = argparse.ArgumentParser(description="Convert class-folder retina datasets to YOLO images/labels layout.")
+    parser.add_argument("--dataset", default=DATASET_PATH, help="dataset root containing the split folders")
+    parser.add_argument("--splits", nargs="+", default=SPLITS)
+    parser.add_argument("--mode", choices=LINK_MODES, default="hardlink",
+                        help="how images are placed in images/ (falls back to copy if linking fails)")
+    parser.add_argument("--workers", type=int, default=min(32, (os.cpu_count() or 1) * 4))
+    args = parser.parse_args()
 
+    for split in args.splits:
+        process_split(args.dataset, split, args.mode, args.workers)
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+
+DATASET_PATH = r"path\to\original\dataset"
+SPLITS = ["train", "valid"]
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+INDEX_NAME = ".phash_index.json"
+MAX_DISTANCE = 6
+CHUNK_SIZE = 128
+
+# Hash pairs compared per vectorized block; bounds the temporary arrays to a few tens of MB.
+BLOCK_ELEMENTS = 1 << 22
+
+def phash(img_path):
+    """64-bit DCT perceptual hash, decoded at reduced resolution."""
+    img = cv2.imread(img_path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if img is None:
+        img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None
+
+    small = cv2.resize(img, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view(">u8")[0])
+
+def hash_chunk(chunk):
+    return [(key, phash(path)) for key, path in chunk]
+
+def popcount64(x):
+    """Number of set bits in each element of a uint64 array."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+def hamming(a, b):
+    """Element-wise (broadcasting) Hamming distance between uint64 arrays."""
+    return popcount64(np.bitwise_xor(a, b))
+
+def load_index(index_path):
+    if not os.path.isfile(index_path):
+        return {}
+    try:
+        with open(index_path, "r") as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return {}
+
+def build_index(dataset_path, splits, workers=None):
+    """Hash every image, reusing hashes for files whose size and mtime are unchanged."""
+    index_path = os.path.join(dataset_path, INDEX_NAME)
+    old_index = load_index(index_path)
+    index = {}
+    pending = []
+
+    for split in splits:
+        images_dir = os.path.join(dataset_path, split, "images")
+        if not os.path.isdir(images_dir):
+            print(f"{split}: images/ missing")
+            continue
+
+        for entry in os.scandir(images_dir):
+            if not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            st = entry.stat()
+            key = os.path.join(split, entry.name)
+            signature = [st.st_size, st.st_mtime]
+
+            cached = old_index.get(key)
+            if cached is not None and cached["signature"] == signature:
+                index[key] = cached
+            else:
+                index[key] = {"split": split, "signature": signature, "hash": None}
+                pending.append((key, entry.path))
+
+    if pending:
+        chunks = [pending[i:i + CHUNK_SIZE] for i in range(0, len(pending), CHUNK_SIZE)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for results in executor.map(hash_chunk, chunks):
+                for key, value in results:
+                    index[key]["hash"] = None if value is None else f"{value:016x}"
+
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+    print(f"Hashed {len(pending)} images, reused {len(index) - len(pending)} from index")
+    return index
+
+def find_near_duplicates(hashes, max_distance=MAX_DISTANCE):
+    """Return (i, j, distance) pairs, i < j, with Hamming distance <= max_distance.
+
+    Each block of rows is XORed against every later hash at once and the
+    distances are taken with a vectorized popcount, so no per-pair Python
+    work happens until a pair is known to match.
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    n = len(hashes)
+    block = max(1, BLOCK_ELEMENTS // max(n, 1))
+
+    found_i, found_j, found_d = [], [], []
+    for start in range(0, n - 1, block):
+        stop = min(start + block, n)
+        distances = hamming(hashes[start:stop, None], hashes[None, start + 1:])
+        rows, cols = np.nonzero(distances <= max_distance)
+        # Column c of row r is hash start + 1 + c; keep only pairs after the row's own hash.
+        keep = cols >= rows
+        rows, cols = rows[keep], cols[keep]
+        found_i.append(rows + start)
+        found_j.append(cols + start + 1)
+        found_d.append(distances[rows, cols])
+
+    if not found_i:
+        return []
+    i, j, d = np.concatenate(found_i), np.concatenate(found_j), np.concatenate(found_d)
+    return list(zip(i.tolist(), j.tolist(), d.astype(np.int64).tolist()))
+
+def build_report(index, max_distance=MAX_DISTANCE):
+    keys = sorted(k for k, v in index.items() if v["hash"] is not None)
+    hashes = [int(index[k]["hash"], 16) for k in keys]
+
+    leaks = []
+    duplicates = []
+    for i, j, distance in find_near_duplicates(hashes, max_distance):
+        pair = {"a": keys[i], "b": keys[j], "distance": distance}
+        if index[keys[i]]["split"] != index[keys[j]]["split"]:
+            leaks.append(pair)
+        else:
+            duplicates.append(pair)
+
+    return {
+        "images": len(index),
+        "unreadable": sorted(k for k, v in index.items() if v["hash"] is None),
+        "max_distance": max_distance,
+        "cross_split_leaks": leaks,
+        "within_split_duplicates": duplicates,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Find duplicate and leaked images across dataset splits.")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--splits", nargs="+", default=SPLITS)
+    parser.add_argument("--max-distance", type=int, default=MAX_DISTANCE,
+                        help="maximum Hamming distance between 64-bit hashes to count as a duplicate")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--report", default="duplicates.json")
+    args = parser.parse_args()
+
+    index = build_index(args.dataset, args.splits, args.workers)
+    report = build_report(index, args.max_distance)
+
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Cross-split leaks: {len(report['cross_split_leaks'])}")
+    print(f"Within-split duplicates: {len(report['within_split_duplicates'])}")
+    print(f"Wrote {args.report}")
+
+if __name__ == "__main__":
+    main()
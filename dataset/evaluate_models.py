@@ -0,0 +1,315 @@
+"""Offline evaluation of the severity and lesion models.
+
+Run from the repository root so the app modules resolve:
+
+    python -m dataset.evaluate_models --dataset path/to/dataset --split valid --out eval.json
+"""
+import os
+import json
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+from config import SEVERITY_MODEL_PATH, LESION_MODEL_PATH, WORKING_RESOLUTIONS
+from dataset.pack_retina_dataset import PackedRetinaDataset
+from processing.image_processor import locate_working_images, severity_from_result, lesions_from_result
+from utils.performance_profile import apply_thread_settings, stage_threads
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+SEVERITY_GRADES = {"No_DR": 0, "Mild": 1, "Moderate": 2, "Severe": 3, "Proliferative": 4, "Proliferative_DR": 4}
+IOU_THRESHOLD = 0.5
+
+def load_yolo(model_path):
+    from ultralytics import YOLO
+    if not os.path.exists(model_path):
+        print(f"Model file not found: {model_path}")
+        return None
+    return YOLO(model_path)
+
+def read_yolo_labels(label_path):
+    rows = []
+    if os.path.isfile(label_path):
+        with open(label_path, "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 5:
+                    rows.append([float(v) for v in parts])
+    return rows
+
+def iter_folder_batches(dataset_path, split, batch_size, workers):
+    """Yield (images, labels, names) with a bounded read-ahead on a thread pool."""
+    images_dir = os.path.join(dataset_path, split, "images")
+    labels_dir = os.path.join(dataset_path, split, "labels")
+    names = sorted(f for f in os.listdir(images_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+    def load(name):
+        img = cv2.imread(os.path.join(images_dir, name))
+        labels = read_yolo_labels(os.path.join(labels_dir, os.path.splitext(name)[0] + ".txt"))
+        return img, labels, name
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        name_iter = iter(names)
+        read_ahead = batch_size * 4
+
+        for name in name_iter:
+            pending.append(executor.submit(load, name))
+            if len(pending) >= read_ahead:
+                break
+
+        batch = []
+        while pending:
+            img, labels, name = pending.popleft().result()
+            next_name = next(name_iter, None)
+            if next_name is not None:
+                pending.append(executor.submit(load, next_name))
+            if img is None:
+                print(f"Unreadable image skipped: {name}")
+                continue
+            batch.append((img, labels, name))
+            if len(batch) == batch_size:
+                yield [b[0] for b in batch], [b[1] for b in batch], [b[2] for b in batch]
+                batch = []
+        if batch:
+            yield [b[0] for b in batch], [b[1] for b in batch], [b[2] for b in batch]
+
+def iter_packed_batches(packed_path, split, batch_size):
+    packed = PackedRetinaDataset(os.path.join(packed_path, split))
+    for images, labels, names in packed.iter_batches(batch_size):
+        yield list(images), [[[int(c)]] if c >= 0 else [] for c in labels], names
+
+def confusion_metrics(y_true, y_pred, num_classes):
+    cm = np.zeros((num_classes, num_classes), dtype=np.int64)
+    np.add.at(cm, (np.asarray(y_true, dtype=np.int64), np.asarray(y_pred, dtype=np.int64)), 1)
+
+    tp = np.diag(cm).astype(float)
+    precision = np.divide(tp, cm.sum(axis=0), out=np.zeros_like(tp), where=cm.sum(axis=0) > 0)
+    recall = np.divide(tp, cm.sum(axis=1), out=np.zeros_like(tp), where=cm.sum(axis=1) > 0)
+    accuracy = float(tp.sum() / cm.sum()) if cm.sum() else 0.0
+    return cm, precision, recall, accuracy
+
+def quadratic_kappa(y_true, y_pred, num_grades):
+    y_true = np.asarray(y_true, dtype=np.int64)
+    y_pred = np.asarray(y_pred, dtype=np.int64)
+    if len(y_true) == 0:
+        return 0.0
+
+    observed = np.zeros((num_grades, num_grades), dtype=float)
+    np.add.at(observed, (y_true, y_pred), 1)
+    expected = np.outer(np.bincount(y_true, minlength=num_grades),
+                        np.bincount(y_pred, minlength=num_grades)) / len(y_true)
+    grades = np.arange(num_grades)
+    weights = (grades[:, None] - grades[None, :]) ** 2 / max(1, (num_grades - 1) ** 2)
+
+    denominator = (weights * expected).sum()
+    return float(1.0 - (weights * observed).sum() / denominator) if denominator else 1.0
+
+def latency_summary(per_image_ms):
+    """Single-image latency: one image cropped, downscaled and run on its own."""
+    per_image_ms = np.asarray(per_image_ms, dtype=float)
+    return {
+        "samples": int(len(per_image_ms)),
+        "latency_ms_p50": round(float(np.percentile(per_image_ms, 50)), 2) if len(per_image_ms) else 0.0,
+        "latency_ms_p95": round(float(np.percentile(per_image_ms, 95)), 2) if len(per_image_ms) else 0.0,
+    }
+
+def throughput_summary(batch_ms, total_images, total_seconds):
+    """Batched throughput: a whole read batch prepared and run in one forward pass."""
+    batch_ms = np.asarray(batch_ms, dtype=float)
+    return {
+        "images": int(total_images),
+        "batches": int(len(batch_ms)),
+        "images_per_sec": round(total_images / total_seconds, 2) if total_seconds else 0.0,
+        "batch_ms_p50": round(float(np.percentile(batch_ms, 50)), 2) if len(batch_ms) else 0.0,
+        "batch_ms_p95": round(float(np.percentile(batch_ms, 95)), 2) if len(batch_ms) else 0.0,
+    }
+
+def prepare(img, stage):
+    """(working image, transform) cropped to the fundus and downscaled as ImageProcessor does."""
+    return locate_working_images(img).get(WORKING_RESOLUTIONS[stage])
+
+class StageRunner:
+    """Runs a model over read batches in one forward pass each, timing throughput and latency.
+
+    finish(working, transform, result) turns one image's result into a
+    prediction. Latency is sampled separately, on the first latency_samples
+    images, by running them one at a time.
+    """
+
+    def __init__(self, model, stage, finish, latency_samples):
+        self.model = model
+        self.stage = stage
+        self.finish = finish
+        self.latency_samples = latency_samples
+        self.batch_ms = []
+        self.per_image_ms = []
+        self.total_images = 0
+        self.total_seconds = 0.0
+
+    def run(self, images):
+        with stage_threads(self.stage):
+            start = time.perf_counter()
+            prepared = [prepare(img, self.stage) for img in images]
+            results = self.model([working for working, _ in prepared], verbose=False)
+            outputs = [self.finish(working, transform, result)
+                       for (working, transform), result in zip(prepared, results)]
+            elapsed = time.perf_counter() - start
+            self.batch_ms.append(elapsed * 1000.0)
+            self.total_images += len(images)
+            self.total_seconds += elapsed
+
+            for img in images[:max(0, self.latency_samples - len(self.per_image_ms))]:
+                start = time.perf_counter()
+                working, transform = prepare(img, self.stage)
+                self.finish(working, transform, self.model(working, verbose=False)[0])
+                self.per_image_ms.append((time.perf_counter() - start) * 1000.0)
+        return outputs
+
+    def speed(self):
+        return {
+            "batched": throughput_summary(self.batch_ms, self.total_images, self.total_seconds),
+            "single_image": latency_summary(self.per_image_ms),
+        }
+
+def evaluate_severity(model, batches, latency_samples):
+    names = {int(k): v for k, v in model.names.items()}
+    num_classes = len(names)
+    y_true, y_pred = [], []
+    tta_images = 0
+    runner = StageRunner(model, 'severity', lambda working, _, result: severity_from_result(model, working, result),
+                         latency_samples)
+
+    for images, labels, _ in batches:
+        for parsed, label_rows in zip(runner.run(images), labels):
+            if parsed is not None and parsed[2]:
+                tta_images += 1
+            if not label_rows:
+                continue
+            y_true.append(int(label_rows[0][0]))
+            y_pred.append(parsed[0] if parsed is not None else -1)
+
+    # Images the model returned nothing for are reported separately, not scored.
+    valid = [(t, p) for t, p in zip(y_true, y_pred) if p >= 0]
+    missing = len(y_true) - len(valid)
+    y_true_valid = [t for t, _ in valid]
+    y_pred_valid = [p for _, p in valid]
+
+    cm, precision, recall, accuracy = confusion_metrics(y_true_valid, y_pred_valid, num_classes)
+    grade_of = [SEVERITY_GRADES.get(names[i], i) for i in range(num_classes)]
+    kappa = quadratic_kappa([grade_of[t] for t in y_true_valid], [grade_of[p] for p in y_pred_valid],
+                            max(grade_of) + 1)
+
+    return {
+        "classes": [names[i] for i in range(num_classes)],
+        "confusion_matrix": cm.tolist(),
+        "per_class": {
+            names[i]: {"precision": round(float(precision[i]), 4), "recall": round(float(recall[i]), 4),
+                       "support": int(cm[i].sum())}
+            for i in range(num_classes)
+        },
+        "accuracy": round(accuracy, 4),
+        "quadratic_kappa": round(kappa, 4),
+        "no_prediction": missing,
+        "tta_images": tta_images,
+        "speed": runner.speed(),
+    }
+
+def box_iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def evaluate_lesions(model, batches, latency_samples, iou_threshold=IOU_THRESHOLD):
+    names = {int(k): v for k, v in model.names.items()}
+    counts = {i: {"tp": 0, "fp": 0, "fn": 0} for i in names}
+    runner = StageRunner(model, 'lesion',
+                         lambda _, transform, result: lesions_from_result(result, model.names, transform),
+                         latency_samples)
+
+    for images, labels, _ in batches:
+        for img, label_rows, predictions in zip(images, labels, runner.run(images)):
+            h, w = img.shape[:2]
+            truths = [
+                (int(c), [(x - bw / 2) * w, (y - bh / 2) * h, (x + bw / 2) * w, (y + bh / 2) * h])
+                for c, x, y, bw, bh in label_rows
+            ]
+            matched = [False] * len(truths)
+            predictions = sorted(predictions, key=lambda p: -p["confidence"])
+
+            for pred in predictions:
+                best, best_iou = -1, iou_threshold
+                for idx, (cls, box) in enumerate(truths):
+                    if matched[idx] or cls != pred["class_id"]:
+                        continue
+                    iou = box_iou(pred["box"], box)
+                    if iou >= best_iou:
+                        best, best_iou = idx, iou
+                bucket = counts.setdefault(pred["class_id"], {"tp": 0, "fp": 0, "fn": 0})
+                if best >= 0:
+                    matched[best] = True
+                    bucket["tp"] += 1
+                else:
+                    bucket["fp"] += 1
+
+            for idx, (cls, _) in enumerate(truths):
+                if not matched[idx]:
+                    counts.setdefault(cls, {"tp": 0, "fp": 0, "fn": 0})["fn"] += 1
+
+    per_class = {}
+    for cls, c in sorted(counts.items()):
+        precision = c["tp"] / (c["tp"] + c["fp"]) if c["tp"] + c["fp"] else 0.0
+        recall = c["tp"] / (c["tp"] + c["fn"]) if c["tp"] + c["fn"] else 0.0
+        per_class[names.get(cls, f"Lesion_{cls}")] = dict(c, precision=round(precision, 4), recall=round(recall, 4))
+
+    return {
+        "iou_threshold": iou_threshold,
+        "per_class": per_class,
+        "speed": runner.speed(),
+    }
+
+def make_batches(args, dataset_path, packed):
+    if packed:
+        return iter_packed_batches(args.packed, args.split, args.batch_size)
+    return iter_folder_batches(dataset_path, args.split, args.batch_size, args.workers)
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the severity and lesion models on a labelled split.")
+    parser.add_argument("--dataset", help="converted YOLO severity dataset root")
+    parser.add_argument("--packed", help="packed severity dataset root (from pack_retina_dataset)")
+    parser.add_argument("--lesion-dataset", help="YOLO detection dataset root for the lesion model")
+    parser.add_argument("--split", default="valid")
+    parser.add_argument("--batch-size", type=int, default=16, help="images per read batch and forward pass")
+    parser.add_argument("--latency-samples", type=int, default=32,
+                        help="images also run one at a time to measure single-image latency")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--severity-model", default=SEVERITY_MODEL_PATH)
+    parser.add_argument("--lesion-model", default=LESION_MODEL_PATH)
+    parser.add_argument("--out", default="evaluation.json")
+    args = parser.parse_args()
+    apply_thread_settings()
+
+    report = {"split": args.split, "batch_size": args.batch_size}
+
+    if args.dataset or args.packed:
+        model = load_yolo(args.severity_model)
+        if model is not None:
+            report["severity"] = evaluate_severity(model, make_batches(args, args.dataset, bool(args.packed)),
+                                                   args.latency_samples)
+
+    if args.lesion_dataset:
+        model = load_yolo(args.lesion_model)
+        if model is not None:
+            report["lesions"] = evaluate_lesions(model, make_batches(args, args.lesion_dataset, False),
+                                                 args.latency_samples)
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Wrote {args.out}")
+
+if __name__ == "__main__":
+    main()
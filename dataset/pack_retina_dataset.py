@@ -0,0 +1,148 @@
+import os
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+DATASET_PATH = r"path\to\original\dataset"
+PACKED_PATH = r"path\to\packed\dataset"
+SPLITS = ["train", "valid"]
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+RESOLUTION = 512
+SHARD_SIZE = 1024
+INDEX_NAME = "index.json"
+LABELS_NAME = "labels.npy"
+NO_LABEL = -1
+
+def letterbox(img, size):
+    """Resize keeping aspect ratio and pad with black to size x size."""
+    h, w = img.shape[:2]
+    scale = size / max(h, w)
+    new_w, new_h = max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+    resized = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
+
+    out = np.zeros((size, size, 3), dtype=np.uint8)
+    oy, ox = (size - new_h) // 2, (size - new_w) // 2
+    out[oy:oy + new_h, ox:ox + new_w] = resized
+    return out
+
+def read_class_id(label_path):
+    if not os.path.isfile(label_path):
+        return NO_LABEL
+    with open(label_path, "r") as f:
+        parts = f.readline().split()
+    return int(float(parts[0])) if parts else NO_LABEL
+
+def pack_split(dataset_path, split, out_path, resolution=RESOLUTION, shard_size=SHARD_SIZE, workers=8):
+    images_dir = os.path.join(dataset_path, split, "images")
+    labels_dir = os.path.join(dataset_path, split, "labels")
+    split_out = os.path.join(out_path, split)
+    os.makedirs(split_out, exist_ok=True)
+
+    names = sorted(f for f in os.listdir(images_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+    labels = np.array(
+        [read_class_id(os.path.join(labels_dir, os.path.splitext(n)[0] + ".txt")) for n in names],
+        dtype=np.int16
+    )
+    np.save(os.path.join(split_out, LABELS_NAME), labels)
+
+    shards = []
+    failed = []
+    for shard_idx, start in enumerate(range(0, len(names), shard_size)):
+        shard_names = names[start:start + shard_size]
+        shard_file = f"shard_{shard_idx:05d}.npy"
+        shard = np.lib.format.open_memmap(
+            os.path.join(split_out, shard_file), mode="w+",
+            dtype=np.uint8, shape=(len(shard_names), resolution, resolution, 3)
+        )
+
+        def fill(slot):
+            img = cv2.imread(os.path.join(images_dir, shard_names[slot]))
+            if img is None:
+                return shard_names[slot]
+            shard[slot] = letterbox(img, resolution)
+            return None
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            failed.extend(name for name in executor.map(fill, range(len(shard_names))) if name)
+
+        shard.flush()
+        del shard
+        shards.append({"file": shard_file, "start": start, "count": len(shard_names)})
+        print(f"{split}: packed {start + len(shard_names)}/{len(names)}")
+
+    index = {
+        "split": split,
+        "resolution": resolution,
+        "channels": "BGR",
+        "count": len(names),
+        "shards": shards,
+        "labels": LABELS_NAME,
+        "names": names,
+        "unreadable": failed,
+    }
+    with open(os.path.join(split_out, INDEX_NAME), "w") as f:
+        json.dump(index, f)
+
+    if failed:
+        print(f"{split}: {len(failed)} unreadable images stored as black frames")
+    return index
+
+class PackedRetinaDataset:
+    """Random-access reader over a packed split; images are BGR uint8 memmaps."""
+
+    def __init__(self, split_path):
+        self.split_path = split_path
+        with open(os.path.join(split_path, INDEX_NAME), "r") as f:
+            self.index = json.load(f)
+
+        self.resolution = self.index["resolution"]
+        self.names = self.index["names"]
+        self.labels = np.load(os.path.join(split_path, self.index["labels"]))
+        self.shard_starts = np.array([s["start"] for s in self.index["shards"]], dtype=np.int64)
+        self.shards = [None] * len(self.index["shards"])
+
+    def __len__(self):
+        return self.index["count"]
+
+    def _shard(self, shard_idx):
+        if self.shards[shard_idx] is None:
+            shard_file = self.index["shards"][shard_idx]["file"]
+            self.shards[shard_idx] = np.load(os.path.join(self.split_path, shard_file), mmap_mode="r")
+        return self.shards[shard_idx]
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        shard_idx = int(np.searchsorted(self.shard_starts, idx, side="right") - 1)
+        return self._shard(shard_idx)[idx - self.shard_starts[shard_idx]], int(self.labels[idx])
+
+    def iter_batches(self, batch_size=32):
+        """Yield (images, labels, names) batches in shard order without copying across shards."""
+        for shard_idx, info in enumerate(self.index["shards"]):
+            shard = self._shard(shard_idx)
+            start = info["start"]
+            for offset in range(0, info["count"], batch_size):
+                end = min(offset + batch_size, info["count"])
+                yield (shard[offset:end],
+                       self.labels[start + offset:start + end],
+                       self.names[start + offset:start + end])
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack YOLO retina dataset splits into memory-mapped shards.")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--out", default=PACKED_PATH)
+    parser.add_argument("--splits", nargs="+", default=SPLITS)
+    parser.add_argument("--resolution", type=int, default=RESOLUTION)
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    for split in args.splits:
+        pack_split(args.dataset, split, args.out, args.resolution, args.shard_size, args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,16 @@
 import os
 import random
+import hashlib
+import argparse
+import threading
 import cv2
+import numpy as np
 
 DATASET_PATH = r"path\to\original\dataset"
 SPLIT = "train"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+THUMB_SIZE = 256
+THUMB_DIR = ".thumbs"
 
 CLASS_NAMES = {
     0: "No_DR",
@@ -13,56 +20,205 @@ CLASS_NAMES = {
     4: "Proliferative"
 }
 
-images_dir = os.path.join(DATASET_PATH, SPLIT, "images")
-labels_dir = os.path.join(DATASET_PATH, SPLIT, "labels")
-
-images = [
-    f for f in os.listdir(images_dir)
-    if f.lower().endswith((".jpg", ".jpeg", ".png"))
+REDUCED_READ_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+    (1, cv2.IMREAD_COLOR),
 ]
 
-random.shuffle(images)
-
-for img_name in images:
-    img_path = os.path.join(images_dir, img_name)
-    label_path = os.path.join(labels_dir, os.path.splitext(img_name)[0] + ".txt")
-
+def read_label(label_path):
     if not os.path.isfile(label_path):
-        continue
-
-    img = cv2.imread(img_path)
-    h, w, _ = img.shape
-
+        return None
     with open(label_path, "r") as f:
-        class_id, x, y, bw, bh = map(float, f.readline().split())
-
-    cx = int(x * w)
-    cy = int(y * h)
-    bw = int(bw * w)
-    bh = int(bh * h)
-
-    x1 = int(cx - bw / 2)
-    y1 = int(cy - bh / 2)
-    x2 = int(cx + bw / 2)
-    y2 = int(cy + bh / 2)
-
-    cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-
-    label = CLASS_NAMES[int(class_id)]
-    cv2.putText(
-        img,
-        label,
-        (x1, max(y1 - 10, 20)),
-        cv2.FONT_HERSHEY_SIMPLEX,
-        0.7,
-        (0, 255, 0),
-        2
-    )
-
-    cv2.imshow("Dataset Preview", img)
-    key = cv2.waitKey(0)
-
-    if key == ord("q"):
-        break
-
-cv2.destroyAllWindows()
+        parts = f.readline().split()
+    if len(parts) != 5:
+        return None
+    class_id, x, y, bw, bh = map(float, parts)
+    return int(class_id), x, y, bw, bh
+
+def decode_reduced(img_path, thumb_size):
+    """Decode at the smallest JPEG/PNG reduction that still covers thumb_size."""
+    fallback = None
+    for factor, flag in REDUCED_READ_FLAGS:
+        img = cv2.imread(img_path, flag)
+        if img is None:
+            continue
+        fallback = img
+        if max(img.shape[:2]) >= thumb_size or factor == 1:
+            return img
+    return fallback
+
+class ThumbnailCache:
+    def __init__(self, cache_dir, thumb_size=THUMB_SIZE):
+        self.cache_dir = cache_dir
+        self.thumb_size = thumb_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_path(self, img_path):
+        st = os.stat(img_path)
+        key = f"{os.path.abspath(img_path)}|{st.st_size}|{st.st_mtime}|{self.thumb_size}"
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".jpg")
+
+    def get(self, img_path):
+        cache_path = self._cache_path(img_path)
+        thumb = cv2.imread(cache_path)
+        if thumb is not None:
+            return thumb
+
+        img = decode_reduced(img_path, self.thumb_size)
+        if img is None:
+            return None
+
+        h, w = img.shape[:2]
+        scale = self.thumb_size / max(h, w)
+        thumb = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        # Write to a per-thread temporary file and rename it into place, so a concurrent
+        # reader never sees a half-written thumbnail.
+        tmp_path = f"{os.path.splitext(cache_path)[0]}.{threading.get_ident()}.tmp.jpg"
+        if cv2.imwrite(tmp_path, thumb, [cv2.IMWRITE_JPEG_QUALITY, 90]):
+            os.replace(tmp_path, cache_path)
+        return thumb
+
+def draw_tile(thumb, label, tile_size, name):
+    tile = np.zeros((tile_size, tile_size, 3), dtype=np.uint8)
+    if thumb is None:
+        cv2.putText(tile, "unreadable", (10, tile_size // 2), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+        return tile
+
+    h, w = thumb.shape[:2]
+    oy, ox = (tile_size - h) // 2, (tile_size - w) // 2
+    tile[oy:oy + h, ox:ox + w] = thumb
+
+    if label is not None:
+        class_id, x, y, bw, bh = label
+        x1 = int(ox + (x - bw / 2) * w)
+        y1 = int(oy + (y - bh / 2) * h)
+        x2 = int(ox + (x + bw / 2) * w)
+        y2 = int(oy + (y + bh / 2) * h)
+        cv2.rectangle(tile, (x1, y1), (x2, y2), (0, 255, 0), 1)
+        text = CLASS_NAMES.get(class_id, str(class_id))
+    else:
+        text = "no label"
+
+    cv2.putText(tile, text, (5, 18), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1, cv2.LINE_AA)
+    cv2.putText(tile, name[:32], (5, tile_size - 6), cv2.FONT_HERSHEY_SIMPLEX, 0.35, (200, 200, 200), 1, cv2.LINE_AA)
+    return tile
+
+class ContactSheetPreviewer:
+    def __init__(self, dataset_path, split, rows=4, cols=6, thumb_size=THUMB_SIZE, shuffle=True):
+        self.images_dir = os.path.join(dataset_path, split, "images")
+        self.labels_dir = os.path.join(dataset_path, split, "labels")
+        self.rows = rows
+        self.cols = cols
+        self.thumb_size = thumb_size
+        self.cache = ThumbnailCache(os.path.join(dataset_path, split, THUMB_DIR), thumb_size)
+
+        self.images = sorted(
+            f for f in os.listdir(self.images_dir)
+            if f.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if shuffle:
+            random.shuffle(self.images)
+
+        self.page_size = rows * cols
+        self.page_count = max(1, (len(self.images) + self.page_size - 1) // self.page_size)
+        self.pages = {}
+        # Pages being rendered, each with an Event set when its sheet is stored.
+        self.rendering = {}
+        self.lock = threading.Lock()
+        self.prefetch_thread = None
+
+    def render_page(self, page):
+        """Rendered sheet for page; waits for it instead of rendering it twice if another thread is."""
+        with self.lock:
+            if page in self.pages:
+                return self.pages[page]
+            done = self.rendering.get(page)
+            if done is None:
+                self.rendering[page] = threading.Event()
+
+        if done is not None:
+            done.wait()
+            # Rendered by the other thread, unless it failed or the page was evicted since.
+            return self.render_page(page)
+
+        try:
+            sheet = self._render(page)
+            with self.lock:
+                self.pages[page] = sheet
+                for old in [p for p in self.pages if abs(p - page) > 2]:
+                    del self.pages[old]
+            return sheet
+        finally:
+            with self.lock:
+                self.rendering.pop(page).set()
+
+    def _render(self, page):
+        names = self.images[page * self.page_size:(page + 1) * self.page_size]
+        sheet = np.zeros((self.rows * self.thumb_size, self.cols * self.thumb_size, 3), dtype=np.uint8)
+
+        for idx, img_name in enumerate(names):
+            img_path = os.path.join(self.images_dir, img_name)
+            label_path = os.path.join(self.labels_dir, os.path.splitext(img_name)[0] + ".txt")
+            tile = draw_tile(self.cache.get(img_path), read_label(label_path), self.thumb_size, img_name)
+
+            r, c = divmod(idx, self.cols)
+            sheet[r * self.thumb_size:(r + 1) * self.thumb_size,
+                  c * self.thumb_size:(c + 1) * self.thumb_size] = tile
+        return sheet
+
+    def prefetch(self, page):
+        if page >= self.page_count or (self.prefetch_thread and self.prefetch_thread.is_alive()):
+            return
+        self.prefetch_thread = threading.Thread(target=self.render_page, args=(page,), daemon=True)
+        self.prefetch_thread.start()
+
+    def write_sheets(self, out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+        for page in range(self.page_count):
+            self.prefetch(page + 1)
+            sheet = self.render_page(page)
+            out_path = os.path.join(out_dir, f"sheet_{page + 1:04d}.jpg")
+            cv2.imwrite(out_path, sheet)
+            print(f"Wrote {out_path}")
+
+    def show(self):
+        page = 0
+        while True:
+            self.prefetch(page + 1)
+            sheet = self.render_page(page)
+            cv2.imshow("Dataset Preview", sheet)
+            cv2.setWindowTitle("Dataset Preview", f"Dataset Preview - page {page + 1}/{self.page_count}")
+
+            key = cv2.waitKey(0)
+            if key == ord("q") or key == 27:
+                break
+            elif key == ord("p") or key == ord("b"):
+                page = max(0, page - 1)
+            else:
+                page = min(self.page_count - 1, page + 1)
+
+        cv2.destroyAllWindows()
+
+def main():
+    parser = argparse.ArgumentParser(description="Preview a YOLO retina dataset as paged contact sheets.")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--split", default=SPLIT)
+    parser.add_argument("--rows", type=int, default=4)
+    parser.add_argument("--cols", type=int, default=6)
+    parser.add_argument("--thumb-size", type=int, default=THUMB_SIZE)
+    parser.add_argument("--no-shuffle", action="store_true")
+    parser.add_argument("--headless", metavar="OUT_DIR", help="write contact sheets to OUT_DIR instead of showing them")
+    args = parser.parse_args()
+
+    previewer = ContactSheetPreviewer(args.dataset, args.split, args.rows, args.cols,
+                                      args.thumb_size, shuffle=not args.no_shuffle)
+    if args.headless:
+        previewer.write_sheets(args.headless)
+    else:
+        print("Keys: any key = next page, p = previous page, q = quit")
+        previewer.show()
+
+if __name__ == "__main__":
+    main()
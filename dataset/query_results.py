@@ -0,0 +1,87 @@
+"""Query the results database recorded by the app and by batch_analyze --db.
+
+Run from the repository root so the app modules resolve:
+
+    python -m dataset.query_results --severity Severe --min-lesions-1dd 3 --this-month
+    python -m dataset.query_results --min-severity Moderate --max-vessel-density 8 --days 30 --count
+    python -m dataset.query_results --image path/to/scan.png --json
+"""
+import json
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from config import SEVERITY_CLASSES, RESULTS_DB_PATH
+from processing.results_db import ResultsDatabase, image_hash
+
+def parse_date(value):
+    """ISO date or datetime, read as UTC when no offset is given."""
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def build_filters(args):
+    filters = {
+        'severity': args.severity,
+        'min_severity': args.min_severity,
+        'min_lesions': args.min_lesions,
+        'max_lesions': args.max_lesions,
+        'min_lesions_1dd': args.min_lesions_1dd,
+        'min_vessel_density': args.min_vessel_density,
+        'max_vessel_density': args.max_vessel_density,
+        'since': args.since,
+        'until': args.until,
+    }
+    now = datetime.now(timezone.utc)
+    if args.this_month:
+        filters['since'] = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if args.days is not None:
+        filters['since'] = now - timedelta(days=args.days)
+    if args.image:
+        import cv2
+        img = cv2.imread(args.image)
+        if img is None:
+            raise SystemExit(f"Could not load image: {args.image}")
+        filters['image_hash'] = image_hash(img)
+    return {k: v for k, v in filters.items() if v is not None}
+
+def format_row(row):
+    return (f"{row['analyzed_at']}  {row['severity']:<14} {row['confidence']:.2f}  "
+            f"lesions={row['lesions_total']:<3} in1DD={row['lesions_within_1dd']:<3} "
+            f"vessels={row['vessel_density']:.2f}%  {row['source'] or row['image_hash'][:12]}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Query recorded retina scan analyses.")
+    parser.add_argument("--db", default=RESULTS_DB_PATH)
+    parser.add_argument("--severity", choices=SEVERITY_CLASSES)
+    parser.add_argument("--min-severity", choices=SEVERITY_CLASSES)
+    parser.add_argument("--min-lesions", type=int)
+    parser.add_argument("--max-lesions", type=int)
+    parser.add_argument("--min-lesions-1dd", type=int, help="lesions within one disc diameter of the fovea")
+    parser.add_argument("--min-vessel-density", type=float)
+    parser.add_argument("--max-vessel-density", type=float)
+    parser.add_argument("--since", type=parse_date, help="ISO date, inclusive")
+    parser.add_argument("--until", type=parse_date, help="ISO date, exclusive")
+    parser.add_argument("--this-month", action="store_true")
+    parser.add_argument("--days", type=int, help="only the last N days")
+    parser.add_argument("--image", help="only analyses of this scan (matched by pixel hash)")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--oldest-first", action="store_true")
+    parser.add_argument("--count", action="store_true", help="print only the number of matches")
+    parser.add_argument("--json", action="store_true", help="print matches as JSON lines")
+    args = parser.parse_args()
+
+    filters = build_filters(args)
+    db = ResultsDatabase(args.db)
+    try:
+        if args.count:
+            print(db.count(**filters))
+            return
+        rows = db.query(limit=args.limit, newest_first=not args.oldest_first, **filters)
+        for row in rows:
+            print(json.dumps(row) if args.json else format_row(row))
+        if not args.json:
+            print(f"{len(rows)} of {db.count(**filters)} matching analyses")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,204 @@
 import os
-from PIL import Image
+import sys
+import json
+import struct
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 DATASET_PATH = r"path\to\original\dataset"
 SPLITS = ["train", "valid"]
 NUM_CLASSES = 5
 IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
-
-errors = []
-
-for split in SPLITS:
-    split_path = os.path.join(DATASET_PATH, split)
-    images_dir = os.path.join(split_path, "images")
-    labels_dir = os.path.join(split_path, "labels")
-
-    if not os.path.isdir(images_dir) or not os.path.isdir(labels_dir):
-        errors.append(f"{split}: images/ or labels/ missing")
-        continue
-
-    images = [
-        f for f in os.listdir(images_dir)
-        if f.lower().endswith(IMAGE_EXTENSIONS)
-    ]
-
-    for img_name in images:
-        img_path = os.path.join(images_dir, img_name)
-        label_path = os.path.join(labels_dir, os.path.splitext(img_name)[0] + ".txt")
-
-        if not os.path.isfile(label_path):
-            errors.append(f"{split}: Missing label for {img_name}")
-            continue
-
-        with open(label_path, "r") as f:
-            lines = f.readlines()
-
-        if len(lines) != 1:
-            errors.append(f"{split}: {img_name} has {len(lines)} labels")
-            continue
-
-        parts = lines[0].strip().split()
-        if len(parts) != 5:
-            errors.append(f"{split}: Invalid label format in {img_name}")
+CACHE_NAME = ".validate_cache.json"
+CHUNK_SIZE = 256
+
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def _jpeg_size(f):
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff":
+            byte = f.read(1)
+        if not byte:
+            return None
+
+        marker = byte[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
             continue
 
+        length_bytes = f.read(2)
+        if len(length_bytes) != 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+
+        if marker in JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) != 5:
+                return None
+            height, width = struct.unpack(">xHH", data)
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+def read_image_size(path):
+    """Read (width, height) from the file header without decoding pixels."""
+    with open(path, "rb") as f:
+        head = f.read(24)
+        if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+            return struct.unpack(">II", head[16:24])
+        if head.startswith(b"\xff\xd8"):
+            size = _jpeg_size(f)
+            if size:
+                return size
+
+    from PIL import Image
+    with Image.open(path) as img:
+        return img.size
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+        return [st.st_size, st.st_mtime]
+    except OSError:
+        return None
+
+def validate_pair(split, img_name, img_path, label_path):
+    """Return the list of problems for one image/label pair."""
+    errors = []
+
+    if not os.path.isfile(label_path):
+        return [f"{split}: Missing label for {img_name}"]
+
+    with open(label_path, "r") as f:
+        lines = f.readlines()
+
+    if len(lines) != 1:
+        return [f"{split}: {img_name} has {len(lines)} labels"]
+
+    parts = lines[0].strip().split()
+    if len(parts) != 5:
+        return [f"{split}: Invalid label format in {img_name}"]
+
+    try:
         class_id, x, y, w, h = map(float, parts)
+    except ValueError:
+        return [f"{split}: Invalid label format in {img_name}"]
+
+    if not (0 <= class_id < NUM_CLASSES):
+        errors.append(f"{split}: Invalid class id in {img_name}")
+
+    for v in [x, y, w, h]:
+        if not (0.0 < v <= 1.0):
+            errors.append(f"{split}: Value out of range in {img_name}")
+
+    try:
+        iw, ih = read_image_size(img_path)
+    except Exception as e:
+        errors.append(f"{split}: Unreadable image {img_name} ({e})")
+        return errors
+
+    if w * iw > iw or h * ih > ih:
+        errors.append(f"{split}: BBox exceeds image in {img_name}")
+
+    return errors
+
+def validate_chunk(chunk):
+    return [(key, validate_pair(*args)) for key, args in chunk]
+
+def load_cache(cache_path):
+    if not os.path.isfile(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r") as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return {}
+
+def save_cache(cache_path, cache):
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path)
+
+def validate_dataset(dataset_path, splits, workers=None, use_cache=True):
+    cache_path = os.path.join(dataset_path, CACHE_NAME)
+    cache = load_cache(cache_path) if use_cache else {}
+    new_cache = {}
+
+    errors = []
+    pending = []
+    counts = {"images": 0, "cached": 0, "checked": 0}
+
+    for split in splits:
+        split_path = os.path.join(dataset_path, split)
+        images_dir = os.path.join(split_path, "images")
+        labels_dir = os.path.join(split_path, "labels")
+
+        if not os.path.isdir(images_dir) or not os.path.isdir(labels_dir):
+            errors.append(f"{split}: images/ or labels/ missing")
+            continue
 
-        if not (0 <= class_id < NUM_CLASSES):
-            errors.append(f"{split}: Invalid class id in {img_name}")
-
-        for v in [x, y, w, h]:
-            if not (0.0 < v <= 1.0):
-                errors.append(f"{split}: Value out of range in {img_name}")
-
-        with Image.open(img_path) as img:
-            iw, ih = img.size
-            bw = w * iw
-            bh = h * ih
-
-            if bw > iw or bh > ih:
-                errors.append(f"{split}: BBox exceeds image in {img_name}")
-
-if errors:
-    print("invalid")
-    for e in errors:
-        print("-", e)
-else:
-    print("valid")
\ No newline at end of file
+        for entry in os.scandir(images_dir):
+            if not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+
+            counts["images"] += 1
+            label_path = os.path.join(labels_dir, os.path.splitext(entry.name)[0] + ".txt")
+            img_stat = entry.stat()
+            signature = [[img_stat.st_size, img_stat.st_mtime], file_signature(label_path)]
+
+            key = os.path.join(split, entry.name)
+            cached = cache.get(key)
+            if cached is not None and cached.get("signature") == signature:
+                new_cache[key] = cached
+                errors.extend(cached["errors"])
+                counts["cached"] += 1
+                continue
+
+            new_cache[key] = {"signature": signature, "errors": []}
+            pending.append((key, (split, entry.name, entry.path, label_path)))
+
+    if pending:
+        chunks = [pending[i:i + CHUNK_SIZE] for i in range(0, len(pending), CHUNK_SIZE)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for results in executor.map(validate_chunk, chunks):
+                for key, pair_errors in results:
+                    new_cache[key]["errors"] = pair_errors
+                    errors.extend(pair_errors)
+        counts["checked"] = len(pending)
+
+    if use_cache:
+        save_cache(cache_path, new_cache)
+
+    return {
+        "dataset": os.path.abspath(dataset_path),
+        "splits": splits,
+        "valid": not errors,
+        "counts": counts,
+        "errors": errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate YOLO images/labels retina datasets.")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--splits", nargs="+", default=SPLITS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--report", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--no-cache", action="store_true", help="re-validate every file")
+    args = parser.parse_args()
+
+    report = validate_dataset(args.dataset, args.splits, args.workers, use_cache=not args.no_cache)
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    sys.exit(0 if report["valid"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -46,6 +46,7 @@ def main():
     print("\nApplication ready. Use 'Upload Retina Scan' to begin.")
     
     root.mainloop()
+    app.shutdown()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,8 +1,13 @@
 import os
+import time
+import threading
+import numpy as np
 import torch
 from ultralytics import YOLO
 import segmentation_models_pytorch as smp
 from config import SEVERITY_MODEL_PATH, LESION_MODEL_PATH, MACULA_MODEL_PATH, VESSEL_MODEL_PATH
+from config import MODEL_WARMUP_ENABLED, WORKING_RESOLUTIONS
+from utils.performance_profile import load_profile, apply_thread_settings
 
 class ModelLoader:
     def __init__(self):
@@ -11,8 +16,17 @@ class ModelLoader:
         self.macula_model = None
         self.vessel_model = None
         self.vessel_model_available = False
+        self.warmed_up = threading.Event()
+        self.warmup_thread = None
+        
+        self.profile = load_profile()
+        apply_thread_settings(self.profile)
         
         self.load_models()
+        if MODEL_WARMUP_ENABLED:
+            self.start_warmup()
+        else:
+            self.warmed_up.set()
     
     def load_models(self):
         self.severity_model = self._load_yolo_model(SEVERITY_MODEL_PATH)
@@ -57,6 +71,57 @@ class ModelLoader:
             print(f"Error loading vessel model: {e}")
             return False
     
+    def start_warmup(self):
+        """Run one dummy inference per model in the background to absorb cold-start costs."""
+        self.warmed_up.clear()
+        self.warmup_thread = threading.Thread(target=self.warmup, name="model-warmup", daemon=True)
+        self.warmup_thread.start()
+    
+    def warmup(self):
+        start = time.perf_counter()
+        try:
+            # Dummy inputs at each stage's working size, so predictor setup, kernel selection
+            # and allocator growth happen here rather than on the first scan.
+            for model, stage in ((self.severity_model, 'severity'), (self.lesion_model, 'lesion'),
+                                 (self.macula_model, 'macula')):
+                if model is None:
+                    continue
+                size = WORKING_RESOLUTIONS[stage]
+                try:
+                    model(np.zeros((size, size, 3), dtype=np.uint8), verbose=False)
+                except Exception as e:
+                    print(f"Warm-up failed for the {stage} model: {e}")
+            
+            if self.vessel_model is not None:
+                device = next(self.vessel_model.parameters()).device
+                try:
+                    with torch.inference_mode():
+                        self.vessel_model(torch.zeros((1, 3, 512, 512), device=device))
+                except Exception as e:
+                    print(f"Warm-up failed for the vessel model: {e}")
+        finally:
+            self.warmed_up.set()
+        print(f"Models warmed up in {time.perf_counter() - start:.1f}s")
+    
+    def wait_until_warm(self, timeout=None):
+        """Block until warm-up has finished, so real inference never runs alongside it."""
+        return self.warmed_up.wait(timeout)
+    
+    def model_versions(self):
+        """Identify each model by file name, modification time and size, for result provenance."""
+        paths = {
+            'severity': SEVERITY_MODEL_PATH,
+            'lesion': LESION_MODEL_PATH,
+            'macula': MACULA_MODEL_PATH,
+            'vessel': VESSEL_MODEL_PATH,
+        }
+        versions = {}
+        for name, path in paths.items():
+            if os.path.exists(path):
+                stat = os.stat(path)
+                versions[name] = f"{os.path.basename(path)}@{int(stat.st_mtime)}:{stat.st_size}"
+        return versions
+    
     def get_severity_model(self):
         return self.severity_model
     
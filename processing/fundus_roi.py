@@ -0,0 +1,83 @@
+import cv2
+import numpy as np
+from config import FUNDUS_PROBE_SIZE, FUNDUS_THRESHOLD, FUNDUS_MARGIN
+
+class FundusROI:
+    """Bounding box of the circular field of view plus its circle, in original pixels."""
+
+    def __init__(self, x1, y1, x2, y2, image_shape, center=None, radius=None):
+        self.x1, self.y1, self.x2, self.y2 = int(x1), int(y1), int(x2), int(y2)
+        self.image_shape = tuple(image_shape[:2])
+        h, w = self.image_shape
+        self.center = center if center is not None else ((x1 + x2) / 2.0, (y1 + y2) / 2.0)
+        self.radius = radius if radius is not None else max(w, h)
+
+    @classmethod
+    def full_frame(cls, image_shape):
+        h, w = image_shape[:2]
+        return cls(0, 0, w, h, image_shape)
+
+    @property
+    def offset(self):
+        return self.x1, self.y1
+
+    @property
+    def size(self):
+        return self.x2 - self.x1, self.y2 - self.y1
+
+    def is_full_frame(self):
+        h, w = self.image_shape
+        return self.x1 == 0 and self.y1 == 0 and self.x2 == w and self.y2 == h
+
+    def crop(self, img):
+        if self.is_full_frame():
+            return img
+        return np.ascontiguousarray(img[self.y1:self.y2, self.x1:self.x2])
+
+    def fov_mask(self, scale=1.0, shape=None):
+        """Mask (uint8) of pixels inside the circular field of view, for the crop at the given scale."""
+        if shape is None:
+            w, h = self.size
+            shape = (max(1, int(round(h * scale))), max(1, int(round(w * scale))))
+        mask = np.zeros(shape[:2], dtype=np.uint8)
+        cx, cy = self.center
+        center = (int(round((cx - self.x1) * scale)), int(round((cy - self.y1) * scale)))
+        cv2.circle(mask, center, int(round(self.radius * scale)), 1, -1)
+        return mask
+
+    def paste_mask(self, crop_mask):
+        """Place a crop-sized mask into a zeroed full-frame mask."""
+        if self.is_full_frame():
+            return crop_mask
+        full = np.zeros(self.image_shape + crop_mask.shape[2:], dtype=crop_mask.dtype)
+        full[self.y1:self.y2, self.x1:self.x2] = crop_mask
+        return full
+
+def detect_fundus_roi(img, probe_size=FUNDUS_PROBE_SIZE, threshold=FUNDUS_THRESHOLD, margin=FUNDUS_MARGIN):
+    """Locate the retina's circular field of view on a low-resolution probe."""
+    h, w = img.shape[:2]
+    scale = min(1.0, probe_size / max(h, w))
+    small = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    channel = small.max(axis=2) if small.ndim == 3 else small
+
+    mask = (channel > threshold).astype(np.uint8)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((5, 5), np.uint8))
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return FundusROI.full_frame(img.shape)
+
+    largest = max(contours, key=cv2.contourArea)
+    if cv2.contourArea(largest) < 0.1 * mask.size:
+        return FundusROI.full_frame(img.shape)
+
+    bx, by, bw, bh = cv2.boundingRect(largest)
+    (cx, cy), radius = cv2.minEnclosingCircle(largest)
+
+    pad = int(round(margin * max(h, w)))
+    x1 = max(0, int(bx / scale) - pad)
+    y1 = max(0, int(by / scale) - pad)
+    x2 = min(w, int((bx + bw) / scale) + pad)
+    y2 = min(h, int((by + bh) / scale) + pad)
+
+    return FundusROI(x1, y1, x2, y2, img.shape, center=(cx / scale, cy / scale), radius=radius / scale)
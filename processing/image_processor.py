@@ -1,22 +1,149 @@
 import cv2
 import numpy as np
 import math
-from config import SEVERITY_CLASSES, SEVERITY_COLORS, CLINICAL_NOTES
+import time
+from config import SEVERITY_CLASSES, SEVERITY_COLORS, CLINICAL_NOTES, FUNDUS_CROP_ENABLED, WORKING_RESOLUTIONS
+from config import SEVERITY_TTA_ENABLED, SEVERITY_TTA_MARGIN, SEVERITY_TTA_ROTATIONS
 from utils.helpers import add_severity_label, calculate_distance
+from processing.fundus_roi import FundusROI, detect_fundus_roi
+from processing.working_image import WorkingImageCache
+from utils.performance_profile import batch_size, stage_threads
+
+def parse_severity_result(result):
+    """Return (class_idx, confidence) from a YOLO classify or detect result, or None."""
+    if hasattr(result, 'probs') and result.probs is not None:
+        probs = result.probs.data.cpu().numpy()
+        class_idx = int(np.argmax(probs))
+        return class_idx, float(probs[class_idx])
+    
+    if hasattr(result, 'boxes') and result.boxes is not None and len(result.boxes) > 0:
+        boxes = result.boxes
+        max_conf_idx = np.argmax(boxes.conf.cpu().numpy())
+        class_idx = int(boxes.cls[max_conf_idx].item())
+        return class_idx, float(boxes.conf[max_conf_idx].item())
+    
+    return None
+
+def severity_probs(result):
+    """Class probabilities from a YOLO classify result, or None for detect results."""
+    if hasattr(result, 'probs') and result.probs is not None:
+        return result.probs.data.cpu().numpy()
+    return None
+
+def top_margin(probs):
+    """Difference between the two most likely classes."""
+    if len(probs) < 2:
+        return 1.0
+    top2 = np.partition(probs, -2)[-2:]
+    return float(top2[1] - top2[0])
+
+def tta_views(img, rotations=SEVERITY_TTA_ROTATIONS):
+    """Flipped and slightly rotated copies of img (the unmodified view is not included)."""
+    h, w = img.shape[:2]
+    views = [cv2.flip(img, 1), cv2.flip(img, 0)]
+    for angle in rotations:
+        matrix = cv2.getRotationMatrix2D((w / 2.0, h / 2.0), angle, 1.0)
+        views.append(cv2.warpAffine(img, matrix, (w, h), flags=cv2.INTER_LINEAR, borderValue=(0, 0, 0)))
+    return views
+
+def locate_working_images(img):
+    """Working-image cache cropped to the fundus the same way analyze_image crops it."""
+    roi = detect_fundus_roi(img) if FUNDUS_CROP_ENABLED else FundusROI.full_frame(img.shape)
+    return WorkingImageCache(img, roi)
+
+def severity_tta_probs(model, img, probs):
+    """Average probs over the first pass and all augmented views; returns (probs, views averaged).
+    
+    Views are scored in one batch unless the performance profile tuned a smaller severity batch.
+    """
+    views = tta_views(img)
+    step = batch_size('severity', default=len(views))
+    results = []
+    for start in range(0, len(views), step):
+        results.extend(model(views[start:start + step], verbose=False))
+    view_probs = [p for p in (severity_probs(r) for r in results) if p is not None]
+    if not view_probs:
+        return probs, 0
+    return np.mean([probs] + view_probs, axis=0), len(view_probs) + 1
+
+def predict_severity(model, img):
+    """(class_idx, confidence, tta_views) for a severity working image, or None."""
+    with stage_threads('severity'):
+        results = model(img, verbose=False)
+        if not results:
+            return None
+        return severity_from_result(model, img, results[0])
+
+def severity_from_result(model, img, result):
+    """predict_severity for a result already computed, e.g. as part of a batch.
+    
+    Borderline classify results are re-scored with test-time augmentation.
+    """
+    probs = severity_probs(result)
+    if probs is None:
+        parsed = parse_severity_result(result)
+        return None if parsed is None else (parsed[0], parsed[1], 0)
+    
+    views = 0
+    if SEVERITY_TTA_ENABLED and top_margin(probs) < SEVERITY_TTA_MARGIN:
+        probs, views = severity_tta_probs(model, img, probs)
+    class_idx = int(np.argmax(probs))
+    return class_idx, float(probs[class_idx]), views
+
+def predict_lesions(model, img, transform):
+    """Lesion dicts for a lesion working image, with boxes mapped back to original pixels."""
+    with stage_threads('lesion'):
+        results = model(img, verbose=False)
+    if not results:
+        return []
+    return lesions_from_result(results[0], model.names, transform)
+
+def lesions_from_result(result, names, transform):
+    """predict_lesions for a result already computed, e.g. as part of a batch."""
+    boxes = parse_lesion_boxes(result, names)
+    for lesion in boxes:
+        lesion["box"] = transform.to_original_box(lesion["box"])
+    return boxes
+
+def parse_lesion_boxes(result, names):
+    """Return lesion dicts with pixel "box", "class" and "confidence" from a YOLO detect result."""
+    boxes = []
+    if hasattr(result, 'boxes') and result.boxes is not None:
+        for box in result.boxes:
+            xyxy = box.xyxy.cpu().numpy().squeeze().astype(int)
+            x1, y1, x2, y2 = xyxy
+            
+            cls_idx = int(box.cls.item())
+            cls_name = names.get(cls_idx, f"Lesion_{cls_idx}")
+            confidence = float(box.conf.item())
+            
+            boxes.append({
+                "box": [x1, y1, x2, y2], 
+                "class": cls_name,
+                "class_id": cls_idx,
+                "confidence": confidence
+            })
+    return boxes
 
 class ImageProcessor:
     def __init__(self, model_loader):
+        self.model_loader = model_loader
         self.models = model_loader.get_all_models()
         self.current_state = {
             'uploaded_img': None,
-            'original_img': None,
             'display_img': None,
             'current_severity': "No_DR",
             'current_confidence': 0.0,
             'current_lesions': [],
             'heatmap_overlay': None,
+            'fundus_roi': None,
+            'working_images': None,
+            'display_transform': None,
             'vessel_mask': None,
             'vessel_density': 0.0,
+            'vessel_morphometry': None,
+            'timings': {},
+            'severity_tta_views': 0,
             'macula_disc_boxes': [],
             'optic_disc_diameter_pixels': 0,
             'disc_center': None,
@@ -48,54 +175,71 @@ class ImageProcessor:
     
     def set_image(self, img):
         self.current_state['uploaded_img'] = img
-        self.current_state['original_img'] = img.copy()
-        self.current_state['display_img'] = img.copy()
+        self.current_state['fundus_roi'] = None
+        self.current_state['working_images'] = WorkingImageCache(img)
+        
+        display_img, display_transform = self.current_state['working_images'].get(
+            WORKING_RESOLUTIONS['display'], use_roi=False
+        )
+        self.current_state['display_img'] = display_img.copy()
+        self.current_state['display_transform'] = display_transform
     
     def analyze_image(self):
         if self.current_state['uploaded_img'] is None:
             return "No image loaded"
         
+        # YOLO predictors are not thread-safe; let the background warm-up finish first.
+        self.model_loader.wait_until_warm()
+        
         # Run all analysis steps
-        self.classify_severity()
-        self.detect_lesions()
-        self.detect_macula_disc()
-        self.generate_heatmap()
+        timings = {}
+        for stage, step in (('roi', self.locate_fundus), ('severity', self.classify_severity),
+                            ('lesion', self.detect_lesions), ('macula', self.detect_macula_disc),
+                            ('heatmap', self.generate_heatmap)):
+            start = time.perf_counter()
+            step()
+            timings[stage] = round((time.perf_counter() - start) * 1000.0, 1)
+        self.current_state['timings'] = timings
         
         return self.generate_analysis_report()
     
+    def locate_fundus(self):
+        """Find the field of view once so every model sees only the retina."""
+        working_images = locate_working_images(self.current_state['uploaded_img'])
+        self.current_state['fundus_roi'] = working_images.roi
+        self.current_state['working_images'] = working_images
+    
+    def get_roi(self):
+        if self.current_state['fundus_roi'] is None:
+            self.locate_fundus()
+        return self.current_state['fundus_roi']
+    
+    def get_working_images(self):
+        self.get_roi()
+        return self.current_state['working_images']
+    
+    def get_working_image(self, stage):
+        """Return (image, transform) for a stage at its configured working resolution."""
+        return self.get_working_images().get(WORKING_RESOLUTIONS[stage])
+    
     def classify_severity(self):
-        img = self.current_state['uploaded_img']
+        img, _ = self.get_working_image('severity')
         model = self.models['severity']
         
+        self.current_state['severity_tta_views'] = 0
         if not model:
             self.current_state['current_severity'] = "No_DR"
             self.current_state['current_confidence'] = 0.0
             return
         
         try:
-            results = model(img, verbose=False)
-            
-            if results and len(results) > 0:
-                result = results[0]
-                
-                if hasattr(result, 'probs') and result.probs is not None:
-                    probs = result.probs.data.cpu().numpy()
-                    class_idx = np.argmax(probs)
-                    confidence = float(probs[class_idx])
-                    
-                    if class_idx < len(SEVERITY_CLASSES):
-                        self.current_state['current_severity'] = SEVERITY_CLASSES[class_idx]
-                        self.current_state['current_confidence'] = confidence
-                
-                elif hasattr(result, 'boxes') and result.boxes is not None and len(result.boxes) > 0:
-                    boxes = result.boxes
-                    max_conf_idx = np.argmax(boxes.conf.cpu().numpy())
-                    class_idx = int(boxes.cls[max_conf_idx].item())
-                    confidence = float(boxes.conf[max_conf_idx].item())
-                    
-                    if class_idx < len(SEVERITY_CLASSES):
-                        self.current_state['current_severity'] = SEVERITY_CLASSES[class_idx]
-                        self.current_state['current_confidence'] = confidence
+            parsed = predict_severity(model, img)
+            if parsed is not None:
+                class_idx, confidence, views = parsed
+                if class_idx < len(SEVERITY_CLASSES):
+                    self.current_state['current_severity'] = SEVERITY_CLASSES[class_idx]
+                    self.current_state['current_confidence'] = confidence
+                    self.current_state['severity_tta_views'] = views
             
         except Exception as e:
             print(f"Error classifying severity: {e}")
@@ -103,7 +247,7 @@ class ImageProcessor:
             self.current_state['current_confidence'] = 0.0
     
     def detect_lesions(self):
-        img = self.current_state['uploaded_img']
+        img, transform = self.get_working_image('lesion')
         model = self.models['lesion']
         boxes = []
         
@@ -112,33 +256,14 @@ class ImageProcessor:
             return
         
         try:
-            results = model(img, verbose=False)
-            
-            if results and len(results) > 0:
-                result = results[0]
-                if hasattr(result, 'boxes') and result.boxes is not None:
-                    for box in result.boxes:
-                        xyxy = box.xyxy.cpu().numpy().squeeze().astype(int)
-                        x1, y1, x2, y2 = xyxy
-                        
-                        cls_idx = int(box.cls.item())
-                        cls_name = model.names.get(cls_idx, f"Lesion_{cls_idx}")
-                        confidence = float(box.conf.item())
-                        
-                        boxes.append({
-                            "box": [x1, y1, x2, y2], 
-                            "class": cls_name,
-                            "confidence": confidence
-                        })
-            
-            self.current_state['current_lesions'] = boxes
+            self.current_state['current_lesions'] = predict_lesions(model, img, transform)
         
         except Exception as e:
             print(f"Error detecting lesions: {e}")
             self.current_state['current_lesions'] = []
     
     def detect_macula_disc(self):
-        img = self.current_state['uploaded_img']
+        img, transform = self.get_working_image('macula')
         model = self.models['macula']
         
         self.current_state['macula_disc_boxes'] = []
@@ -150,7 +275,8 @@ class ImageProcessor:
             return
         
         try:
-            results = model(img, verbose=False)
+            with stage_threads('macula'):
+                results = model(img, verbose=False)
             
             if results and len(results) > 0:
                 result = results[0]
@@ -161,8 +287,8 @@ class ImageProcessor:
                     max_disc_conf = 0
                     
                     for box in result.boxes:
-                        xyxy = box.xyxy.cpu().numpy().squeeze().astype(int)
-                        x1, y1, x2, y2 = xyxy
+                        xyxy = box.xyxy.cpu().numpy().squeeze()
+                        x1, y1, x2, y2 = transform.to_original_box(xyxy)
                         
                         cls_idx = int(box.cls.item())
                         cls_name = model.names.get(cls_idx, f"Class_{cls_idx}")
@@ -190,9 +316,10 @@ class ImageProcessor:
                                     "class": cls_name,
                                     "confidence": confidence
                                 }
-                            width = x2 - x1
-                            height = y2 - y1
-                            self.current_state['optic_disc_diameter_pixels'] = int(max(width, height) * 1.5)
+                            working_size = max(xyxy[2] - xyxy[0], xyxy[3] - xyxy[1])
+                            self.current_state['optic_disc_diameter_pixels'] = int(
+                                transform.to_original_length(working_size) * 1.5
+                            )
                             self.current_state['disc_center'] = ((x1 + x2) // 2, (y1 + y2) // 2)
                     
                     if macula_box:
@@ -204,32 +331,35 @@ class ImageProcessor:
             print(f"Error detecting macula/disc: {e}")
     
     def generate_heatmap(self):
-        img = self.current_state['uploaded_img']
+        """Build the lesion heatmap at display resolution."""
+        img = self.current_state['display_img']
+        transform = self.current_state['display_transform']
         h, w = img.shape[:2]
         heatmap = np.zeros((h, w, 3), dtype=np.uint8)
         
         for lesion in self.current_state['current_lesions']:
-            x1, y1, x2, y2 = lesion["box"]
+            x1, y1, x2, y2 = transform.to_working_box(lesion["box"])
             center_x, center_y = (x1 + x2) // 2, (y1 + y2) // 2
             radius = max((x2 - x1) // 2, (y2 - y1) // 2)
             
             cv2.circle(heatmap, (center_x, center_y), radius * 2, (0, 0, 255), -1)
         
-        heatmap = cv2.GaussianBlur(heatmap, (51, 51), 0)
+        kernel = max(3, int(51 * transform.scale) | 1)
+        heatmap = cv2.GaussianBlur(heatmap, (kernel, kernel), 0)
         heatmap = cv2.normalize(heatmap, None, 0, 255, cv2.NORM_MINMAX)
         self.current_state['heatmap_overlay'] = heatmap
     
     def generate_analysis_report(self):
         report_text = f"=== RETINA ANALYSIS REPORT ===\n\n"
         report_text += f"SEVERITY: {self.current_state['current_severity']}\n"
-        report_text += f"Confidence: {self.current_state['current_confidence']:.1%}\n\n"
+        report_text += f"Confidence: {self.current_state['current_confidence']:.1%}\n"
+        if self.current_state['severity_tta_views']:
+            report_text += f"Borderline call: averaged over {self.current_state['severity_tta_views']} augmented views\n"
+        report_text += "\n"
         
         if self.current_state['current_lesions']:
             report_text += "LESIONS DETECTED:\n"
-            lesion_counts = {}
-            for lesion in self.current_state['current_lesions']:
-                lesion_type = lesion['class']
-                lesion_counts[lesion_type] = lesion_counts.get(lesion_type, 0) + 1
+            lesion_counts, _ = self.lesion_summary()
             
             for lesion_type, count in lesion_counts.items():
                 report_text += f"  {lesion_type}: {count}\n"
@@ -239,16 +369,12 @@ class ImageProcessor:
             if (self.current_state['macula_center'] is not None and 
                 self.current_state['optic_disc_diameter_pixels'] > 0):
                 report_text += "\nLESION DISTANCES FROM MACULA:\n"
-                radius_1dd = self.current_state['optic_disc_diameter_pixels'] / 2
                 
                 lesions_in_1dd = 0
                 for lesion in self.current_state['current_lesions']:
-                    x1, y1, x2, y2 = lesion["box"]
-                    lesion_center = ((x1 + x2) // 2, (y1 + y2) // 2)
-                    distance_pixels = calculate_distance(lesion_center, self.current_state['macula_center'])
-                    distance_DD = distance_pixels / self.current_state['optic_disc_diameter_pixels']
+                    distance_DD = self.lesion_distance_dd(lesion)
                     
-                    if distance_pixels <= radius_1dd:
+                    if distance_DD <= 0.5:
                         lesions_in_1dd += 1
                         report_text += f"  {lesion['class']}: {distance_DD:.2f} DD (INSIDE 1DD CIRCLE)\n"
                 
@@ -289,12 +415,43 @@ class ImageProcessor:
                 vessel_status = "High density - monitor closely"
             
             report_text += f"  Status: {vessel_status}\n"
+            
+            morphometry = self.current_state['vessel_morphometry']
+            if morphometry:
+                report_text += f"  Vessel length: {morphometry['length_px']:.0f} px "
+                report_text += f"({morphometry['length_density'] * 1000:.2f} px per 1000 px² of field)\n"
+                report_text += f"  Branch points: {morphometry['branch_points']}, "
+                report_text += f"segments: {morphometry['segments']}\n"
+                report_text += f"  Tortuosity (arc/chord): mean {morphometry['tortuosity_mean']:.3f}, "
+                report_text += f"90th pct {morphometry['tortuosity_p90']:.3f}\n"
+                report_text += f"  Caliber: mean {morphometry['caliber_mean_px']:.1f} px, "
+                report_text += f"90th pct {morphometry['caliber_p90_px']:.1f} px\n"
         
         report_text += "\n=== CLINICAL SUMMARY ===\n"
         report_text += CLINICAL_NOTES.get(self.current_state['current_severity'], "Consult ophthalmologist.")
         
         return report_text
     
+    def lesion_distance_dd(self, lesion):
+        """Distance from the lesion centre to the macula in disc diameters, or None if unknown."""
+        disc_diameter = self.current_state['optic_disc_diameter_pixels']
+        if self.current_state['macula_center'] is None or disc_diameter <= 0:
+            return None
+        x1, y1, x2, y2 = lesion["box"]
+        lesion_center = ((x1 + x2) // 2, (y1 + y2) // 2)
+        return calculate_distance(lesion_center, self.current_state['macula_center']) / disc_diameter
+    
+    def lesion_summary(self):
+        """Per-class lesion counts and the number of lesions inside the 1 DD circle around the macula."""
+        lesion_counts = {}
+        lesions_in_1dd = 0
+        for lesion in self.current_state['current_lesions']:
+            lesion_counts[lesion['class']] = lesion_counts.get(lesion['class'], 0) + 1
+            distance_DD = self.lesion_distance_dd(lesion)
+            if distance_DD is not None and distance_DD <= 0.5:
+                lesions_in_1dd += 1
+        return lesion_counts, lesions_in_1dd
+    
     def get_state(self):
         return self.current_state
     
@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+
+CACHED_SHAPES = 2
+
+class PackedMask:
+    """Binary mask stored one bit per pixel, placed inside a region of a larger frame.
+
+    The mask is kept at the resolution it was computed at, covering the
+    region (x1, y1, x2, y2) of a frame of frame_shape. unpack() rebuilds a
+    full-frame boolean mask at any size, and remembers the last few sizes
+    asked for so redraws don't unpack again.
+    """
+
+    def __init__(self, mask, region=None, frame_shape=None):
+        self.shape = mask.shape[:2]
+        self.frame_shape = tuple(frame_shape[:2]) if frame_shape is not None else self.shape
+        self.region = tuple(region) if region is not None else (0, 0, self.frame_shape[1], self.frame_shape[0])
+        self.bits = np.packbits(mask.ravel() > 0)
+        self.cache = {}
+
+    @classmethod
+    def from_roi(cls, mask, roi):
+        return cls(mask, (roi.x1, roi.y1, roi.x2, roi.y2), roi.image_shape)
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def mask(self):
+        """The stored mask at its own resolution, as bool."""
+        return np.unpackbits(self.bits, count=self.shape[0] * self.shape[1]).reshape(self.shape).astype(bool)
+
+    def unpack(self, shape=None):
+        """Full-frame bool mask at the given (h, w), defaulting to the frame's own size."""
+        shape = tuple(shape[:2]) if shape is not None else self.frame_shape
+        if shape in self.cache:
+            return self.cache[shape]
+
+        fh, fw = self.frame_shape
+        sx, sy = shape[1] / fw, shape[0] / fh
+        x1, y1, x2, y2 = self.region
+        x1, x2 = int(round(x1 * sx)), int(round(x2 * sx))
+        y1, y2 = int(round(y1 * sy)), int(round(y2 * sy))
+
+        local = self.mask().view(np.uint8)
+        if local.shape != (y2 - y1, x2 - x1):
+            local = cv2.resize(local, (max(1, x2 - x1), max(1, y2 - y1)), interpolation=cv2.INTER_NEAREST)
+
+        if (x1, y1, x2, y2) == (0, 0, shape[1], shape[0]):
+            full = local.view(bool)
+        else:
+            full = np.zeros(shape, dtype=bool)
+            full[y1:y2, x1:x2] = local[:y2 - y1, :x2 - x1].view(bool)
+
+        if len(self.cache) >= CACHED_SHAPES:
+            self.cache.pop(next(iter(self.cache)))
+        self.cache[shape] = full
+        return full
@@ -0,0 +1,153 @@
+import os
+import abc
+import csv
+import json
+from datetime import datetime, timezone
+
+TIMING_STAGES = ('roi', 'severity', 'lesion', 'macula', 'heatmap', 'vessel')
+
+BASE_COLUMNS = (
+    'source', 'analyzed_at', 'severity', 'severity_confidence', 'severity_tta_views',
+    'lesions_total', 'lesions_within_1dd', 'optic_disc_diameter_px',
+    'vessel_density', 'vessel_length_density', 'vessel_branch_points',
+    'vessel_tortuosity', 'vessel_caliber_px',
+)
+
+def lesion_column(lesion_class):
+    return f"lesion_{lesion_class}"
+
+def record_columns(lesion_classes=()):
+    """Fixed column order for a run: base fields, one count per lesion class, then stage timings."""
+    return (list(BASE_COLUMNS) + [lesion_column(c) for c in lesion_classes]
+            + [f"{stage}_ms" for stage in TIMING_STAGES] + ['total_ms'])
+
+def build_analysis_record(image_processor, source=None, lesion_classes=()):
+    """Flat, JSON-serialisable summary of the scan held in image_processor.current_state."""
+    state = image_processor.current_state
+    lesion_counts, lesions_in_1dd = image_processor.lesion_summary()
+    morphometry = state['vessel_morphometry'] or {}
+    timings = state['timings'] or {}
+
+    record = {
+        'source': source,
+        'analyzed_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'severity': state['current_severity'],
+        'severity_confidence': round(float(state['current_confidence']), 4),
+        'severity_tta_views': int(state['severity_tta_views']),
+        'lesions_total': len(state['current_lesions']),
+        'lesions_within_1dd': lesions_in_1dd,
+        'optic_disc_diameter_px': int(state['optic_disc_diameter_pixels']),
+        'vessel_density': round(float(state['vessel_density']), 3),
+        'vessel_length_density': round(float(morphometry.get('length_density', 0.0)), 6),
+        'vessel_branch_points': int(morphometry.get('branch_points', 0)),
+        'vessel_tortuosity': float(morphometry.get('tortuosity_mean', 0.0)),
+        'vessel_caliber_px': float(morphometry.get('caliber_mean_px', 0.0)),
+    }
+    for lesion_class in lesion_classes:
+        record[lesion_column(lesion_class)] = 0
+    for lesion_class, count in lesion_counts.items():
+        record[lesion_column(lesion_class)] = count
+    for stage in TIMING_STAGES:
+        record[f"{stage}_ms"] = timings.get(stage, 0.0)
+    record['total_ms'] = round(sum(timings.get(stage, 0.0) for stage in TIMING_STAGES), 1)
+    return record
+
+class RecordWriter(abc.ABC):
+    """Writes one record at a time; nothing but the current buffer is held in memory."""
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = list(columns)
+        self.count = 0
+
+    @abc.abstractmethod
+    def write(self, record):
+        """Write one record; keys missing from it are left empty."""
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CsvRecordWriter(RecordWriter):
+    def __init__(self, path, columns):
+        super().__init__(path, columns)
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=self.columns, extrasaction="ignore", restval="")
+        self.writer.writeheader()
+
+    def write(self, record):
+        self.writer.writerow(record)
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+class JsonlRecordWriter(RecordWriter):
+    def __init__(self, path, columns):
+        super().__init__(path, columns)
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, record):
+        self.file.write(json.dumps({c: record.get(c) for c in self.columns}) + "\n")
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+class ParquetRecordWriter(RecordWriter):
+    """Buffers row_group_size records and writes each buffer as one Parquet row group."""
+
+    def __init__(self, path, columns, row_group_size=4096):
+        super().__init__(path, columns)
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet export requires pyarrow (pip install pyarrow)") from e
+        self.pa = pa
+        self.row_group_size = row_group_size
+        self.rows = []
+        self.schema = pa.schema([(c, self.column_type(c)) for c in self.columns])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def column_type(self, column):
+        if column in ('source', 'analyzed_at', 'severity'):
+            return self.pa.string()
+        if column.startswith('lesion') or column in ('severity_tta_views', 'optic_disc_diameter_px', 'vessel_branch_points'):
+            return self.pa.int64()
+        return self.pa.float64()
+
+    def write(self, record):
+        self.rows.append({c: record.get(c) for c in self.columns})
+        self.count += 1
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+RECORD_WRITERS = {
+    'csv': CsvRecordWriter,
+    'jsonl': JsonlRecordWriter,
+    'parquet': ParquetRecordWriter,
+}
+
+def open_record_writer(path, columns, fmt=None):
+    """Pick a writer from fmt, or from the file extension (.csv, .jsonl, .parquet)."""
+    if fmt is None:
+        fmt = os.path.splitext(path)[1].lstrip(".").lower()
+        fmt = {'json': 'jsonl', 'ndjson': 'jsonl', 'pq': 'parquet'}.get(fmt, fmt)
+    if fmt not in RECORD_WRITERS:
+        raise ValueError(f"Unsupported export format: {fmt} (expected one of {', '.join(RECORD_WRITERS)})")
+    return RECORD_WRITERS[fmt](path, columns)
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from config import SEVERITY_CLASSES
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS analyses ("
+    "id INTEGER PRIMARY KEY, image_hash TEXT NOT NULL, source TEXT, analyzed_at TEXT NOT NULL, "
+    "severity TEXT NOT NULL, severity_rank INTEGER NOT NULL, confidence REAL NOT NULL, "
+    "lesions_total INTEGER NOT NULL, lesions_within_1dd INTEGER NOT NULL, disc_diameter_px INTEGER NOT NULL, "
+    "vessel_density REAL NOT NULL, model_versions TEXT, settings TEXT, findings TEXT)",
+    "CREATE INDEX IF NOT EXISTS idx_analyses_severity ON analyses(severity_rank, analyzed_at)",
+    "CREATE INDEX IF NOT EXISTS idx_analyses_lesions ON analyses(lesions_total)",
+    "CREATE INDEX IF NOT EXISTS idx_analyses_lesions_1dd ON analyses(lesions_within_1dd)",
+    "CREATE INDEX IF NOT EXISTS idx_analyses_vessel_density ON analyses(vessel_density)",
+    "CREATE INDEX IF NOT EXISTS idx_analyses_date ON analyses(analyzed_at)",
+    "CREATE INDEX IF NOT EXISTS idx_analyses_image ON analyses(image_hash)",
+)
+
+COLUMNS = ("image_hash", "source", "analyzed_at", "severity", "severity_rank", "confidence",
+           "lesions_total", "lesions_within_1dd", "disc_diameter_px", "vessel_density",
+           "model_versions", "settings", "findings")
+
+# Record fields that have their own indexed column; everything else goes into the findings JSON.
+INDEXED_FIELDS = {
+    'source', 'analyzed_at', 'severity', 'severity_confidence', 'lesions_total',
+    'lesions_within_1dd', 'optic_disc_diameter_px', 'vessel_density',
+}
+
+def image_hash(img):
+    """Content hash of the decoded pixels, so re-encoded copies of a scan still match."""
+    digest = hashlib.sha1(str(img.shape).encode("ascii"))
+    digest.update(img.data if img.flags["C_CONTIGUOUS"] else img.tobytes())
+    return digest.hexdigest()
+
+def severity_rank(severity):
+    return SEVERITY_CLASSES.index(severity) if severity in SEVERITY_CLASSES else -1
+
+def to_iso(value):
+    if value is None or isinstance(value, str):
+        return value
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat(timespec='seconds')
+
+class ResultsDatabase:
+    """Local SQLite store of analysis results with indexed findings.
+
+    add() buffers rows and writes them in one transaction every batch_size
+    rows, or on flush()/close().
+    """
+
+    def __init__(self, path, batch_size=200):
+        self.path = path
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pending = []
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+        self.conn.commit()
+
+    def add(self, record, img_hash, model_versions=None, settings=None):
+        """Queue a record from build_analysis_record for insertion."""
+        findings = {k: v for k, v in record.items() if k not in INDEXED_FIELDS}
+        row = (
+            img_hash,
+            record.get('source'),
+            record.get('analyzed_at') or to_iso(datetime.now(timezone.utc)),
+            record['severity'],
+            severity_rank(record['severity']),
+            float(record['severity_confidence']),
+            int(record['lesions_total']),
+            int(record['lesions_within_1dd']),
+            int(record['optic_disc_diameter_px']),
+            float(record['vessel_density']),
+            json.dumps(model_versions or {}, sort_keys=True),
+            json.dumps(settings or {}, sort_keys=True),
+            json.dumps(findings, sort_keys=True),
+        )
+        with self.lock:
+            self.pending.append(row)
+            if len(self.pending) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO analyses ({', '.join(COLUMNS)}) VALUES ({placeholders})", self.pending
+            )
+        self.pending = []
+
+    def build_filters(self, severity=None, min_severity=None, min_lesions=None, max_lesions=None,
+                      min_lesions_1dd=None, min_vessel_density=None, max_vessel_density=None,
+                      since=None, until=None, image_hash=None):
+        clauses, params = [], []
+
+        def add(clause, value):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+
+        add("severity_rank = ?", severity_rank(severity) if severity is not None else None)
+        add("severity_rank >= ?", severity_rank(min_severity) if min_severity is not None else None)
+        add("lesions_total >= ?", min_lesions)
+        add("lesions_total <= ?", max_lesions)
+        add("lesions_within_1dd >= ?", min_lesions_1dd)
+        add("vessel_density >= ?", min_vessel_density)
+        add("vessel_density <= ?", max_vessel_density)
+        add("analyzed_at >= ?", to_iso(since))
+        add("analyzed_at < ?", to_iso(until))
+        add("image_hash = ?", image_hash)
+
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def query(self, limit=100, offset=0, newest_first=True, **filters):
+        """Analyses matching all given filters, as dicts with settings and findings decoded."""
+        where, params = self.build_filters(**filters)
+        order = "DESC" if newest_first else "ASC"
+        with self.lock:
+            self._flush()
+            rows = self.conn.execute(
+                f"SELECT * FROM analyses{where} ORDER BY analyzed_at {order} LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+
+        results = []
+        for row in rows:
+            result = dict(row)
+            for key in ("model_versions", "settings", "findings"):
+                result[key] = json.loads(result[key]) if result[key] else {}
+            results.append(result)
+        return results
+
+    def count(self, **filters):
+        where, params = self.build_filters(**filters)
+        with self.lock:
+            self._flush()
+            return self.conn.execute(f"SELECT COUNT(*) FROM analyses{where}", params).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.conn.close()
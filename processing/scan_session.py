@@ -0,0 +1,106 @@
+from collections import OrderedDict
+import numpy as np
+from processing.packed_mask import PackedMask
+from processing.working_image import WorkingImageCache
+
+# Entries of ImageProcessor.current_state that belong to one scan; the rest are view settings.
+SCAN_STATE_KEYS = (
+    'uploaded_img', 'display_img',
+    'current_severity', 'current_confidence', 'severity_tta_views', 'current_lesions',
+    'heatmap_overlay', 'fundus_roi', 'working_images', 'display_transform',
+    'vessel_mask', 'vessel_density', 'vessel_morphometry', 'timings',
+    'macula_disc_boxes', 'optic_disc_diameter_pixels', 'disc_center', 'macula_center',
+)
+
+def estimate_nbytes(value, seen=None):
+    """Approximate memory held by arrays reachable from value, counting shared arrays once."""
+    if seen is None:
+        seen = set()
+    if value is None or id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, PackedMask):
+        return value.nbytes + sum(estimate_nbytes(m, seen) for m in value.cache.values())
+    if isinstance(value, WorkingImageCache):
+        return estimate_nbytes(value.img, seen) + sum(estimate_nbytes(img, seen) for img, _ in value.cache.values())
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(v, seen) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(v, seen) for v in value)
+    return 0
+
+class ScanSession:
+    """Everything needed to show an analyzed scan again without re-running the models."""
+
+    def __init__(self, path, state, report):
+        self.path = path
+        self.state = state
+        self.report = report
+        self.nbytes = estimate_nbytes(state)
+
+    def measure(self):
+        """Re-estimate nbytes; mask unpacks and working images are added after capture."""
+        self.nbytes = estimate_nbytes(self.state)
+        return self.nbytes
+
+    @classmethod
+    def capture(cls, path, current_state, report):
+        return cls(path, {key: current_state[key] for key in SCAN_STATE_KEYS}, report)
+
+    def restore(self, current_state):
+        current_state.update(self.state)
+
+    @property
+    def severity(self):
+        return self.state['current_severity']
+
+class SessionCache:
+    """LRU of ScanSessions bounded by an approximate memory budget.
+
+    The most recently used session is never evicted, even if it alone is
+    over budget, so the scan on screen always stays cached. Sessions keep
+    growing while shown, so sizes are re-measured on get and put.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.sessions = OrderedDict()
+        self.total_bytes = 0
+
+    def __contains__(self, path):
+        return path in self.sessions
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, path):
+        session = self.sessions.get(path)
+        if session is not None:
+            self.sessions.move_to_end(path)
+            self.total_bytes -= session.nbytes
+            self.total_bytes += session.measure()
+        return session
+
+    def put(self, session):
+        self.discard(session.path)
+        self.sessions[session.path] = session
+        self.total_bytes = sum(s.measure() for s in self.sessions.values())
+
+        evicted = []
+        while self.total_bytes > self.budget_bytes and len(self.sessions) > 1:
+            path, old = self.sessions.popitem(last=False)
+            self.total_bytes -= old.nbytes
+            evicted.append(path)
+        return evicted
+
+    def discard(self, path):
+        old = self.sessions.pop(path, None)
+        if old is not None:
+            self.total_bytes -= old.nbytes
+
+    def clear(self):
+        self.sessions.clear()
+        self.total_bytes = 0
@@ -0,0 +1,194 @@
+import cv2
+import numpy as np
+
+MIN_SEGMENT_LENGTH = 10.0
+
+# Neighbour order P2..P9 (clockwise from north), as used by Zhang-Suen thinning.
+_NEIGHBOUR_STEPS = ((-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1))
+
+def _ring_components(code):
+    """Number of 8-connected groups among the set neighbours, i.e. branches leaving the pixel.
+
+    Around the ring consecutive neighbours touch, and so do edge neighbours
+    two steps apart (N and E, say) through the corner between them.
+    """
+    groups = 0
+    seen = set()
+    for start in range(8):
+        if not (code >> start) & 1 or start in seen:
+            continue
+        groups += 1
+        stack = [start]
+        while stack:
+            i = stack.pop()
+            if i in seen:
+                continue
+            seen.add(i)
+            steps = (1, 7, 2, 6) if i % 2 == 0 else (1, 7)
+            stack.extend(j for j in ((i + step) % 8 for step in steps) if (code >> j) & 1)
+    return groups
+
+def _build_thinning_luts():
+    """Tables indexed by the 8-neighbour code.
+
+    Returns the deletion tables for the two Zhang-Suen sub-iterations, the
+    neighbour count and the number of branches leaving the pixel.
+    """
+    codes = np.arange(256)
+    bits = (codes[:, None] >> np.arange(8)) & 1
+    p2, p3, p4, p5, p6, p7, p8, p9 = bits.T
+
+    count = bits.sum(axis=1)
+    transitions = ((bits == 0) & (np.roll(bits, -1, axis=1) == 1)).sum(axis=1)
+    base = (count >= 2) & (count <= 6) & (transitions == 1)
+
+    first = base & (p2 * p4 * p6 == 0) & (p4 * p6 * p8 == 0)
+    second = base & (p2 * p4 * p8 == 0) & (p2 * p6 * p8 == 0)
+    branches = np.array([_ring_components(code) for code in codes], dtype=np.uint8)
+    return first, second, count.astype(np.uint8), branches
+
+_THIN_FIRST, _THIN_SECOND, _NEIGHBOUR_COUNT, _BRANCHES = _build_thinning_luts()
+# Pixels whose neighbours stay connected without them, like the staircase corners Zhang-Suen leaves.
+_REDUNDANT = (_BRANCHES == 1) & (_NEIGHBOUR_COUNT >= 2)
+
+def _neighbour_codes(padded, idx):
+    width = padded.shape[1]
+    flat = padded.ravel()
+    codes = np.zeros(len(idx), dtype=np.int32)
+    for bit, (dy, dx) in enumerate(_NEIGHBOUR_STEPS):
+        codes |= flat[idx + dy * width + dx].astype(np.int32) << bit
+    return codes
+
+def skeletonize(binary_mask):
+    """One-pixel-wide centreline of a binary mask (Zhang-Suen).
+
+    Only foreground pixels are visited, so the cost follows the vessel area
+    rather than the image size.
+    """
+    padded = np.pad((binary_mask > 0).astype(np.uint8), 1)
+    idx = np.flatnonzero(padded)
+    flat = padded.ravel()
+
+    changed = True
+    while changed and len(idx):
+        changed = False
+        for lut in (_THIN_FIRST, _THIN_SECOND):
+            delete = lut[_neighbour_codes(padded, idx)]
+            if delete.any():
+                flat[idx[delete]] = 0
+                idx = idx[~delete]
+                changed = True
+
+    return prune_corners(padded)[1:-1, 1:-1]
+
+def prune_corners(padded):
+    """Delete redundant pixels so the skeleton is minimally 8-connected, in place.
+
+    Zhang-Suen leaves 4-connected staircase corners with three neighbours,
+    which would otherwise read as junctions. Pixels are visited in four
+    parity classes; pixels of one class never touch, so deleting them
+    together cannot disconnect the skeleton.
+    """
+    flat = padded.ravel()
+    width = padded.shape[1]
+    changed = True
+    while changed:
+        changed = False
+        for parity in ((0, 0), (0, 1), (1, 0), (1, 1)):
+            idx = np.flatnonzero(flat)
+            y, x = np.divmod(idx, width)
+            idx = idx[(y % 2 == parity[0]) & (x % 2 == parity[1])]
+            delete = _REDUNDANT[_neighbour_codes(padded, idx)]
+            if delete.any():
+                flat[idx[delete]] = 0
+                changed = True
+    return padded
+
+def measure_vessels(binary_mask, fov_mask=None, transform=None):
+    """Length density, branching, tortuosity and caliber from one skeleton pass.
+
+    The mask is at working resolution; lengths and calibers are reported in
+    original pixels via the working transform.
+    """
+    to_original = transform.to_original_length if transform is not None else (lambda v: v)
+    fov_area = int(np.count_nonzero(fov_mask)) if fov_mask is not None else binary_mask.size
+    fov_area_original = to_original(to_original(fov_area)) or 1.0
+
+    skeleton = skeletonize(binary_mask)
+    padded = np.pad(skeleton, 1)
+    width = padded.shape[1]
+    idx = np.flatnonzero(padded)
+    if not len(idx):
+        return empty_morphometry()
+
+    neighbours = _NEIGHBOUR_COUNT[_neighbour_codes(padded, idx)]
+    end_points = int(np.count_nonzero(neighbours == 1))
+
+    # With redundant corners pruned, three or more neighbours mark a junction; where branches
+    # cross in a 2x2 block no single pixel has three branches, so neighbours are counted instead.
+    # Adjacent junction pixels count as one branch point.
+    is_junction = neighbours >= 3
+    junctions = np.zeros_like(padded)
+    junctions.ravel()[idx[is_junction]] = 1
+    branch_points = cv2.connectedComponents(junctions, connectivity=8)[0] - 1
+
+    # Removing junctions splits the skeleton into unbranched segments.
+    segments = padded.copy()
+    segments.ravel()[idx[is_junction]] = 0
+    num_labels, labels = cv2.connectedComponents(segments, connectivity=8)
+    flat_labels = labels.ravel()
+    seg_idx = np.flatnonzero(flat_labels)
+    seg_labels = flat_labels[seg_idx]
+
+    # Arc length: each 8-connected link counted once (E, SE, S, SW), diagonals weigh sqrt(2).
+    arc = np.zeros(num_labels, dtype=np.float64)
+    for (dy, dx), weight in (((0, 1), 1.0), ((1, 1), np.sqrt(2)), ((1, 0), 1.0), ((1, -1), np.sqrt(2))):
+        linked = flat_labels[seg_idx + dy * width + dx] == seg_labels
+        arc += np.bincount(seg_labels[linked], minlength=num_labels) * weight
+
+    # Chord: straight-line distance between the two ends of each open segment.
+    seg_neighbours = _NEIGHBOUR_COUNT[_neighbour_codes(segments, seg_idx)]
+    tips = seg_neighbours <= 1
+    tip_labels = seg_labels[tips]
+    tip_y, tip_x = np.divmod(seg_idx[tips], width)
+    order = np.argsort(tip_labels, kind="stable")
+    tip_labels, tip_y, tip_x = tip_labels[order], tip_y[order], tip_x[order]
+    tip_counts = np.bincount(tip_labels, minlength=num_labels)
+    starts = np.concatenate(([0], np.cumsum(tip_counts)[:-1]))
+
+    open_segments = np.flatnonzero(tip_counts == 2)
+    first, last = starts[open_segments], starts[open_segments] + 1
+    chord = np.hypot(tip_y[last] - tip_y[first], tip_x[last] - tip_x[first])
+    usable = (chord >= MIN_SEGMENT_LENGTH) & (arc[open_segments] >= MIN_SEGMENT_LENGTH)
+    tortuosity = arc[open_segments][usable] / chord[usable]
+
+    # Caliber: twice the distance to background along the centreline.
+    distance = cv2.distanceTransform((binary_mask > 0).astype(np.uint8), cv2.DIST_L2, 3)
+    caliber = 2.0 * np.pad(distance, 1).ravel()[idx]
+
+    length = to_original(float(arc.sum()) + len(idx) - len(seg_idx))
+
+    return {
+        'length_px': round(length, 1),
+        'length_density': length / fov_area_original,
+        'branch_points': int(branch_points),
+        'end_points': end_points,
+        'segments': int(num_labels - 1),
+        'tortuosity_mean': round(float(tortuosity.mean()), 3) if len(tortuosity) else 0.0,
+        'tortuosity_p90': round(float(np.percentile(tortuosity, 90)), 3) if len(tortuosity) else 0.0,
+        'caliber_mean_px': round(to_original(float(caliber.mean())), 2),
+        'caliber_p90_px': round(to_original(float(np.percentile(caliber, 90))), 2),
+    }
+
+def empty_morphometry():
+    return {
+        'length_px': 0.0,
+        'length_density': 0.0,
+        'branch_points': 0,
+        'end_points': 0,
+        'segments': 0,
+        'tortuosity_mean': 0.0,
+        'tortuosity_p90': 0.0,
+        'caliber_mean_px': 0.0,
+        'caliber_p90_px': 0.0,
+    }
@@ -1,20 +1,84 @@
+import copy
+import threading
 import cv2
 import numpy as np
 import torch
-import albumentations as A
-from albumentations.pytorch import ToTensorV2
-from config import DEFAULT_VESSEL_SETTINGS
+from config import DEFAULT_VESSEL_SETTINGS, WORKING_RESOLUTIONS, VESSEL_FAST_RESOLUTION, VESSEL_HESSIAN_SIGMAS
+from processing.working_image import WorkingImageCache
+from processing.vessel_filters import segment_hessian
+from processing.vessel_morphometry import measure_vessels
+from processing.packed_mask import PackedMask
+from utils.performance_profile import apply_thread_settings, stage_threads
+
+ENHANCEMENT_SETTINGS = (
+    'enhance_brightness', 'enhance_contrast', 'enhance_gamma', 'clahe_clip',
+    'green_boost', 'denoise_strength', 'invert_image', 'equalize_hist',
+)
+
+# Settings that change the vessel mask for each method; the rest only change how it is drawn.
+UNET_MASK_SETTINGS = ENHANCEMENT_SETTINGS + ('threshold', 'post_process')
+CLASSIC_MASK_SETTINGS = ENHANCEMENT_SETTINGS + ('traditional_engine', 'fast_mode')
+HESSIAN_MASK_SETTINGS = ('clahe_clip', 'traditional_engine', 'fast_mode')
+
+UNET_INPUT_SIZE = 512
+UNET_MEAN = np.array((0.485, 0.456, 0.406), dtype=np.float32) * 255.0
+UNET_STD = np.array((0.229, 0.224, 0.225), dtype=np.float32) * 255.0
+
+class UnetBuffers:
+    """Input and output buffers reused by every UNet call, so no call pays for allocation.
+    
+    Copies made by with_settings share one instance; lock serializes its use.
+    """
+    
+    def __init__(self, device, size=UNET_INPUT_SIZE):
+        self.lock = threading.Lock()
+        self.size = size
+        self.resized = np.empty((size, size, 3), dtype=np.uint8)
+        if device.type == 'cuda':
+            self.host = torch.empty((1, 3, size, size), dtype=torch.float32).pin_memory()
+            self.input = torch.empty((1, 3, size, size), dtype=torch.float32, device=device)
+        else:
+            self.host = torch.empty((1, 3, size, size), dtype=torch.float32)
+            self.input = self.host
+        self.chw = self.host.numpy()[0]
+        self.prob = np.empty((size, size), dtype=np.float32)
+        self.prob_tensor = torch.from_numpy(self.prob)
+        self.output = None
+    
+    def load(self, bgr_img):
+        """Resize, convert BGR to RGB and normalize into the input tensor."""
+        cv2.resize(bgr_img, (self.size, self.size), dst=self.resized, interpolation=cv2.INTER_LINEAR)
+        for c in range(3):
+            np.subtract(self.resized[:, :, 2 - c], UNET_MEAN[c], out=self.chw[c], dtype=np.float32)
+            self.chw[c] *= 1.0 / UNET_STD[c]
+        if self.input is not self.host:
+            self.input.copy_(self.host, non_blocking=True)
+        return self.input
+    
+    def store(self, logits):
+        """Sigmoid of the first output channel into the reusable probability buffer."""
+        logits = logits[0, 0]
+        if logits.device.type == 'cpu':
+            torch.sigmoid(logits, out=self.prob_tensor)
+        else:
+            self.prob_tensor.copy_(torch.sigmoid(logits))
+        return self.prob
+    
+    def upsample(self, shape):
+        h, w = shape[:2]
+        if self.output is None or self.output.shape != (h, w):
+            self.output = np.empty((h, w), dtype=np.float32)
+        cv2.resize(self.prob, (w, h), dst=self.output, interpolation=cv2.INTER_LINEAR)
+        return self.output
 
 class VesselProcessor:
     def __init__(self, vessel_model=None):
         self.vessel_model = vessel_model
         self.settings = DEFAULT_VESSEL_SETTINGS.copy()
-        
-        self.unet_transform = A.Compose([
-            A.Resize(512, 512),
-            A.Normalize(mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225)),
-            ToTensorV2()
-        ])
+        apply_thread_settings()
+        self.unet_buffers = None
+        if vessel_model is not None:
+            self.unet_buffers = UnetBuffers(next(vessel_model.parameters()).device)
     
     def enhance_for_unet(self, img):
         try:
@@ -78,46 +142,49 @@ class VesselProcessor:
             print(f"Error enhancing image: {e}")
             return img
     
-    def segment_with_unet(self, img):
+    def segment_with_unet(self, img, roi=None, working=None, max_side=None):
         try:
             if self.vessel_model is None:
-                return None, 0.0
-            
-            enhanced_img = self.enhance_for_unet(img)
-            
-            img_rgb = cv2.cvtColor(enhanced_img, cv2.COLOR_BGR2RGB)
-            augmented = self.unet_transform(image=img_rgb)
-            img_tensor = augmented["image"].unsqueeze(0)
-            
-            device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-            img_tensor = img_tensor.to(device)
+                return None, 0.0, None
             
-            with torch.no_grad():
-                pred = torch.sigmoid(self.vessel_model(img_tensor))[0][0].cpu().numpy()
+            if working is None:
+                working = WorkingImageCache(img, roi)
+            img, transform = working.get(self.vessel_resolution(max_side))
             
-            pred = cv2.resize(pred, (img.shape[1], img.shape[0]), interpolation=cv2.INTER_LINEAR)
+            enhanced_img = self.enhance_for_unet(img)
             
-            binary_mask = (pred > self.settings['threshold']).astype(np.uint8) * 255
+            buffers = self.unet_buffers
+            with buffers.lock:
+                with torch.inference_mode(), stage_threads('vessel'):
+                    buffers.store(self.vessel_model(buffers.load(enhanced_img)))
+                pred = buffers.upsample(img.shape)
+                
+                binary_mask = np.greater(pred, self.settings['threshold']).view(np.uint8)
+                binary_mask *= 255
             
             if self.settings['post_process']:
                 binary_mask = self.post_process_mask(binary_mask)
             
-            color = (self.settings['color_b'], self.settings['color_g'], self.settings['color_r'])
-            overlay = np.zeros_like(img)
-            overlay[binary_mask > 0] = color
-            
-            vessel_area = np.sum(binary_mask > 0)
-            total_area = binary_mask.size
-            vessel_density = (vessel_area / total_area) * 100
-            
-            return overlay, vessel_density
+            return self.build_vessel_result(binary_mask, working.roi, transform)
             
         except Exception as e:
             print(f"Error in UNet segmentation: {e}")
-            return None, 0.0
+            return None, 0.0, None
     
-    def segment_traditional(self, img):
+    def segment_traditional(self, img, roi=None, working=None, max_side=None):
         try:
+            if working is None:
+                working = WorkingImageCache(img, roi)
+            img, transform = working.get(self.vessel_resolution(max_side, fast=self.settings['fast_mode']))
+            
+            if self.settings['traditional_engine'] == 'hessian':
+                # Only clahe_clip applies here; the other enhancement settings are ignored.
+                # Sigmas are tuned for a 1024px field of view; scale them with the working image.
+                size_ratio = max(img.shape[:2]) / 1024
+                sigmas = [max(0.7, sigma * size_ratio) for sigma in VESSEL_HESSIAN_SIGMAS]
+                binary = segment_hessian(img, sigmas, self.settings['clahe_clip'])
+                return self.build_vessel_result(binary, working.roi, transform)
+            
             enhanced_img = self.enhance_for_unet(img)
             
             green = enhanced_img[:, :, 1]
@@ -133,19 +200,28 @@ class VesselProcessor:
             binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
             binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
             
-            color = (self.settings['color_b'], self.settings['color_g'], self.settings['color_r'])
-            overlay = np.zeros_like(img)
-            overlay[binary > 0] = color
-            
-            vessel_area = np.sum(binary > 0)
-            total_area = binary.size
-            vessel_density = (vessel_area / total_area) * 100
-            
-            return overlay, vessel_density
+            return self.build_vessel_result(binary, working.roi, transform)
             
         except Exception as e:
             print(f"Error in traditional segmentation: {e}")
-            return None, 0.0
+            return None, 0.0, None
+    
+    def build_vessel_result(self, binary_mask, roi, transform):
+        """Pack a working-resolution mask into a full-frame vessel result.
+        
+        Density and morphometry are measured at working resolution, inside
+        the field of view, while the mask is still small. Colour is applied
+        only when the mask is drawn.
+        """
+        fov = roi.fov_mask(transform.scale, binary_mask.shape)
+        binary_mask[fov == 0] = 0
+        
+        fov_area = int(np.count_nonzero(fov)) or binary_mask.size
+        vessel_area = np.count_nonzero(binary_mask)
+        vessel_density = (vessel_area / fov_area) * 100
+        morphometry = measure_vessels(binary_mask, fov, transform)
+        
+        return PackedMask.from_roi(binary_mask, roi), vessel_density, morphometry
     
     def post_process_mask(self, binary_mask):
         kernel = np.ones((3, 3), np.uint8)
@@ -157,22 +233,50 @@ class VesselProcessor:
         
         return mask
     
-    def segment_vessels(self, img):
+    def vessel_resolution(self, max_side=None, fast=False):
+        resolution = WORKING_RESOLUTIONS['vessel']
+        if fast:
+            resolution = min(resolution, VESSEL_FAST_RESOLUTION)
+        if max_side:
+            resolution = min(resolution, max_side)
+        return resolution
+    
+    def segment_vessels(self, img, roi=None, working=None, max_side=None):
         if self.settings['use_unet'] and self.vessel_model is not None:
-            return self.segment_with_unet(img)
+            return self.segment_with_unet(img, roi, working, max_side)
         else:
-            return self.segment_traditional(img)
+            return self.segment_traditional(img, roi, working, max_side)
+    
+    def affects_mask(self, setting):
+        """Whether changing setting changes the mask of the active method; None means any setting."""
+        if setting is None or setting == 'use_unet':
+            return True
+        if self.settings['use_unet'] and self.vessel_model is not None:
+            return setting in UNET_MASK_SETTINGS
+        if self.settings['traditional_engine'] == 'hessian':
+            return setting in HESSIAN_MASK_SETTINGS
+        return setting in CLASSIC_MASK_SETTINGS
+    
+    def enhancement_key(self):
+        """Hashable key of the settings that affect enhance_for_unet."""
+        return tuple(self.settings[key] for key in ENHANCEMENT_SETTINGS)
+    
+    def with_settings(self, settings):
+        """Shallow copy sharing the model but with its own settings, for use off the UI thread."""
+        clone = copy.copy(self)
+        clone.settings = dict(settings)
+        return clone
+    
+    def vessel_color(self):
+        return (self.settings['color_b'], self.settings['color_g'], self.settings['color_r'])
     
-    def create_vessel_only_image(self, vessel_overlay, vessel_density):
-        if vessel_overlay is None:
+    def create_vessel_only_image(self, vessel_mask, vessel_density):
+        if vessel_mask is None:
             return None
         
-        vessel_color = (self.settings['color_b'], self.settings['color_g'], self.settings['color_r'])
-        vessel_only = np.zeros_like(vessel_overlay)
-        mask_indices = np.any(vessel_overlay > 0, axis=2)
-        colored_vessels = vessel_overlay.copy()
-        colored_vessels[mask_indices] = vessel_color
-        vessel_only = colored_vessels
+        vessel_color = self.vessel_color()
+        vessel_only = np.zeros(vessel_mask.shape + (3,), dtype=np.uint8)
+        vessel_only[vessel_mask] = vessel_color
         model_type = "UNet" if self.settings['use_unet'] else "Traditional"
         cv2.putText(vessel_only, f"BLOOD VESSELS ({model_type})", (50, 50), 
                    cv2.FONT_HERSHEY_SIMPLEX, 1.2, vessel_color, 3)
@@ -181,14 +285,12 @@ class VesselProcessor:
         
         return vessel_only
     
-    def create_overlay_image(self, original_img, vessel_overlay):
-        if vessel_overlay is None:
+    def create_overlay_image(self, original_img, vessel_mask):
+        if vessel_mask is None:
             return original_img.copy()
         
         overlay = np.zeros_like(original_img)
-        mask_indices = np.any(vessel_overlay > 0, axis=2)
-        vessel_color = (self.settings['color_b'], self.settings['color_g'], self.settings['color_r'])
-        overlay[mask_indices] = vessel_color
+        overlay[vessel_mask] = self.vessel_color()
         
         opacity = self.settings['overlay_opacity']
         result = cv2.addWeighted(original_img, 1.0 - opacity, overlay, opacity, 0)
@@ -0,0 +1,268 @@
+import os
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+from config import (WORKING_RESOLUTIONS, REGISTRATION_MAX_FEATURES, REGISTRATION_MIN_INLIERS,
+                    REGISTRATION_CACHE_SIZE, LESION_MATCH_TOLERANCE_DD)
+
+CHANGE_COLORS = {
+    'new': (0, 0, 255),
+    'resolved': (0, 255, 0),
+    'persistent': (0, 255, 255),
+}
+
+class RegistrationFeatures:
+    """ORB keypoints of one scan, with positions already mapped to original pixels."""
+
+    def __init__(self, points, descriptors, scale):
+        self.points = points
+        self.descriptors = descriptors
+        self.scale = float(scale)
+
+    def __len__(self):
+        return len(self.points)
+
+def compute_features(working_images, max_features=REGISTRATION_MAX_FEATURES):
+    """Detect ORB features on the contrast-equalized green channel inside the field of view."""
+    img, transform = working_images.get(WORKING_RESOLUTIONS['registration'])
+    green = img[:, :, 1] if img.ndim == 3 else img
+    green = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(green)
+    fov = working_images.roi.fov_mask(transform.scale, shape=green.shape)
+    # Pull the mask in a little so the bright FOV rim does not produce keypoints.
+    fov = cv2.erode(fov, np.ones((9, 9), np.uint8))
+
+    orb = cv2.ORB_create(nfeatures=max_features)
+    keypoints, descriptors = orb.detectAndCompute(green, fov)
+    if descriptors is None:
+        return RegistrationFeatures(np.zeros((0, 2), np.float32), np.zeros((0, 32), np.uint8), transform.scale)
+
+    points = np.array([kp.pt for kp in keypoints], dtype=np.float32)
+    points = points / transform.scale + np.array(transform.offset, dtype=np.float32)
+    return RegistrationFeatures(points, descriptors, transform.scale)
+
+class RegistrationFeatureCache:
+    """LRU of RegistrationFeatures keyed by image hash, optionally persisted as .npz files.
+
+    With a directory, features survive restarts, so comparing against an
+    earlier visit never re-extracts them.
+    """
+
+    def __init__(self, directory=None, max_entries=REGISTRATION_CACHE_SIZE):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, img_hash):
+        with self.lock:
+            features = self.entries.get(img_hash)
+            if features is not None:
+                self.entries.move_to_end(img_hash)
+                return features
+        features = self._load(img_hash)
+        if features is not None:
+            self._remember(img_hash, features)
+        return features
+
+    def get_or_compute(self, img_hash, working_images):
+        features = self.get(img_hash)
+        if features is None:
+            features = compute_features(working_images)
+            self._remember(img_hash, features)
+            self._save(img_hash, features)
+        return features
+
+    def _remember(self, img_hash, features):
+        with self.lock:
+            self.entries[img_hash] = features
+            self.entries.move_to_end(img_hash)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _path(self, img_hash):
+        return os.path.join(self.directory, f"{img_hash}.npz")
+
+    def _load(self, img_hash):
+        if not self.directory or not os.path.exists(self._path(img_hash)):
+            return None
+        try:
+            with np.load(self._path(img_hash)) as data:
+                return RegistrationFeatures(data['points'], data['descriptors'], float(data['scale']))
+        except Exception as e:
+            print(f"Ignoring unreadable registration features {img_hash}: {e}")
+            return None
+
+    def _save(self, img_hash, features):
+        if not self.directory:
+            return
+        tmp_path = self._path(img_hash) + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, points=features.points, descriptors=features.descriptors, scale=features.scale)
+            os.replace(tmp_path, self._path(img_hash))
+        except OSError as e:
+            print(f"Could not cache registration features: {e}")
+
+def register_visits(previous, current, ratio=0.8, reprojection_px=3.0):
+    """Similarity transform (2x3) from the previous visit's pixels to the current one's, or None.
+
+    reprojection_px is measured at registration resolution and converted to
+    original pixels of the current scan.
+    """
+    if len(previous) < REGISTRATION_MIN_INLIERS or len(current) < REGISTRATION_MIN_INLIERS:
+        return None, 0
+
+    matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+    pairs = matcher.knnMatch(previous.descriptors, current.descriptors, k=2)
+    good = [p[0] for p in pairs if len(p) == 2 and p[0].distance < ratio * p[1].distance]
+    if len(good) < REGISTRATION_MIN_INLIERS:
+        return None, 0
+
+    src = previous.points[[m.queryIdx for m in good]]
+    dst = current.points[[m.trainIdx for m in good]]
+    matrix, inliers = cv2.estimateAffinePartial2D(
+        src, dst, method=cv2.RANSAC, ransacReprojThreshold=reprojection_px / current.scale
+    )
+    inlier_count = int(inliers.sum()) if inliers is not None else 0
+    if matrix is None or inlier_count < REGISTRATION_MIN_INLIERS:
+        return None, inlier_count
+    return matrix, inlier_count
+
+def transform_box(box, matrix):
+    x1, y1, x2, y2 = box
+    corners = np.array([[x1, y1], [x2, y1], [x1, y2], [x2, y2]], dtype=np.float32)
+    mapped = corners @ matrix[:, :2].T + matrix[:, 2]
+    (mx1, my1), (mx2, my2) = mapped.min(axis=0), mapped.max(axis=0)
+    return [int(round(mx1)), int(round(my1)), int(round(mx2)), int(round(my2))]
+
+def box_center(box):
+    return ((box[0] + box[2]) / 2.0, (box[1] + box[3]) / 2.0)
+
+def match_lesions(previous_lesions, current_lesions, matrix, tolerance_px):
+    """Split lesions into new, resolved and persistent after mapping the previous visit onto the current one.
+
+    Pairs of the same class are matched greedily, closest first; a pair matches
+    when its centres are within tolerance_px or within the larger box.
+    """
+    mapped = [dict(lesion, box=transform_box(lesion['box'], matrix)) for lesion in previous_lesions]
+
+    candidates = []
+    for i, old in enumerate(mapped):
+        old_center = box_center(old['box'])
+        for j, new in enumerate(current_lesions):
+            if old['class'] != new['class']:
+                continue
+            new_center = box_center(new['box'])
+            distance = np.hypot(old_center[0] - new_center[0], old_center[1] - new_center[1])
+            size = max(old['box'][2] - old['box'][0], old['box'][3] - old['box'][1],
+                       new['box'][2] - new['box'][0], new['box'][3] - new['box'][1])
+            if distance <= max(tolerance_px, size):
+                candidates.append((distance, i, j))
+
+    matched_old, matched_new, persistent = set(), set(), []
+    for _, i, j in sorted(candidates):
+        if i in matched_old or j in matched_new:
+            continue
+        matched_old.add(i)
+        matched_new.add(j)
+        persistent.append((mapped[i], current_lesions[j]))
+
+    return {
+        'new': [lesion for j, lesion in enumerate(current_lesions) if j not in matched_new],
+        'resolved': [lesion for i, lesion in enumerate(mapped) if i not in matched_old],
+        'persistent': persistent,
+    }
+
+def to_original_matrix(transform):
+    """3x3 matrix taking working-image pixels to original pixels."""
+    return np.array([[1.0 / transform.scale, 0, transform.offset[0]],
+                     [0, 1.0 / transform.scale, transform.offset[1]],
+                     [0, 0, 1]])
+
+def difference_overlay(previous_state, current_state, matrix, changes):
+    """Current display image with intensity change heat and lesions coloured by change."""
+    display = current_state['display_img']
+    transform = current_state['display_transform']
+    previous_display = previous_state['display_img']
+    h, w = display.shape[:2]
+
+    # previous display -> previous original -> current original -> current display
+    warp = (np.linalg.inv(to_original_matrix(transform)) @ np.vstack([matrix, [0, 0, 1]])
+            @ to_original_matrix(previous_state['display_transform']))[:2]
+    warped = cv2.warpAffine(previous_display, warp, (w, h), flags=cv2.INTER_LINEAR)
+    valid = cv2.warpAffine(np.full(previous_display.shape[:2], 255, np.uint8), warp, (w, h),
+                           flags=cv2.INTER_NEAREST) > 0
+
+    current_green = display[:, :, 1].astype(np.float32)
+    previous_green = warped[:, :, 1].astype(np.float32)
+    if valid.any():
+        # Compensate overall exposure differences between the two visits.
+        previous_green *= np.median(current_green[valid]) / max(np.median(previous_green[valid]), 1.0)
+    diff = cv2.GaussianBlur(np.abs(current_green - previous_green), (0, 0), 3)
+    diff[~valid] = 0
+    heat = cv2.applyColorMap(np.clip(diff * 4, 0, 255).astype(np.uint8), cv2.COLORMAP_INFERNO)
+
+    overlay = display.copy()
+    overlay[valid] = cv2.addWeighted(display, 0.65, heat, 0.35, 0)[valid]
+
+    line = max(1, int(round(3 * transform.scale)))
+    for status, lesions in (('resolved', changes['resolved']), ('new', changes['new']),
+                            ('persistent', [new for _, new in changes['persistent']])):
+        for lesion in lesions:
+            x1, y1, x2, y2 = transform.to_working_box(lesion['box'])
+            cv2.rectangle(overlay, (x1, y1), (x2, y2), CHANGE_COLORS[status], line)
+    return overlay
+
+def lesion_match_tolerance(current_state):
+    disc_diameter = current_state['optic_disc_diameter_pixels']
+    if disc_diameter > 0:
+        return LESION_MATCH_TOLERANCE_DD * disc_diameter
+    # Without a detected disc fall back to a fixed fraction of the fundus size.
+    return 0.02 * max(current_state['fundus_roi'].size)
+
+def class_counts(lesions):
+    counts = {}
+    for lesion in lesions:
+        counts[lesion['class']] = counts.get(lesion['class'], 0) + 1
+    return counts
+
+def comparison_summary(previous_state, current_state, changes, inliers):
+    text = "=== VISIT COMPARISON ===\n\n"
+    text += f"Severity: {previous_state['current_severity']} -> {current_state['current_severity']}\n"
+    text += f"Registration inliers: {inliers}\n\n"
+    persistent = [new for _, new in changes['persistent']]
+    for status, lesions in (('New', changes['new']), ('Resolved', changes['resolved']),
+                            ('Persistent', persistent)):
+        counts = class_counts(lesions)
+        detail = ", ".join(f"{name}: {count}" for name, count in sorted(counts.items()))
+        text += f"{status} lesions: {len(lesions)}" + (f" ({detail})" if detail else "") + "\n"
+    return text
+
+class VisitComparison:
+    def __init__(self, previous_path, changes, inliers, overlay, summary):
+        self.previous_path = previous_path
+        self.changes = changes
+        self.inliers = inliers
+        self.overlay = overlay
+        self.summary = summary
+
+def compare_visits(previous_path, previous_state, previous_hash, current_state, current_hash, feature_cache):
+    """Register the previous visit onto the current scan and classify lesion changes.
+
+    Raises ValueError when the two scans cannot be registered.
+    """
+    previous_features = feature_cache.get_or_compute(previous_hash, previous_state['working_images'])
+    current_features = feature_cache.get_or_compute(current_hash, current_state['working_images'])
+
+    matrix, inliers = register_visits(previous_features, current_features)
+    if matrix is None:
+        raise ValueError(f"Could not register the two visits ({inliers} consistent matches)")
+
+    changes = match_lesions(previous_state['current_lesions'], current_state['current_lesions'],
+                            matrix, lesion_match_tolerance(current_state))
+    overlay = difference_overlay(previous_state, current_state, matrix, changes)
+    summary = comparison_summary(previous_state, current_state, changes, inliers)
+    return VisitComparison(previous_path, changes, inliers, overlay, summary)
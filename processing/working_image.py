@@ -0,0 +1,61 @@
+import cv2
+from processing.fundus_roi import FundusROI
+
+class CoordinateTransform:
+    """Maps between a working image (cropped and downscaled) and original pixels.
+
+    original = working / scale + offset
+    """
+
+    def __init__(self, scale=1.0, offset=(0, 0)):
+        self.scale = float(scale)
+        self.offset = (int(offset[0]), int(offset[1]))
+
+    def to_original_point(self, point):
+        return (int(round(point[0] / self.scale)) + self.offset[0],
+                int(round(point[1] / self.scale)) + self.offset[1])
+
+    def to_original_box(self, box):
+        x1, y1 = self.to_original_point((box[0], box[1]))
+        x2, y2 = self.to_original_point((box[2], box[3]))
+        return [x1, y1, x2, y2]
+
+    def to_original_length(self, length):
+        return length / self.scale
+
+    def to_working_point(self, point):
+        return (int(round((point[0] - self.offset[0]) * self.scale)),
+                int(round((point[1] - self.offset[1]) * self.scale)))
+
+    def to_working_box(self, box):
+        x1, y1 = self.to_working_point((box[0], box[1]))
+        x2, y2 = self.to_working_point((box[2], box[3]))
+        return [x1, y1, x2, y2]
+
+    def to_working_length(self, length):
+        return length * self.scale
+
+class WorkingImageCache:
+    """Per-scan cache of images downscaled once to each stage's working resolution."""
+
+    def __init__(self, img, roi=None):
+        self.img = img
+        self.roi = roi if roi is not None else FundusROI.full_frame(img.shape)
+        self.cache = {}
+
+    def get(self, max_side, use_roi=True):
+        """Return (working_img, transform); images are never upscaled."""
+        key = (max_side, use_roi)
+        if key not in self.cache:
+            roi = self.roi if use_roi else FundusROI.full_frame(self.img.shape)
+            base = roi.crop(self.img)
+            h, w = base.shape[:2]
+            scale = min(1.0, max_side / max(h, w)) if max_side else 1.0
+
+            if scale < 1.0:
+                size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+                working = cv2.resize(base, size, interpolation=cv2.INTER_AREA)
+            else:
+                working = base
+            self.cache[key] = (working, CoordinateTransform(scale, roi.offset))
+        return self.cache[key]
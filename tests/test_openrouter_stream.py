@@ -0,0 +1,107 @@
+"""Checks OpenRouterAPI.stream_chat_completion against a local SSE stub.
+
+Run from the repository root:
+
+    python -m unittest tests.test_openrouter_stream
+"""
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from api.openrouter_api import OpenRouterAPI
+
+FRAGMENTS = ["Lesion 12 µm ", "from the fovea, ", "30° temporal — ", "日本語 ok"]
+
+def sse_event(text):
+    return f"data: {json.dumps({'choices': [{'delta': {'content': text}}]}, ensure_ascii=False)}\n\n"
+
+class SSEStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = (": keep-alive\n\n"
+                + "data: {\"choices\": [{\"delta\": {\"role\": \"assistant\"}}]}\n\n"
+                + "".join(sse_event(text) for text in FRAGMENTS)
+                + "data: [DONE]\n\n").encode("utf-8")
+
+        # No charset on purpose: real servers often omit it for text/event-stream.
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        # Small chunks so multi-byte characters are split across network reads.
+        for start in range(0, len(body), 7):
+            chunk = body[start:start + 7]
+            self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+class StreamChatCompletionTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), SSEStubHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/chat/completions"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.api = OpenRouterAPI(api_key="test-key", api_url=self.url,
+                                 cache_path=os.path.join(self.tmp.name, "responses.sqlite3"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_streams_utf8_fragments_in_order(self):
+        received = []
+        content = self.api.stream_chat_completion([{"role": "user", "content": "hi"}], received.append)
+
+        self.assertEqual(content, "".join(FRAGMENTS))
+        self.assertEqual("".join(received), "".join(FRAGMENTS))
+
+    def test_completed_stream_is_cached(self):
+        messages = [{"role": "user", "content": "cache me"}]
+        self.api.stream_chat_completion(messages, lambda text: None, temperature=0.0)
+
+        received = []
+        content = self.api.stream_chat_completion(messages, received.append, temperature=0.0)
+        self.assertEqual(received, ["".join(FRAGMENTS)])
+        self.assertEqual(content, "".join(FRAGMENTS))
+
+    def test_cancelled_assessment_leaves_conversation_alone(self):
+        current = {'severity': "Mild", 'confidence': 0.9, 'lesion_count': 2}
+        self.api.conversation.set_scan(current)
+        self.api.conversation.add_turn("Is it mild?", "Yes.")
+        turns = list(self.api.conversation.turns)
+
+        received = []
+        stale = {'severity': "Severe", 'confidence': 0.8, 'lesion_count': 9}
+        content = self.api.analyze_retina_scan(stale, on_delta=received.append, use_cache=False,
+                                               cancelled=lambda: bool(received))
+
+        self.assertIsNone(content)
+        self.assertEqual(len(received), 1)
+        self.assertEqual(self.api.conversation.turns, turns)
+
+    def test_answer_for_replaced_scan_is_not_recorded(self):
+        previous = {'severity': "Mild", 'confidence': 0.9, 'lesion_count': 2}
+        scan = self.api.conversation.set_scan(previous)
+        self.api.conversation.set_scan({'severity': "Severe", 'confidence': 0.8, 'lesion_count': 9})
+
+        self.api.conversation.add_turn("Is it mild?", "Yes.", scan=scan)
+        self.assertEqual(self.api.conversation.turns, [])
+
+if __name__ == "__main__":
+    unittest.main()
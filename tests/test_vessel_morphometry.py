@@ -0,0 +1,63 @@
+"""Checks branch and segment counts from measure_vessels on synthetic vessels.
+
+Run from the repository root:
+
+    python -m unittest tests.test_vessel_morphometry
+"""
+import unittest
+import cv2
+import numpy as np
+
+from processing.vessel_morphometry import measure_vessels
+
+def curved_vessel():
+    mask = np.zeros((300, 400), np.uint8)
+    cv2.ellipse(mask, (200, 150), (150, 90), 0, 200, 340, 255, 5)
+    return mask
+
+def wavy_vessel():
+    mask = np.zeros((300, 600), np.uint8)
+    xs = np.arange(20, 580)
+    ys = (150 + 80 * np.sin(xs / 40)).astype(np.int32)
+    cv2.polylines(mask, [np.stack([xs, ys], axis=1)], False, 255, 4)
+    return mask
+
+def y_vessel():
+    mask = np.zeros((300, 300), np.uint8)
+    for end in ((150, 280), (60, 40), (250, 50)):
+        cv2.line(mask, (150, 150), end, 255, 5)
+    return mask
+
+def crossing_vessels():
+    mask = np.zeros((300, 300), np.uint8)
+    cv2.line(mask, (20, 20), (280, 280), 255, 5)
+    cv2.line(mask, (280, 20), (20, 280), 255, 5)
+    return mask
+
+class MeasureVesselsTest(unittest.TestCase):
+    def test_curved_vessel_has_no_branches(self):
+        for mask in (curved_vessel(), wavy_vessel()):
+            result = measure_vessels(mask)
+            self.assertEqual(result['branch_points'], 0)
+            self.assertEqual(result['segments'], 1)
+            self.assertEqual(result['end_points'], 2)
+
+    def test_curved_vessel_tortuosity_uses_whole_centreline(self):
+        # Arc over chord of the drawn ellipse arc is 1.13; chain-code length runs a few percent long.
+        tortuosity = measure_vessels(curved_vessel())['tortuosity_mean']
+        self.assertGreater(tortuosity, 1.1)
+        self.assertLess(tortuosity, 1.25)
+
+    def test_y_shape_has_one_branch_point(self):
+        result = measure_vessels(y_vessel())
+        self.assertEqual(result['branch_points'], 1)
+        self.assertEqual(result['segments'], 3)
+        self.assertEqual(result['end_points'], 3)
+
+    def test_crossing_counts_once(self):
+        result = measure_vessels(crossing_vessels())
+        self.assertEqual(result['branch_points'], 1)
+        self.assertEqual(result['segments'], 4)
+
+if __name__ == "__main__":
+    unittest.main()
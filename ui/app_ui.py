@@ -2,18 +2,28 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 import cv2
 import os
+import time
 import threading
 from PIL import Image, ImageTk
 
 from ui.components import (
     ChatDisplay, AnalysisDisplay, ControlButton, 
-    ImageCanvas, StatusLabel
+    ImageCanvas, StatusLabel, WorklistPanel
 )
-from ui.dialogs import ImageDialog, VesselSettingsDialog, EnhancedPreviewDialog
+from ui.dispatcher import UIDispatcher
+from ui.render_scheduler import RenderScheduler
+from ui.enhancement_preview import EnhancementPreviewer
+from ui.dialogs import ImageDialog, VesselSettingsDialog, EnhancedPreviewDialog, VisitComparisonDialog
 from ui.gallery_window import LesionGalleryWindow
-from utils.helpers import cv2_to_tkimage, resize_for_display, add_severity_label
-from utils.constants import UI_COLORS
-from config import SEVERITY_COLORS
+from processing.image_processor import ImageProcessor
+from processing.scan_session import SCAN_STATE_KEYS, ScanSession, SessionCache
+from processing.result_export import build_analysis_record
+from processing.results_db import ResultsDatabase, image_hash
+from processing.visit_comparison import RegistrationFeatureCache, compare_visits
+from utils.helpers import cv2_to_tkimage, resize_for_display, display_size, add_severity_label
+from utils.constants import UI_COLORS, WORKLIST_EXTENSIONS, ANALYSIS_MAX_WORKERS
+from config import SEVERITY_COLORS, VESSEL_PROXY_RESOLUTION, WORKLIST_PREFETCH, SESSION_CACHE_BUDGET_MB
+from config import RESULTS_DB_ENABLED, RESULTS_DB_PATH, REGISTRATION_CACHE_DIR
 
 class RetinaAnalyzerUI:
     def __init__(self, root, image_processor, vessel_processor, api_client, lesion_analyzer):
@@ -25,6 +35,38 @@ class RetinaAnalyzerUI:
         
         self.current_state = image_processor.current_state
         self.image_tk = None
+        self.preview_base = None
+        
+        self.dispatcher = UIDispatcher(root)
+        # Model inference runs on its own worker so chat and vessel jobs never queue behind it.
+        self.analysis_dispatcher = UIDispatcher(root, max_workers=ANALYSIS_MAX_WORKERS)
+        self.render_scheduler = RenderScheduler(root, self.update_display)
+        self.enhancement_preview = EnhancementPreviewer(self.dispatcher, vessel_processor,
+                                                        lambda: self.current_state['working_images'])
+        self.scan_chat_job = None
+        self.vessel_job = None
+        self.proxy_job = None
+        self.proxy_dirty = False
+        
+        # Scans are analyzed on a separate processor and shown by restoring a ScanSession,
+        # so the displayed state is only ever written on the Tk thread.
+        self.scan_processor = ImageProcessor(image_processor.model_loader)
+        self.session_cache = SessionCache(SESSION_CACHE_BUDGET_MB * 1024 * 1024)
+        self.worklist = []
+        self.worklist_positions = {}
+        self.worklist_index = -1
+        self.scan_jobs = {}
+        self.awaiting_path = None
+        self.current_path = None
+        self.compare_job = None
+        self.registration_features = RegistrationFeatureCache(REGISTRATION_CACHE_DIR)
+        
+        self.results_db = None
+        if RESULTS_DB_ENABLED:
+            try:
+                self.results_db = ResultsDatabase(RESULTS_DB_PATH, batch_size=1)
+            except Exception as e:
+                print(f"Results database disabled: {e}")
         
         self.setup_ui()
         self.bind_events()
@@ -92,9 +134,10 @@ class RetinaAnalyzerUI:
             ("heatmap", "Heatmap: OFF", self.toggle_heatmap, UI_COLORS['accent_red']),
             ("lesions", "Lesions: ON", self.toggle_lesion_boxes, UI_COLORS['accent_green']),
             ("macula", "Macula/Disc: ON", self.toggle_macula_disc, UI_COLORS['accent_orange']),
-            ("vessels", "Vessels: OFF", self.toggle_vessel_overlay, UI_COLORS['accent_purple']),
+            ("vessels", "Vessels: OFF", self.toggle_vessel_mask, UI_COLORS['accent_purple']),
             ("vessel_settings", "Vessel Settings", self.show_vessel_settings, UI_COLORS['accent_purple']),
             ("gallery", "Lesion Gallery", self.show_lesion_gallery, UI_COLORS['accent_teal']),
+            ("compare", "Compare Visit", self.compare_visit, UI_COLORS['accent_teal']),
         ]
         
         for key, text, command, color in button_configs:
@@ -105,19 +148,24 @@ class RetinaAnalyzerUI:
     def setup_analysis_panel(self):
         right_frame = tk.Frame(self.root, bg=UI_COLORS['bg_medium'], relief=tk.RAISED, bd=3)
         right_frame.grid(row=0, column=1, rowspan=2, sticky='nsew', padx=5, pady=5)
-        right_frame.grid_rowconfigure(0, weight=1)  
+        right_frame.grid_rowconfigure(0, weight=0)  
         right_frame.grid_rowconfigure(1, weight=1)  
+        right_frame.grid_rowconfigure(2, weight=1)  
         right_frame.grid_columnconfigure(0, weight=1)
         
+        self.worklist_panel = WorklistPanel(right_frame, self.select_scan, self.open_worklist,
+                                            self.previous_scan, self.next_scan)
+        self.worklist_panel.grid(row=0, column=0, sticky='nsew', padx=5, pady=(5, 2))
+        
         report_frame = tk.Frame(right_frame, bg=UI_COLORS['bg_dark'])
-        report_frame.grid(row=0, column=0, sticky='nsew', padx=5, pady=(5, 2))
+        report_frame.grid(row=1, column=0, sticky='nsew', padx=5, pady=2)
         report_frame.grid_rowconfigure(0, weight=1)
         
         self.analysis_text = AnalysisDisplay(report_frame)
         self.analysis_text.pack(fill='both', expand=True)
         
         chat_frame = tk.Frame(right_frame, bg=UI_COLORS['bg_dark'])
-        chat_frame.grid(row=1, column=0, sticky='nsew', padx=5, pady=(2, 5))
+        chat_frame.grid(row=2, column=0, sticky='nsew', padx=5, pady=(2, 5))
         chat_frame.grid_rowconfigure(0, weight=1)
         chat_frame.grid_columnconfigure(0, weight=1)
         
@@ -161,11 +209,13 @@ class RetinaAnalyzerUI:
         self.root.bind("<Control-o>", lambda e: self.load_image())
         self.root.bind("<Control-plus>", lambda e: self.zoom_in())
         self.root.bind("<Control-minus>", lambda e: self.zoom_out())
+        self.root.bind("<Control-Right>", lambda e: self.next_scan())
+        self.root.bind("<Control-Left>", lambda e: self.previous_scan())
     
     def on_canvas_resize(self, event):
         """Handle canvas resize event."""
         if self.current_state['uploaded_img'] is not None:
-            self.update_display()
+            self.request_render()
     
     
     def load_image(self):
@@ -179,8 +229,6 @@ class RetinaAnalyzerUI:
                 messagebox.showerror("Error", f"Could not load image: {file_path}")
                 return
             
-            self.image_processor.set_image(uploaded_img)
-            
             self.current_state['show_vessels_only'] = False
             self.current_state['show_original_with_vessels'] = False
             self.current_state['zoom_scale'] = 1.0
@@ -188,33 +236,344 @@ class RetinaAnalyzerUI:
             
             self.image_label.place_forget()
             
-            self.analyze_image()
-            self.update_display()
-            self.update_status(f"Loaded: {os.path.basename(file_path)}")
-            
-            self.auto_send_analysis()
+            self.analyze_image(file_path, uploaded_img)
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load image: {str(e)}")
     
-    def analyze_image(self):
-        """Analyze loaded image."""
-        self.update_status("Analyzing image...")
+    def analyze_image(self, path, img=None):
+        """Analyze a scan on the analysis worker and show the results when done."""
+        self.cancel_scan_jobs()
+        self.awaiting_path = path
+        self.update_status(f"Analyzing {os.path.basename(path)}...")
+        if not self.submit_scan(path, img):
+            self.awaiting_path = None
+            self.update_status("Busy - please wait for running jobs to finish")
+    
+    def submit_scan(self, path, img=None):
+        """Queue a scan for analysis unless it is already queued; the session is cached when done.
+        
+        Returns False if the analysis queue is full.
+        """
+        if path in self.scan_jobs:
+            return True
+        job = self.analysis_dispatcher.submit(
+            self.analyze_scan, path, self.vessel_processor.with_settings(self.vessel_processor.settings), img,
+            callback=lambda session: self.on_scan_complete(path, session),
+            errback=lambda e: self.on_scan_failed(path, e),
+            name="analysis"
+        )
+        if job is None:
+            return False
+        self.scan_jobs[path] = job
+        self.mark_worklist(path, 'loading')
+        return True
+    
+    def analyze_scan(self, path, vessel_processor, img=None):
+        """Worker-side analysis of one scan into a ScanSession; runs only on the analysis worker."""
+        if img is None:
+            img = cv2.imread(path)
+            if img is None:
+                raise ValueError(f"Could not load image: {path}")
+        
+        processor = self.scan_processor
+        processor.set_image(img)
+        processor.analyze_image()
+        start = time.perf_counter()
+        vessel_mask, vessel_density, morphometry = vessel_processor.segment_vessels(
+            img, working=processor.get_working_images()
+        )
+        processor.current_state['timings']['vessel'] = round((time.perf_counter() - start) * 1000.0, 1)
+        processor.update_state('vessel_mask', vessel_mask)
+        processor.update_state('vessel_density', vessel_density)
+        processor.update_state('vessel_morphometry', morphometry)
+        self.record_analysis(processor, path, img, vessel_processor.settings)
+        return ScanSession.capture(path, processor.current_state, processor.generate_analysis_report())
+    
+    def record_analysis(self, processor, path, img, settings):
+        if self.results_db is None:
+            return
+        try:
+            self.results_db.add(
+                build_analysis_record(processor, os.path.basename(path)),
+                image_hash(img),
+                model_versions=processor.model_loader.model_versions(),
+                settings=settings
+            )
+        except Exception as e:
+            print(f"Could not record analysis of {path}: {e}")
+    
+    def on_scan_complete(self, path, session):
+        """Cache every finished analysis; show it only if the user is waiting for that scan."""
+        self.scan_jobs.pop(path, None)
+        self.cache_session(session)
+        if path == self.awaiting_path:
+            self.awaiting_path = None
+            self.show_session(session)
+    
+    def on_scan_failed(self, path, error):
+        self.scan_jobs.pop(path, None)
+        self.mark_worklist(path, 'failed')
+        if path == self.awaiting_path:
+            self.awaiting_path = None
+            messagebox.showerror("Error", f"Failed to analyze image: {str(error)}")
+            self.update_status("Analysis failed")
+    
+    def show_session(self, session):
+        session.restore(self.current_state)
+        self.current_path = session.path
+        self.analysis_text.set_report(session.report)
         
-        report = self.image_processor.analyze_image()
-        self.analysis_text.set_report(report)
+        self.update_display()
+        self.update_status(f"Loaded: {os.path.basename(session.path)}")
         
-        if self.current_state['uploaded_img'] is not None:
-            vessel_overlay, vessel_density = self.vessel_processor.segment_vessels(
-                self.current_state['uploaded_img']
-            )
-            self.current_state['vessel_mask'] = vessel_overlay
+        self.auto_send_analysis()
+    
+    def cache_session(self, session):
+        for path in self.session_cache.put(session):
+            self.mark_worklist(path, 'pending')
+        self.mark_worklist(session.path, 'ready')
+    
+    def mark_worklist(self, path, status):
+        idx = self.worklist_positions.get(path)
+        if idx is not None:
+            self.worklist_panel.set_status(idx, status)
+    
+    def open_worklist(self):
+        folder = filedialog.askdirectory()
+        if not folder:
+            return
+        
+        paths = sorted(os.path.join(folder, f) for f in os.listdir(folder)
+                       if f.lower().endswith(WORKLIST_EXTENSIONS))
+        if not paths:
+            messagebox.showinfo("Worklist", "No retina scans found in this folder.")
+            return
+        
+        self.cancel_prefetch()
+        self.worklist = paths
+        self.worklist_positions = {path: idx for idx, path in enumerate(paths)}
+        self.worklist_index = -1
+        self.worklist_panel.set_items([os.path.basename(p) for p in paths])
+        for path in paths:
+            if path in self.session_cache:
+                self.mark_worklist(path, 'ready')
+        
+        self.select_scan(0)
+    
+    def next_scan(self):
+        self.select_scan(self.worklist_index + 1)
+    
+    def previous_scan(self):
+        self.select_scan(self.worklist_index - 1)
+    
+    def select_scan(self, index):
+        """Show a worklist scan: from the session cache, a running prefetch, or a fresh analysis."""
+        if not 0 <= index < len(self.worklist) or index == self.worklist_index:
+            return
+        
+        self.worklist_index = index
+        self.worklist_panel.select(index)
+        self.image_label.place_forget()
+        self.cancel_scan_jobs()
+        
+        path = self.worklist[index]
+        session = self.session_cache.get(path)
+        if session is not None:
+            self.show_session(session)
+        elif path in self.scan_jobs:
+            self.awaiting_path = path
+            self.update_status(f"Analyzing {os.path.basename(path)}...")
+        else:
+            self.analyze_image(path)
+        
+        self.schedule_prefetch()
+    
+    def schedule_prefetch(self):
+        """Analyze the next WORKLIST_PREFETCH scans in the background."""
+        start = self.worklist_index + 1
+        wanted = self.worklist[start:start + WORKLIST_PREFETCH]
+        self.cancel_prefetch(keep=set(wanted) | {self.awaiting_path})
+        
+        for path in wanted:
+            if path in self.session_cache:
+                continue
+            if not self.submit_scan(path):
+                break
+    
+    def cancel_prefetch(self, keep=()):
+        """Drop queued analyses not in keep; ones already running finish and are cached."""
+        for path, job in list(self.scan_jobs.items()):
+            if path not in keep and job.cancel_if_pending():
+                del self.scan_jobs[path]
+                self.mark_worklist(path, 'pending')
+    
+    def compare_visit(self):
+        """Register an earlier visit of this patient onto the current scan and show lesion changes."""
+        if self.current_path is None:
+            messagebox.showinfo("Compare Visit", "Analyze the current visit first.")
+            return
+        
+        previous_path = ImageDialog.load_image()
+        if not previous_path:
+            return
+        
+        if self.compare_job is not None:
+            self.compare_job.cancel()
+        
+        current_path = self.current_path
+        current_state = {key: self.current_state[key] for key in SCAN_STATE_KEYS}
+        previous_session = self.session_cache.get(previous_path)
+        
+        def on_error(e):
+            self.compare_job = None
+            messagebox.showerror("Compare Visit", f"Failed to compare visits: {str(e)}")
+            self.update_status("Visit comparison failed")
+        
+        self.compare_job = self.analysis_dispatcher.submit(
+            self.run_visit_comparison, previous_path, previous_session, current_state,
+            self.vessel_processor.with_settings(self.vessel_processor.settings),
+            callback=lambda result: self.on_visit_comparison_complete(current_path, result),
+            errback=on_error,
+            name="compare"
+        )
+        if self.compare_job is None:
+            self.update_status("Busy - please wait for running jobs to finish")
+        else:
+            self.update_status(f"Comparing with {os.path.basename(previous_path)}...")
+    
+    def run_visit_comparison(self, previous_path, previous_session, current_state, vessel_processor):
+        """Worker side: analyze the earlier visit if it is not cached, then register and compare."""
+        if previous_session is None:
+            previous_session = self.analyze_scan(previous_path, vessel_processor)
+        comparison = compare_visits(
+            previous_path, previous_session.state, image_hash(previous_session.state['uploaded_img']),
+            current_state, image_hash(current_state['uploaded_img']), self.registration_features
+        )
+        return previous_session, comparison
+    
+    def on_visit_comparison_complete(self, current_path, result):
+        self.compare_job = None
+        previous_session, comparison = result
+        if previous_session.path not in self.session_cache:
+            self.cache_session(previous_session)
+        
+        VisitComparisonDialog(self.root, comparison, current_path)
+        self.update_status(f"Compared with {os.path.basename(comparison.previous_path)}")
+    
+    def cancel_scan_jobs(self):
+        """Stop waiting for the previous scan and cancel the jobs that belong to it.
+        
+        Its analysis is left to finish so the session still lands in the cache.
+        """
+        if self.compare_job is not None:
+            self.compare_job.cancel()
+            self.compare_job = None
+        self.awaiting_path = None
+        
+        self.cancel_vessel_jobs()
+        
+        if self.scan_chat_job is not None:
+            job, stream_id = self.scan_chat_job
+            job.cancel()
+            self.chat_display.finish_ai_stream(stream_id, "Cancelled - a new scan was loaded.")
+            self.scan_chat_job = None
+    
+    def cancel_vessel_jobs(self):
+        for job in (self.proxy_job, self.vessel_job):
+            if job is not None:
+                job.cancel()
+        self.proxy_job = None
+        self.vessel_job = None
+        self.proxy_dirty = False
+    
+    def run_vessel_segmentation(self, processor, img, working, max_side=None):
+        # UNet calls are serialized by the processor's shared UnetBuffers lock.
+        return processor.segment_vessels(img, working=working, max_side=max_side)
+    
+    def request_vessel_proxy(self):
+        """Re-segment a low-resolution proxy with the current settings while they are being tuned.
+        
+        At most one proxy job runs at a time; changes made while it runs are
+        picked up by a single follow-up job with the latest settings.
+        """
+        if self.current_state['uploaded_img'] is None or self.current_state['working_images'] is None:
+            return
+        self.proxy_dirty = True
+        if self.proxy_job is None:
+            self.start_vessel_proxy()
+    
+    def start_vessel_proxy(self):
+        self.proxy_dirty = False
+        processor = self.vessel_processor.with_settings(self.vessel_processor.settings)
+        self.proxy_job = self.dispatcher.submit(
+            self.run_vessel_segmentation, processor,
+            self.current_state['uploaded_img'], self.current_state['working_images'], VESSEL_PROXY_RESOLUTION,
+            callback=self.on_vessel_proxy_complete,
+            errback=lambda e: self.on_vessel_proxy_complete(None),
+            name="vessel-proxy"
+        )
+        if self.proxy_job is None:
+            self.proxy_dirty = True
+    
+    def on_vessel_proxy_complete(self, result):
+        self.proxy_job = None
+        if result is not None and result[0] is not None:
+            vessel_mask, vessel_density, _ = result
+            self.current_state['vessel_mask'] = vessel_mask
             self.current_state['vessel_density'] = vessel_density
+            self.request_render()
         
-        self.update_status("Analysis complete")
+        if self.proxy_dirty:
+            self.start_vessel_proxy()
     
-    def update_display(self):
-        if self.current_state['uploaded_img'] is None:
+    def apply_vessel_settings(self):
+        """Full-resolution segmentation with the settings chosen in the dialog."""
+        self.cancel_vessel_jobs()
+        if self.current_state['uploaded_img'] is None or self.current_state['working_images'] is None:
+            return
+        
+        self.update_status("Segmenting vessels...")
+        processor = self.vessel_processor.with_settings(self.vessel_processor.settings)
+        
+        def on_error(e):
+            self.vessel_job = None
+            self.update_status("Vessel segmentation failed")
+        
+        self.vessel_job = self.dispatcher.submit(
+            self.run_vessel_segmentation, processor,
+            self.current_state['uploaded_img'], self.current_state['working_images'],
+            callback=self.on_vessel_segmentation_complete,
+            errback=on_error,
+            name="vessel-segmentation"
+        )
+        if self.vessel_job is None:
+            self.update_status("Busy - please wait for running jobs to finish")
+    
+    def on_vessel_segmentation_complete(self, result):
+        self.vessel_job = None
+        vessel_mask, vessel_density, morphometry = result
+        if vessel_mask is None:
+            self.update_status("Vessel segmentation failed")
+            return
+        
+        self.current_state['vessel_mask'] = vessel_mask
+        self.image_processor.update_state('vessel_density', vessel_density)
+        self.image_processor.update_state('vessel_morphometry', morphometry)
+        report = self.image_processor.generate_analysis_report()
+        self.analysis_text.set_report(report)
+        if self.current_path is not None:
+            self.cache_session(ScanSession.capture(self.current_path, self.current_state, report))
+        
+        self.update_display()
+        self.update_status("Vessel segmentation updated")
+    
+    def request_render(self):
+        """Coalesced redraw for continuous input (sliders, window resizing)."""
+        self.render_scheduler.request(fast=True)
+    
+    def update_display(self, fast=False):
+        if self.current_state['uploaded_img'] is None or self.current_state['display_img'] is None:
             return
         
 
@@ -224,41 +583,55 @@ class RetinaAnalyzerUI:
         if canvas_width <= 1 or canvas_height <= 1:
             return
         
-        display_img = self.create_display_image()
-        
-        display_resized = resize_for_display(
-            display_img, 
-            canvas_width, 
-            canvas_height, 
-            self.current_state['zoom_scale']
-        )
+        vessel_view = self.current_state['vessel_mask'] is not None and (
+            self.current_state['show_vessels_only'] or self.current_state['show_original_with_vessels'])
+        if fast and vessel_view:
+            # Approximate frame: compose the vessel view directly at the size shown on screen.
+            size = display_size(self.current_state['display_img'].shape, canvas_width, canvas_height,
+                                self.current_state['zoom_scale'])
+            display_resized = self.create_display_image(self.get_preview_base(size))
+        else:
+            display_img = self.create_display_image()
+            
+            display_resized = resize_for_display(
+                display_img, 
+                canvas_width, 
+                canvas_height, 
+                self.current_state['zoom_scale']
+            )
         
         self.image_tk = cv2_to_tkimage(display_resized)
         
 
         self.image_canvas.display_image(self.image_tk)
     
-    def create_display_image(self):
+    def get_preview_base(self, size):
+        """Display image resized to the on-screen size, kept until the image or size changes."""
+        display_img = self.current_state['display_img']
+        if self.preview_base is None or self.preview_base[0] is not display_img or self.preview_base[1] != size:
+            resized = cv2.resize(display_img, size, interpolation=cv2.INTER_LINEAR)
+            self.preview_base = (display_img, size, resized)
+        return self.preview_base[2]
+    
+    def create_display_image(self, base_img=None):
         if self.current_state['show_vessels_only'] and self.current_state['vessel_mask'] is not None:
             return self.vessel_processor.create_vessel_only_image(
-                self.current_state['vessel_mask'],
+                self.display_vessel_mask(base_img),
                 self.current_state['vessel_density']
             )
         
         elif self.current_state['show_original_with_vessels'] and self.current_state['vessel_mask'] is not None:
+            if base_img is None:
+                base_img = self.current_state['display_img']
             display_img = self.vessel_processor.create_overlay_image(
-                self.current_state['original_img'].copy(),
-                self.current_state['vessel_mask']
+                base_img,
+                self.display_vessel_mask(base_img)
             )
             add_severity_label(display_img, 
                              self.current_state['current_severity'],
                              self.current_state['current_confidence'])
             
-            vessel_color = (
-                self.vessel_processor.settings['color_b'],
-                self.vessel_processor.settings['color_g'], 
-                self.vessel_processor.settings['color_r']
-            )
+            vessel_color = self.vessel_processor.vessel_color()
             model_type = "UNet" if self.vessel_processor.settings['use_unet'] else "Traditional"
             cv2.putText(display_img, f"Vessel Density: {self.current_state['vessel_density']:.2f}% ({model_type})", 
                        (20, display_img.shape[0] - 40),
@@ -267,7 +640,7 @@ class RetinaAnalyzerUI:
             return display_img
         
         else:
-            display_img = self.current_state['original_img'].copy()
+            display_img = self.current_state['display_img'].copy()
             add_severity_label(display_img, 
                              self.current_state['current_severity'],
                              self.current_state['current_confidence'])
@@ -278,15 +651,22 @@ class RetinaAnalyzerUI:
             if self.current_state['show_macula_disc']:
                 display_img = self.draw_macula_disc(display_img)
             
-            if self.current_state['show_heatmap'] and self.current_state['heatmap_overlay'] is not None:
-                display_img = cv2.addWeighted(display_img, 0.7, 
-                                            self.current_state['heatmap_overlay'], 0.3, 0)
+            heatmap = self.current_state['heatmap_overlay']
+            if self.current_state['show_heatmap'] and heatmap is not None and heatmap.shape == display_img.shape:
+                display_img = cv2.addWeighted(display_img, 0.7, heatmap, 0.3, 0)
             
             return display_img
     
+    def display_vessel_mask(self, base_img=None):
+        """Vessel mask unpacked at the display image's resolution (cached by the mask)."""
+        if base_img is None:
+            base_img = self.current_state['display_img']
+        return self.current_state['vessel_mask'].unpack(base_img.shape)
+    
     def draw_lesion_boxes(self, img):
+        transform = self.current_state['display_transform']
         for lesion in self.current_state['current_lesions']:
-            x1, y1, x2, y2 = lesion["box"]
+            x1, y1, x2, y2 = transform.to_working_box(lesion["box"])
             color = (0, 255, 0)
             thickness_box = max(2, int(min(x2-x1, y2-y1) * 0.015))
             
@@ -308,8 +688,9 @@ class RetinaAnalyzerUI:
         return img
     
     def draw_macula_disc(self, img):
+        transform = self.current_state['display_transform']
         for obj in self.current_state['macula_disc_boxes']:
-            x1, y1, x2, y2 = obj["box"]
+            x1, y1, x2, y2 = transform.to_working_box(obj["box"])
             color = (255, 0, 0) if obj["class"] == "macula" else (0, 255, 255)
             thickness_box = max(2, int(min(x2-x1, y2-y1) * 0.015))
             
@@ -358,7 +739,7 @@ class RetinaAnalyzerUI:
         self.buttons['macula'].config(text=text)
         self.update_display()
     
-    def toggle_vessel_overlay(self):
+    def toggle_vessel_mask(self):
         if not self.current_state['show_original_with_vessels'] and not self.current_state['show_vessels_only']:
             self.current_state['show_original_with_vessels'] = True
             self.buttons['vessels'].config(text="Vessels Overlay: ON", bg='#9b59b6')
@@ -374,7 +755,10 @@ class RetinaAnalyzerUI:
         self.update_display()
     
     def show_vessel_settings(self):
-        dialog = VesselSettingsDialog(self.root, self.vessel_processor, self.update_display)
+        dialog = VesselSettingsDialog(self.root, self.vessel_processor, self.request_render,
+                                      resegment_callback=self.request_vessel_proxy,
+                                      apply_callback=self.apply_vessel_settings,
+                                      enhancement_preview=self.enhancement_preview)
         dialog.show()
     
     def show_lesion_gallery(self):
@@ -408,24 +792,11 @@ class RetinaAnalyzerUI:
         )
         
         if self.api_client.is_available():
-            self.chat_display.add_ai_message("Analyzing the scan...")
-            
-            analysis_data = {
-                'severity': self.current_state['current_severity'],
-                'confidence': self.current_state['current_confidence'],
-                'lesion_count': len(self.current_state['current_lesions']),
-                'vessel_density': self.current_state['vessel_density'],
-                'vessel_method': "UNet" if self.vessel_processor.settings['use_unet'] else "Traditional",
-                'optic_disc_diameter': self.current_state['optic_disc_diameter_pixels']
-            }
+            analysis_data = self.scan_context()
             
-            def on_ai_response(error, result):
-                if error:
-                    self.chat_display.add_ai_message(f"Error: {error}")
-                else:
-                    self.chat_display.add_ai_message(f"Clinical Assessment\n\n{result}")
-            
-            self.api_client.process_in_thread("analyze", on_ai_response, analysis_data=analysis_data)
+            self.scan_chat_job = self.stream_ai_response("analyze", "Analyzing the scan...",
+                                                         prefix="Clinical Assessment\n\n",
+                                                         analysis_data=analysis_data)
     
     def send_message(self):
         message = self.chat_input.get().strip()
@@ -440,31 +811,91 @@ class RetinaAnalyzerUI:
         self.chat_display.add_user_message(message)
         self.chat_input.delete(0, tk.END)
         
-        self.chat_display.add_ai_message("Processing your question...")
+        context_data = self.scan_context()
         
+        self.stream_ai_response("question", "Processing your question...",
+                                question=message, context_data=context_data)
+    
+    def scan_context(self):
+        """Summary of the current scan shared by the assessment and chat prompts."""
         lesion_types = {}
         for lesion in self.current_state['current_lesions']:
             lesion_type = lesion['class']
             lesion_types[lesion_type] = lesion_types.get(lesion_type, 0) + 1
         
-        context_data = {
+        return {
             'severity': self.current_state['current_severity'],
             'confidence': self.current_state['current_confidence'],
             'lesion_count': len(self.current_state['current_lesions']),
             'lesion_types': lesion_types,
             'vessel_density': self.current_state['vessel_density'],
             'vessel_method': "UNet" if self.vessel_processor.settings['use_unet'] else "Traditional",
+            'vessel_morphometry': self.current_state['vessel_morphometry'],
             'optic_disc_diameter': self.current_state['optic_disc_diameter_pixels']
         }
-        
-        def on_ai_response(error, result):
-            self.chat_display.config(state=tk.NORMAL)
-            self.chat_display.delete("end-3l", "end-1l")  
-            
+    
+    def stream_ai_response(self, task, placeholder, prefix="", **kwargs):
+        """Stream an API task into the chat; returns (job, stream_id) or None if busy.
+        
+        Fragments are buffered on the worker and flushed once per dispatcher
+        tick, so the chat is updated in coalesced chunks on the Tk thread.
+        """
+        stream_id = self.chat_display.start_ai_stream(placeholder)
+        buffer_lock = threading.Lock()
+        buffered = []
+        state = {'streamed': False, 'job': None}
+        
+        def flush():
+            with buffer_lock:
+                text = "".join(buffered)
+                buffered.clear()
+            job = state['job']
+            if not text or (job is not None and job.is_cancelled()):
+                return
+            if not state['streamed']:
+                text = prefix + text
+                state['streamed'] = True
+            self.chat_display.append_ai_stream(stream_id, text)
+        
+        def on_delta(text):
+            with buffer_lock:
+                buffered.append(text)
+                schedule = len(buffered) == 1
+            if schedule:
+                self.dispatcher.post(flush)
+        
+        def on_done(outcome):
+            error, result = outcome
             if error:
-                self.chat_display.add_ai_message(f"Error: {error}")
+                self.chat_display.finish_ai_stream(stream_id, f"Error: {error}")
+            elif not state['streamed']:
+                self.chat_display.finish_ai_stream(stream_id, f"{prefix}{result}")
             else:
-                self.chat_display.add_ai_message(result)
+                self.chat_display.finish_ai_stream(stream_id)
+        
+        def on_error(e):
+            self.chat_display.finish_ai_stream(stream_id, f"Error: {e}")
+        
+        job = self.dispatcher.submit(
+            self.api_client.run_task, task,
+            on_delta=on_delta,
+            cancelled=lambda: state['job'] is not None and state['job'].is_cancelled(),
+            callback=on_done,
+            errback=on_error,
+            name=task,
+            **kwargs
+        )
+        if job is None:
+            self.chat_display.finish_ai_stream(stream_id, "Too many requests in progress. Please wait and try again.")
+            return None
         
-        self.api_client.process_in_thread("question", on_ai_response, 
-                                         question=message, context_data=context_data)
\ No newline at end of file
+        state['job'] = job
+        return job, stream_id
+    
+    def shutdown(self):
+        self.cancel_prefetch()
+        self.render_scheduler.cancel()
+        self.dispatcher.shutdown()
+        self.analysis_dispatcher.shutdown()
+        if self.results_db is not None:
+            self.results_db.close()
@@ -15,6 +15,9 @@ class ChatDisplay(scrolledtext.ScrolledText):
         }
         defaults.update(kwargs)
         super().__init__(master, **defaults)
+        self.stream_count = 0
+        self.active_streams = set()
+        self.stream_placeholders = set()
         self.configure_tags()
     
     def configure_tags(self):
@@ -50,10 +53,55 @@ class ChatDisplay(scrolledtext.ScrolledText):
         self.config(state=tk.DISABLED)
         self.see(tk.END)
     
+    def start_ai_stream(self, placeholder=""):
+        """Insert an AI message to be filled in by append_ai_stream; returns its stream id."""
+        self.stream_count += 1
+        stream_id = f"stream{self.stream_count}"
+        
+        self.config(state=tk.NORMAL)
+        self.insert(tk.END, f"\nAI: {placeholder}\n\n", "ai_message")
+        self.mark_set(f"{stream_id}_end", "end-3c")
+        self.mark_set(f"{stream_id}_start", f"end-{3 + len(placeholder)}c")
+        self.mark_gravity(f"{stream_id}_start", tk.LEFT)
+        self.config(state=tk.DISABLED)
+        self.see(tk.END)
+        
+        self.active_streams.add(stream_id)
+        if placeholder:
+            self.stream_placeholders.add(stream_id)
+        return stream_id
+    
+    def append_ai_stream(self, stream_id, text):
+        if not text or stream_id not in self.active_streams:
+            return
+        self.config(state=tk.NORMAL)
+        if stream_id in self.stream_placeholders:
+            self.delete(f"{stream_id}_start", f"{stream_id}_end")
+            self.stream_placeholders.discard(stream_id)
+        self.insert(f"{stream_id}_end", text, "ai_message")
+        self.config(state=tk.DISABLED)
+        self.see(tk.END)
+    
+    def finish_ai_stream(self, stream_id, final_text=None):
+        """Close a streamed message, replacing its body when final_text is given."""
+        if stream_id not in self.active_streams:
+            return
+        if final_text is not None:
+            self.config(state=tk.NORMAL)
+            self.delete(f"{stream_id}_start", f"{stream_id}_end")
+            self.insert(f"{stream_id}_end", final_text, "ai_message")
+            self.config(state=tk.DISABLED)
+            self.see(tk.END)
+        self.active_streams.discard(stream_id)
+        self.stream_placeholders.discard(stream_id)
+        self.mark_unset(f"{stream_id}_start", f"{stream_id}_end")
+    
     def clear(self):
         self.config(state=tk.NORMAL)
         self.delete(1.0, tk.END)
         self.config(state=tk.DISABLED)
+        self.active_streams.clear()
+        self.stream_placeholders.clear()
 
 class AnalysisDisplay(scrolledtext.ScrolledText):
     def __init__(self, master=None, **kwargs):
@@ -77,6 +125,62 @@ class AnalysisDisplay(scrolledtext.ScrolledText):
     def clear(self):
         self.set_report("Analysis Report will appear here...\n")
 
+class WorklistPanel(tk.Frame):
+    """List of scans to review, with a status marker per entry."""
+    
+    STATUS_MARKS = {'pending': ' ', 'loading': '~', 'ready': '*', 'failed': '!'}
+    
+    def __init__(self, master, on_select, on_open, on_prev, on_next, **kwargs):
+        defaults = {'bg': UI_COLORS['bg_dark']}
+        defaults.update(kwargs)
+        super().__init__(master, **defaults)
+        self.on_select = on_select
+        self.names = []
+        self.statuses = []
+        
+        header = tk.Frame(self, bg=UI_COLORS['bg_dark'])
+        header.pack(fill='x')
+        tk.Label(header, text="Worklist", bg=UI_COLORS['bg_dark'], fg='white',
+                 font=('Arial', 11, 'bold')).pack(side=tk.LEFT, padx=5)
+        for text, command in (("Next", on_next), ("Prev", on_prev), ("Open Folder", on_open)):
+            ControlButton(header, text=text, command=command, font=('Arial', 9),
+                          padx=6, pady=2).pack(side=tk.RIGHT, padx=2, pady=2)
+        
+        self.listbox = tk.Listbox(self, height=6, bg=UI_COLORS['bg_light'], fg='white',
+                                  selectbackground=UI_COLORS['accent_blue'], font=('Courier', 10),
+                                  activestyle='none', exportselection=False)
+        self.listbox.pack(fill='both', expand=True, padx=5, pady=(0, 5))
+        self.listbox.bind("<<ListboxSelect>>", self.handle_select)
+    
+    def set_items(self, names):
+        self.names = list(names)
+        self.statuses = ['pending'] * len(self.names)
+        self.listbox.delete(0, tk.END)
+        for idx in range(len(self.names)):
+            self.listbox.insert(tk.END, self.format_item(idx))
+    
+    def format_item(self, idx):
+        return f"{self.STATUS_MARKS[self.statuses[idx]]} {self.names[idx]}"
+    
+    def set_status(self, idx, status):
+        if 0 <= idx < len(self.names) and self.statuses[idx] != status:
+            self.statuses[idx] = status
+            selected = self.listbox.curselection()
+            self.listbox.delete(idx)
+            self.listbox.insert(idx, self.format_item(idx))
+            if idx in selected:
+                self.listbox.selection_set(idx)
+    
+    def select(self, idx):
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(idx)
+        self.listbox.see(idx)
+    
+    def handle_select(self, event):
+        selected = self.listbox.curselection()
+        if selected:
+            self.on_select(selected[0])
+
 class ControlButton(tk.Button):
     def __init__(self, master, text, command, color=UI_COLORS['accent_blue'], **kwargs):
         defaults = {
@@ -141,15 +245,25 @@ class SettingsSlider(ttk.Frame):
             troughcolor=UI_COLORS['bg_light']
         )
         self.slider.set(value)
-        if command:
-            self.slider.config(command=command)
+        self.value = self.slider.get()
+        self.command = command
+        self.slider.config(command=self.on_change)
         self.slider.pack(pady=5)
     
+    def on_change(self, value):
+        # Tk also fires the command when the Scale is first drawn and after set(); pass on only real changes.
+        if self.slider.get() == self.value:
+            return
+        self.value = self.slider.get()
+        if self.command:
+            self.command(value)
+    
     def get_value(self):
         return self.slider.get()
     
     def set_value(self, value):
         self.slider.set(value)
+        self.value = self.slider.get()
 
 class ColorPreview(tk.Frame):
     def __init__(self, master, r, g, b, **kwargs):
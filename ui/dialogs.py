@@ -1,11 +1,13 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
 import cv2
+import os
 import numpy as np
 from PIL import Image, ImageTk
 from ui.components import ControlButton, SettingsSlider, ColorPreview
 from utils.constants import UI_COLORS
 from utils.helpers import resize_for_preview
+from processing.vessel_processor import ENHANCEMENT_SETTINGS
 
 class ImageDialog:
     @staticmethod
@@ -16,10 +18,16 @@ class ImageDialog:
         return file_path
 
 class VesselSettingsDialog:
-    def __init__(self, parent, vessel_processor, update_callback):
+    def __init__(self, parent, vessel_processor, update_callback, resegment_callback=None, apply_callback=None,
+                 enhancement_preview=None):
         self.parent = parent
         self.vessel_processor = vessel_processor
         self.update_callback = update_callback
+        self.resegment_callback = resegment_callback
+        self.apply_callback = apply_callback
+        self.enhancement_preview = enhancement_preview
+        self.preview_dialog = None
+        self.mask_changed = False
         self.window = None
         
     def show(self):
@@ -30,9 +38,36 @@ class VesselSettingsDialog:
         
         self.window.transient(self.parent)
         self.window.grab_set()
+        self.window.protocol("WM_DELETE_WINDOW", self.apply_and_close)
         
         self.create_widgets()
         
+    def notify(self, setting=None):
+        """Redraw, and re-segment the preview only when setting changes the active method's mask.
+        
+        None stands for a change to any setting, as after a reset.
+        """
+        if self.vessel_processor.affects_mask(setting):
+            self.mask_changed = True
+            if self.resegment_callback:
+                self.resegment_callback()
+        if setting is None or setting in ENHANCEMENT_SETTINGS:
+            self.refresh_enhanced_preview()
+        if self.update_callback:
+            self.update_callback()
+    
+    def change_setting(self, setting, value):
+        self.vessel_processor.update_setting(setting, value)
+        self.notify(setting)
+    
+    def apply_and_close(self):
+        """Close the dialog and run the full-resolution segmentation with the final settings."""
+        if self.enhancement_preview is not None:
+            self.enhancement_preview.cancel()
+        self.window.destroy()
+        if self.mask_changed and self.apply_callback:
+            self.apply_callback()
+        
     def create_widgets(self):
         main_frame = tk.Frame(self.window, bg=UI_COLORS['bg_medium'])
         main_frame.pack(fill='both', expand=True, padx=10, pady=10)
@@ -88,14 +123,45 @@ class VesselSettingsDialog:
                            fg='#2ecc71' if settings['use_unet'] else '#f39c12')
             self.method_btn.config(text=f"Switch to {'Traditional' if settings['use_unet'] else 'UNet'}")
             
-            if self.update_callback:
-                self.update_callback()
+            self.notify('use_unet')
         
         self.method_btn = ControlButton(section, 
                           text=f"Switch to {'Traditional' if settings['use_unet'] else 'UNet'}",
                           command=toggle_method,
                           color='#3498db')
         self.method_btn.pack(pady=10)
+        
+        toggle_frame = tk.Frame(section, bg='#34495e')
+        toggle_frame.pack(pady=5)
+        
+        def toggle_engine():
+            settings = self.vessel_processor.get_settings()
+            new_value = 'classic' if settings['traditional_engine'] == 'hessian' else 'hessian'
+            self.vessel_processor.update_setting('traditional_engine', new_value)
+            self.engine_btn.config(text=f"Traditional engine: {'Hessian' if new_value == 'hessian' else 'Classic'}")
+            self.notify('traditional_engine')
+        
+        self.engine_btn = ControlButton(toggle_frame, 
+                          text=f"Traditional engine: {'Hessian' if settings['traditional_engine'] == 'hessian' else 'Classic'}",
+                          command=toggle_engine,
+                          color='#8e44ad',
+                          font=('Arial', 10))
+        self.engine_btn.pack(side=tk.LEFT, padx=5)
+        
+        def toggle_fast_mode():
+            settings = self.vessel_processor.get_settings()
+            new_value = not settings['fast_mode']
+            self.vessel_processor.update_setting('fast_mode', new_value)
+            self.fast_btn.config(text=f"Fast mode: {'ON' if new_value else 'OFF'}",
+                               bg='#27ae60' if new_value else '#95a5a6')
+            self.notify('fast_mode')
+        
+        self.fast_btn = ControlButton(toggle_frame, 
+                        text=f"Fast mode: {'ON' if settings['fast_mode'] else 'OFF'}",
+                        command=toggle_fast_mode,
+                        color='#27ae60' if settings['fast_mode'] else '#95a5a6',
+                        font=('Arial', 10))
+        self.fast_btn.pack(side=tk.LEFT, padx=5)
     
     def create_enhancement_section(self, parent):
         section = tk.LabelFrame(parent, text="Image Enhancement for UNet", 
@@ -107,38 +173,32 @@ class VesselSettingsDialog:
         
         self.brightness_slider = SettingsSlider(
             section, "Brightness (0.5 - 3.0):", 0.5, 3.0, settings['enhance_brightness'], 0.1,
-            lambda v: [self.vessel_processor.update_setting('enhance_brightness', float(v)), 
-                      self.update_callback() if self.update_callback else None]
+            lambda v: self.change_setting('enhance_brightness', float(v))
         )
         
         self.contrast_slider = SettingsSlider(
             section, "Contrast (0.5 - 3.0):", 0.5, 3.0, settings['enhance_contrast'], 0.1,
-            lambda v: [self.vessel_processor.update_setting('enhance_contrast', float(v)), 
-                      self.update_callback() if self.update_callback else None]
+            lambda v: self.change_setting('enhance_contrast', float(v))
         )
         
         self.gamma_slider = SettingsSlider(
             section, "Gamma Correction (0.5 - 2.0):", 0.5, 2.0, settings['enhance_gamma'], 0.1,
-            lambda v: [self.vessel_processor.update_setting('enhance_gamma', float(v)), 
-                      self.update_callback() if self.update_callback else None]
+            lambda v: self.change_setting('enhance_gamma', float(v))
         )
         
         self.clahe_slider = SettingsSlider(
             section, "CLAHE Clip Limit (1.0 - 5.0):", 1.0, 5.0, settings['clahe_clip'], 0.5,
-            lambda v: [self.vessel_processor.update_setting('clahe_clip', float(v)), 
-                      self.update_callback() if self.update_callback else None]
+            lambda v: self.change_setting('clahe_clip', float(v))
         )
         
         self.green_slider = SettingsSlider(
             section, "Green Channel Boost (0.5 - 3.0):", 0.5, 3.0, settings['green_boost'], 0.1,
-            lambda v: [self.vessel_processor.update_setting('green_boost', float(v)), 
-                      self.update_callback() if self.update_callback else None]
+            lambda v: self.change_setting('green_boost', float(v))
         )
         
         self.denoise_slider = SettingsSlider(
             section, "Denoise Strength (0-20):", 0, 20, settings['denoise_strength'], 1,
-            lambda v: [self.vessel_processor.update_setting('denoise_strength', float(v)), 
-                      self.update_callback() if self.update_callback else None]
+            lambda v: self.change_setting('denoise_strength', float(v))
         )
         
         toggle_frame = tk.Frame(section, bg='#34495e')
@@ -150,8 +210,7 @@ class VesselSettingsDialog:
             self.vessel_processor.update_setting('invert_image', new_value)
             self.invert_btn.config(text=f"Invert: {'ON' if new_value else 'OFF'}",
                                  bg='#e74c3c' if new_value else '#95a5a6')
-            if self.update_callback:
-                self.update_callback()
+            self.notify('invert_image')
         
         self.invert_btn = ControlButton(toggle_frame, 
                           text=f"Invert: {'ON' if settings['invert_image'] else 'OFF'}",
@@ -166,8 +225,7 @@ class VesselSettingsDialog:
             self.vessel_processor.update_setting('equalize_hist', new_value)
             self.equalize_btn.config(text=f"Hist Eq: {'ON' if new_value else 'OFF'}",
                                    bg='#27ae60' if new_value else '#95a5a6')
-            if self.update_callback:
-                self.update_callback()
+            self.notify('equalize_hist')
         
         self.equalize_btn = ControlButton(section, 
                             text=f"Histogram Equalization: {'ON' if settings['equalize_hist'] else 'OFF'}",
@@ -186,14 +244,12 @@ class VesselSettingsDialog:
         
         self.threshold_slider = SettingsSlider(
             section, "Detection Threshold (0.1 - 0.9):", 0.1, 0.9, settings['threshold'], 0.05,
-            lambda v: [self.vessel_processor.update_setting('threshold', float(v)), 
-                      self.update_callback() if self.update_callback else None]
+            lambda v: self.change_setting('threshold', float(v))
         )
         
         self.opacity_slider = SettingsSlider(
             section, "Overlay Opacity (0.1 - 0.9):", 0.1, 0.9, settings['overlay_opacity'], 0.05,
-            lambda v: [self.vessel_processor.update_setting('overlay_opacity', float(v)), 
-                      self.update_callback() if self.update_callback else None]
+            lambda v: self.change_setting('overlay_opacity', float(v))
         )
         
         tk.Label(section, text="Vessel Color:", 
@@ -256,8 +312,7 @@ class VesselSettingsDialog:
             self.vessel_processor.update_setting('post_process', new_value)
             self.post_btn.config(text=f"Post-processing: {'ON' if new_value else 'OFF'}",
                                bg='#e74c3c' if new_value else '#95a5a6')
-            if self.update_callback:
-                self.update_callback()
+            self.notify('post_process')
         
         self.post_btn = ControlButton(section, 
                         text=f"Post-processing: {'ON' if settings['post_process'] else 'OFF'}",
@@ -284,15 +339,37 @@ class VesselSettingsDialog:
         reset_btn.pack(side=tk.LEFT, padx=5)
         
         apply_btn = ControlButton(btn_frame, text="Apply & Close", 
-                                 command=self.window.destroy,
+                                 command=self.apply_and_close,
                                  color=UI_COLORS['accent_green'])
         apply_btn.pack(side=tk.LEFT, padx=5)
     
     def show_enhanced_preview(self):
         """Show enhancement preview dialog."""
-        from processing.image_processor import ImageProcessor  
+        if self.enhancement_preview is None or not self.enhancement_preview.is_available():
+            messagebox.showinfo("Preview", "Enhancement preview requires an uploaded image.")
+            return
+        
+        if self.preview_dialog is None or not self.preview_dialog.is_open():
+            self.preview_dialog = EnhancedPreviewDialog(self.window, None, None, "Enhancing...")
+        self.refresh_enhanced_preview()
+    
+    def refresh_enhanced_preview(self):
+        if self.preview_dialog is None or not self.preview_dialog.is_open():
+            return
         
-        messagebox.showinfo("Preview", "Enhancement preview requires an uploaded image.")
+        def on_ready(original, enhanced):
+            if self.preview_dialog is not None and self.preview_dialog.is_open():
+                self.preview_dialog.update_images(original, enhanced, self.enhancement_summary())
+        
+        self.enhancement_preview.request(on_ready)
+    
+    def enhancement_summary(self):
+        settings = self.vessel_processor.get_settings()
+        return (f"Brightness: {settings['enhance_brightness']:.1f}   Contrast: {settings['enhance_contrast']:.1f}   "
+                f"Gamma: {settings['enhance_gamma']:.1f}   CLAHE: {settings['clahe_clip']:.1f}\n"
+                f"Green boost: {settings['green_boost']:.1f}   Denoise: {settings['denoise_strength']:.0f}   "
+                f"Invert: {'ON' if settings['invert_image'] else 'OFF'}   "
+                f"Hist Eq: {'ON' if settings['equalize_hist'] else 'OFF'}")
     
     def reset_settings(self):
         vessel_available = self.vessel_processor.vessel_model is not None
@@ -321,13 +398,15 @@ class VesselSettingsDialog:
         method_text = "UNet (Trained Model)" if settings['use_unet'] else "Traditional"
         self.method_label.config(text=f"Current: {method_text}", fg=method_color)
         self.method_btn.config(text=f"Switch to {'Traditional' if settings['use_unet'] else 'UNet'}")
+        self.engine_btn.config(text=f"Traditional engine: {'Hessian' if settings['traditional_engine'] == 'hessian' else 'Classic'}")
+        self.fast_btn.config(text=f"Fast mode: {'ON' if settings['fast_mode'] else 'OFF'}",
+                           bg='#27ae60' if settings['fast_mode'] else '#95a5a6')
         
         self.color_preview.set_color(settings['color_r'], 
                                     settings['color_g'], 
                                     settings['color_b'])
         
-        if self.update_callback:
-            self.update_callback()
+        self.notify()
 
 class EnhancedPreviewDialog:
     def __init__(self, parent, original_img, enhanced_img, enhancement_summary):
@@ -354,35 +433,82 @@ class EnhancedPreviewDialog:
         
         tk.Label(orig_frame, text="ORIGINAL", font=('Arial', 12, 'bold')).pack(pady=5)
         
-        if self.original_img is not None:
-            orig_resized = resize_for_preview(self.original_img, 400)
-            orig_rgb = cv2.cvtColor(orig_resized, cv2.COLOR_BGR2RGB)
-            orig_pil = Image.fromarray(orig_rgb)
-            self.orig_photo = ImageTk.PhotoImage(orig_pil)
-            
-            orig_label = tk.Label(orig_frame, image=self.orig_photo)
-            orig_label.image = self.orig_photo
-            orig_label.pack(padx=10, pady=10)
+        self.orig_label = tk.Label(orig_frame)
+        self.orig_label.pack(padx=10, pady=10)
         
         enh_frame = tk.Frame(comparison_frame, relief=tk.RAISED, bd=2)
         enh_frame.pack(side=tk.RIGHT, fill='both', expand=True, padx=5)
         
         tk.Label(enh_frame, text="ENHANCED (for UNet)", font=('Arial', 12, 'bold')).pack(pady=5)
         
-        if self.enhanced_img is not None:
-            enh_resized = resize_for_preview(self.enhanced_img, 400)
-            enh_rgb = cv2.cvtColor(enh_resized, cv2.COLOR_BGR2RGB)
-            enh_pil = Image.fromarray(enh_rgb)
-            self.enh_photo = ImageTk.PhotoImage(enh_pil)
-            
-            enh_label = tk.Label(enh_frame, image=self.enh_photo)
-            enh_label.image = self.enh_photo
-            enh_label.pack(padx=10, pady=10)
+        self.enh_label = tk.Label(enh_frame)
+        self.enh_label.pack(padx=10, pady=10)
         
-        tk.Label(self.window, text=self.enhancement_summary, font=('Courier', 9), 
-                justify=tk.LEFT).pack(pady=10, padx=20)
+        self.summary_label = tk.Label(self.window, text=self.enhancement_summary, font=('Courier', 9), 
+                justify=tk.LEFT)
+        self.summary_label.pack(pady=10, padx=20)
+        
+        self.orig_photo = None
+        self.enh_photo = None
+        self.update_images(self.original_img, self.enhanced_img, self.enhancement_summary)
         
         close_btn = ControlButton(self.window, text="Close", 
                                 command=self.window.destroy,
                                 color=UI_COLORS['accent_green'])
-        close_btn.pack(pady=10)
\ No newline at end of file
+        close_btn.pack(pady=10)
+    
+    def is_open(self):
+        return bool(self.window.winfo_exists())
+    
+    def update_images(self, original_img, enhanced_img, enhancement_summary):
+        if original_img is not None and (self.orig_photo is None or original_img is not self.original_img):
+            self.orig_photo = self.to_photo(original_img)
+            self.orig_label.config(image=self.orig_photo)
+        if enhanced_img is not None:
+            self.enh_photo = self.to_photo(enhanced_img)
+            self.enh_label.config(image=self.enh_photo)
+        
+        self.original_img = original_img
+        self.enhanced_img = enhanced_img
+        self.enhancement_summary = enhancement_summary
+        self.summary_label.config(text=enhancement_summary)
+    
+    def to_photo(self, img):
+        resized = resize_for_preview(img, 400)
+        return ImageTk.PhotoImage(Image.fromarray(cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)))
+
+class VisitComparisonDialog:
+    def __init__(self, parent, comparison, current_path):
+        self.parent = parent
+        self.comparison = comparison
+        self.current_path = current_path
+        
+        self.create_window()
+    
+    def create_window(self):
+        self.window = tk.Toplevel(self.parent)
+        self.window.title("Visit Comparison")
+        self.window.geometry("900x850")
+        
+        previous_name = os.path.basename(self.comparison.previous_path)
+        current_name = os.path.basename(self.current_path) if self.current_path else "current scan"
+        tk.Label(self.window, text=f"{previous_name}  ->  {current_name}",
+                font=('Arial', 14, 'bold')).pack(pady=10)
+        
+        self.photo = self.to_photo(self.comparison.overlay)
+        tk.Label(self.window, image=self.photo).pack(padx=10, pady=5)
+        
+        tk.Label(self.window, text="Red: new    Green: resolved    Yellow: persistent",
+                font=('Arial', 10)).pack(pady=5)
+        
+        tk.Label(self.window, text=self.comparison.summary, font=('Courier', 9),
+                justify=tk.LEFT).pack(pady=10, padx=20)
+        
+        close_btn = ControlButton(self.window, text="Close",
+                                command=self.window.destroy,
+                                color=UI_COLORS['accent_green'])
+        close_btn.pack(pady=10)
+    
+    def to_photo(self, img):
+        resized = resize_for_preview(img, 640)
+        return ImageTk.PhotoImage(Image.fromarray(cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)))
@@ -0,0 +1,118 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.constants import DISPATCH_MAX_WORKERS, DISPATCH_MAX_IN_FLIGHT, DISPATCH_POLL_MS
+
+class DispatchJob:
+    def __init__(self, name=None):
+        self.name = name
+        self.future = None
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        """Drop the job's result; the job is not started if it is still queued."""
+        self.cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def cancel_if_pending(self):
+        """Cancel the job only if it has not started; returns whether it was cancelled."""
+        if self.future is not None and self.future.cancel():
+            self.cancelled.set()
+            return True
+        return False
+
+    def is_cancelled(self):
+        return self.cancelled.is_set()
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+class UIDispatcher:
+    """Bounded worker pool whose results are delivered on the Tk main loop.
+
+    Workers never touch widgets: results and posted calls go through a queue
+    that is drained by root.after every poll_ms.
+    """
+
+    def __init__(self, root, max_workers=DISPATCH_MAX_WORKERS,
+                 max_in_flight=DISPATCH_MAX_IN_FLIGHT, poll_ms=DISPATCH_POLL_MS):
+        self.root = root
+        self.max_in_flight = max_in_flight
+        self.poll_ms = poll_ms
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="retina-worker")
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.closed = False
+
+        self.root.after(self.poll_ms, self._drain)
+
+    def submit(self, fn, *args, callback=None, errback=None, name=None, **kwargs):
+        """Run fn(*args, **kwargs) on the pool.
+
+        callback(result) or errback(exception) is invoked on the Tk thread.
+        Returns the DispatchJob, or None if the in-flight limit is reached.
+        """
+        with self.lock:
+            if self.closed or self.in_flight >= self.max_in_flight:
+                return None
+            self.in_flight += 1
+
+        job = DispatchJob(name)
+
+        def run():
+            if job.is_cancelled():
+                return
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                print(f"Background job {name or fn.__name__} failed: {e}")
+                if errback:
+                    self.pending.put((job, errback, (e,)))
+                return
+            if callback:
+                self.pending.put((job, callback, (result,)))
+
+        try:
+            job.future = self.executor.submit(run)
+        except RuntimeError:
+            self._release()
+            return None
+        job.future.add_done_callback(lambda _: self._release())
+        return job
+
+    def post(self, fn, *args):
+        """Schedule fn(*args) on the Tk thread; safe to call from any thread."""
+        self.pending.put((None, fn, args))
+
+    def in_flight_count(self):
+        with self.lock:
+            return self.in_flight
+
+    def _release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def _drain(self):
+        if self.closed:
+            return
+
+        for _ in range(self.pending.qsize()):
+            try:
+                job, fn, args = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None and job.is_cancelled():
+                continue
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"UI callback failed: {e}")
+
+        self.root.after(self.poll_ms, self._drain)
+
+    def shutdown(self):
+        with self.lock:
+            self.closed = True
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from utils.constants import ENHANCEMENT_PREVIEW_SIZE, ENHANCEMENT_PREVIEW_CACHE_SIZE
+
+class EnhancementPreviewer:
+    """Runs enhance_for_unet on a preview-sized copy of the scan, off the Tk thread.
+
+    Results are kept per scan in an LRU keyed by the enhancement settings, so
+    returning to a previous combination is served without recomputing. Only
+    one job runs at a time; requests made meanwhile are folded into one
+    follow-up for the most recent settings.
+    """
+
+    def __init__(self, dispatcher, vessel_processor, get_working_images,
+                 max_side=ENHANCEMENT_PREVIEW_SIZE, max_entries=ENHANCEMENT_PREVIEW_CACHE_SIZE):
+        self.dispatcher = dispatcher
+        self.vessel_processor = vessel_processor
+        self.get_working_images = get_working_images
+        self.max_side = max_side
+        self.max_entries = max_entries
+        self.cache = OrderedDict()
+        self.working = None
+        self.job = None
+        self.wanted = None
+        self.on_ready = None
+
+    def is_available(self):
+        return self.get_working_images() is not None
+
+    def request(self, on_ready):
+        """Call on_ready(original, enhanced) on the Tk thread for the current settings."""
+        working = self.get_working_images()
+        if working is None:
+            return
+        if working is not self.working:
+            self.working = working
+            self.cache.clear()
+
+        key = self.vessel_processor.enhancement_key()
+        self.wanted = key
+        self.on_ready = on_ready
+
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            on_ready(*self.cache[key])
+        elif self.job is None:
+            self._start(key)
+
+    def cancel(self):
+        if self.job is not None:
+            self.job.cancel()
+        self.job = None
+        self.on_ready = None
+
+    def _start(self, key):
+        processor = self.vessel_processor.with_settings(self.vessel_processor.settings)
+        working = self.working
+        self.job = self.dispatcher.submit(
+            self._enhance, processor, working,
+            callback=lambda result: self._done(key, working, result),
+            errback=lambda e: self._done(key, working, None),
+            name="enhancement-preview"
+        )
+
+    def _enhance(self, processor, working):
+        original, _ = working.get(self.max_side, use_roi=False)
+        return original, processor.enhance_for_unet(original)
+
+    def _done(self, key, working, result):
+        self.job = None
+        if working is not self.working:
+            # The scan changed while this job ran; its result belongs to the old scan.
+            if self.on_ready is not None:
+                self._start(self.wanted)
+            return
+        if result is None:
+            return
+
+        self.cache[key] = result
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+
+        if key == self.wanted:
+            if self.on_ready is not None:
+                self.on_ready(*result)
+        elif self.wanted not in self.cache:
+            self._start(self.wanted)
+        elif self.on_ready is not None:
+            self.on_ready(*self.cache[self.wanted])
@@ -0,0 +1,46 @@
+from utils.constants import RENDER_SETTLE_MS
+
+class RenderScheduler:
+    """Coalesces redraw requests into at most one render per idle cycle.
+
+    request(fast=True) is meant for continuous input such as a dragged slider:
+    it renders a cheap approximate frame when Tk is next idle, and a
+    full-quality frame once no request has arrived for settle_ms. Requests
+    that arrive before the pending frame is drawn are merged into it, so
+    stale intermediate frames are never rendered.
+    """
+
+    def __init__(self, root, render, settle_ms=RENDER_SETTLE_MS):
+        self.root = root
+        self.render = render
+        self.settle_ms = settle_ms
+        self.idle_id = None
+        self.settle_id = None
+        self.pending_fast = True
+
+    def request(self, fast=True):
+        # A full-quality request wins over a fast one queued for the same frame.
+        self.pending_fast = fast if self.idle_id is None else (self.pending_fast and fast)
+        if self.idle_id is None:
+            self.idle_id = self.root.after_idle(self._run)
+
+        if self.settle_id is not None:
+            self.root.after_cancel(self.settle_id)
+            self.settle_id = None
+        if fast:
+            self.settle_id = self.root.after(self.settle_ms, self._settle)
+
+    def cancel(self):
+        for after_id in (self.idle_id, self.settle_id):
+            if after_id is not None:
+                self.root.after_cancel(after_id)
+        self.idle_id = None
+        self.settle_id = None
+
+    def _run(self):
+        self.idle_id = None
+        self.render(fast=self.pending_fast)
+
+    def _settle(self):
+        self.settle_id = None
+        self.request(fast=False)
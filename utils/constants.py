@@ -18,6 +18,17 @@ UI_COLORS = {
     'chat_ai_bg': '#dfe6e9'
 }
 
+DISPATCH_MAX_WORKERS = 4
+DISPATCH_MAX_IN_FLIGHT = 8
+DISPATCH_POLL_MS = 50
+# Scan analyses (and visit comparisons) share the models, so they get their own single worker.
+ANALYSIS_MAX_WORKERS = 1
+
+RENDER_SETTLE_MS = 150
+
+ENHANCEMENT_PREVIEW_SIZE = 800
+ENHANCEMENT_PREVIEW_CACHE_SIZE = 16
+
 DEFAULT_CANVAS_SIZE = (800, 600)
 MAX_ZOOM_SCALE = 5.0
 MIN_ZOOM_SCALE = 0.1
@@ -26,6 +37,8 @@ ZOOM_STEP = 1.2
 DD_TO_MICROMETERS = 1500.0 
 DEFAULT_PIXELS_PER_MICROMETER = 0.1
 
+WORKLIST_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp')
+
 GALLERY_COLS = 4
 MAX_GALLERY_IMAGE_SIZE = 250
 
@@ -5,17 +5,20 @@ from PIL import Image, ImageTk
 import tkinter as tk
 from config import SEVERITY_COLORS
 
-def resize_for_display(img, canvas_width, canvas_height, zoom_scale=1.0):
+def display_size(shape, canvas_width, canvas_height, zoom_scale=1.0):
     if canvas_width <= 1 or canvas_height <= 1:
         canvas_width, canvas_height = 800, 600
     
-    h, w = img.shape[:2]
+    h, w = shape[:2]
     base_scale = min(canvas_width / w, canvas_height / h) * 0.95
     final_scale = base_scale * zoom_scale
-    new_w, new_h = int(w * final_scale), int(h * final_scale)
+    return int(w * final_scale), int(h * final_scale)
+
+def resize_for_display(img, canvas_width, canvas_height, zoom_scale=1.0, interpolation=cv2.INTER_AREA):
+    new_w, new_h = display_size(img.shape, canvas_width, canvas_height, zoom_scale)
     
     if new_w > 0 and new_h > 0:
-        return cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
+        return cv2.resize(img, (new_w, new_h), interpolation=interpolation)
     return img
 
 def resize_for_preview(img, max_size):
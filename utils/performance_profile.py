@@ -0,0 +1,94 @@
+import os
+import json
+from contextlib import contextmanager
+from config import PERFORMANCE_PROFILE_PATH
+
+# Used when no profile has been written by `python -m dataset.autotune`; None keeps the library default.
+# stage_threads overrides torch_threads for one model stage's forward passes.
+DEFAULT_PROFILE = {
+    'torch_threads': None,
+    'torch_interop_threads': None,
+    'opencv_threads': None,
+    'decode_workers': 2,
+    'batch_sizes': {},
+    'stage_threads': {},
+}
+PER_STAGE_KEYS = ('batch_sizes', 'stage_threads')
+
+_profiles = {}
+_applied = False
+
+def load_profile(path=PERFORMANCE_PROFILE_PATH):
+    """Tuned settings for this machine merged over DEFAULT_PROFILE; read once per path."""
+    if path not in _profiles:
+        profile = dict(DEFAULT_PROFILE, **{key: {} for key in PER_STAGE_KEYS})
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    stored = json.load(f)
+                profile.update({k: v for k, v in stored.items() if k not in PER_STAGE_KEYS})
+                for key in PER_STAGE_KEYS:
+                    profile[key].update(stored.get(key, {}))
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable performance profile {path}: {e}")
+        _profiles[path] = profile
+    return _profiles[path]
+
+def save_profile(profile, path=PERFORMANCE_PROFILE_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(profile, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+    _profiles.pop(path, None)
+
+def batch_size(stage, default=1, profile=None):
+    profile = profile if profile is not None else load_profile()
+    return max(1, int(profile['batch_sizes'].get(stage, default)))
+
+@contextmanager
+def stage_threads(stage, profile=None):
+    """Run the enclosed forward pass with the torch thread count tuned for stage.
+
+    The intra-op pool is process-wide, so the previous count is restored
+    afterwards; stages without a tuned count leave it alone.
+    """
+    profile = profile if profile is not None else load_profile()
+    threads = profile['stage_threads'].get(stage)
+    if not threads:
+        yield
+        return
+
+    import torch
+    previous = torch.get_num_threads()
+    if previous == int(threads):
+        yield
+        return
+    torch.set_num_threads(int(threads))
+    try:
+        yield
+    finally:
+        torch.set_num_threads(previous)
+
+def apply_thread_settings(profile=None):
+    """Set torch and OpenCV thread pools from the profile; only the first call has any effect.
+
+    torch only accepts an inter-op thread count before its first parallel
+    region, so this runs before any model is loaded.
+    """
+    global _applied
+    if _applied:
+        return
+    _applied = True
+    profile = profile if profile is not None else load_profile()
+
+    import cv2
+    import torch
+    if profile['torch_threads']:
+        torch.set_num_threads(int(profile['torch_threads']))
+    if profile['torch_interop_threads']:
+        try:
+            torch.set_num_interop_threads(int(profile['torch_interop_threads']))
+        except RuntimeError as e:
+            print(f"Inter-op threads left at {torch.get_num_interop_threads()}: {e}")
+    if profile['opencv_threads']:
+        cv2.setNumThreads(int(profile['opencv_threads']))